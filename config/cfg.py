@@ -6,6 +6,10 @@ import os
 
 # 停车费率（每小时）
 PARKING_RATE_PER_HOUR = 5.0
+# 费用报价缓存最多保留的在场记录数
+FEE_QUOTE_CACHE_SIZE = 10000
+# 在场车辆表格与数据库同步进出场的间隔（秒），时长和费用按各自的边界单独刷新
+LIVE_TABLE_SYNC_INTERVAL = 10
 
 # 时间格式
 TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
@@ -16,4 +20,98 @@ DB_PATH = os.path.join(BASE_DIR, "src", "database", "parking.db")
 
 # 默认管理员账号
 DEFAULT_ADMIN_USERNAME = "admin"
-DEFAULT_ADMIN_PASSWORD = "admin123"
\ No newline at end of file
+DEFAULT_ADMIN_PASSWORD = "admin123"
+
+# 居民车牌布隆过滤器参数（预计容量、误判率）
+RESIDENT_PLATE_FILTER_CAPACITY = 500000
+RESIDENT_PLATE_FILTER_ERROR_RATE = 0.01
+
+# 性能统计：设置环境变量 PARKING_METRICS=1 启用，退出时输出统计报表
+METRICS_ENABLED = os.environ.get("PARKING_METRICS") == "1"
+# 每个函数保留用于计算分位数的最近耗时样本数
+METRICS_SAMPLE_SIZE = 1024
+
+# SQL分析器：设置环境变量 PARKING_SQL_PROFILE=1 启用
+SQL_PROFILER_ENABLED = os.environ.get("PARKING_SQL_PROFILE") == "1"
+# 慢查询阈值（毫秒）
+SLOW_QUERY_THRESHOLD_MS = 50.0
+# 慢查询日志文件及滚动策略
+SLOW_QUERY_LOG_PATH = os.path.join(BASE_DIR, "logs", "slow_query.log")
+SLOW_QUERY_LOG_MAX_BYTES = 5 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUP_COUNT = 3
+
+# 历史费用核对任务：每批记录数
+RECONCILE_CHUNK_SIZE = 5000
+
+# 车位容量：总车位数，以及按车辆类型单独限制的车位数（未列出的类型只受总数限制）
+# 默认不限制，需要按车位数控制入场时再配置，例如 LOT_CAPACITY = 200、
+# LOT_CAPACITY_BY_TYPE = {"resident": 150, "visitor": 50}
+LOT_CAPACITY = None
+LOT_CAPACITY_BY_TYPE = {}
+# 剩余车位不多于该值时提醒居民
+LOW_SPACE_THRESHOLD = 3
+
+# 短信通知：发送方式 'file'（写入本地发件箱文件）或 'socket'（发送到本地短信网关桩）
+SMS_TRANSPORT = "file"
+SMS_OUTBOX_PATH = os.path.join(BASE_DIR, "logs", "sms_outbox.log")
+SMS_GATEWAY_HOST = "127.0.0.1"
+SMS_GATEWAY_PORT = 9025
+# 群发参数：并发数、每秒发送上限、读取手机号的批大小、同类通知的最短间隔（秒）
+NOTIFY_CONCURRENCY = 100
+NOTIFY_RATE_PER_SECOND = 5000
+NOTIFY_CHUNK_SIZE = 2000
+NOTIFY_COOLDOWN_SECONDS = 1800
+
+# 多小区部署：每个站点（小区）使用 SITE_DB_DIR 下独立的数据库文件 <站点ID>.db
+# 环境变量 PARKING_SITES 为全部站点ID（逗号分隔，用于跨站点汇总），PARKING_SITE 为本实例所属站点
+SITE_IDS = [site.strip() for site in os.environ.get("PARKING_SITES", "").split(",") if site.strip()]
+DEFAULT_SITE = os.environ.get("PARKING_SITE") or None
+SITE_DB_DIR = os.path.join(BASE_DIR, "data", "sites")
+# 跨站点汇总查询的最大并行数
+SITE_FANOUT_WORKERS = 8
+
+# 变更数据捕获（CDC）：每次最多返回的变更条数、长轮询的检查间隔（秒）
+CDC_BATCH_SIZE = 500
+CDC_POLL_INTERVAL = 0.1
+
+# 常驻查询连接的语句缓存大小（sqlite3 的 cached_statements）
+STATEMENT_CACHE_SIZE = 64
+
+# HTTP/JSON 接口服务：监听地址、端口、长连接空闲超时（秒）、
+# 请求体大小上限（字节）、批量请求的最大子请求数
+API_HOST = "127.0.0.1"
+API_PORT = 8080
+API_KEEPALIVE_TIMEOUT = 15.0
+API_MAX_BODY = 1024 * 1024
+API_MAX_BATCH = 100
+
+# 异步数据库模块（adb）：读线程数，读/写通道同时排队的调用数上限（超过时调用方等待）
+ADB_READER_THREADS = 8
+ADB_MAX_PENDING_READS = 1000
+ADB_MAX_PENDING_WRITES = 1000
+
+# 单写进程：环境变量 PARKING_WRITER_SOCKET 为其Unix套接字路径，设置后本进程的写操作交给它串行执行；
+# 等待写操作响应的超时时间（秒）
+WRITER_SOCKET_PATH = os.environ.get("PARKING_WRITER_SOCKET") or None
+WRITER_TIMEOUT = 30.0
+
+# 停车记录列式快照：加载时每批读取的记录数
+SNAPSHOT_CHUNK_SIZE = 5000
+# 占用分析：停车时长分布的分段上界（分钟）
+ANALYTICS_DWELL_BINS = (15, 30, 60, 120, 240, 480, 1440)
+
+# 数据导出：每批读取和写出的记录数
+EXPORT_CHUNK_SIZE = 5000
+
+# 在线备份：快照目录、每步复制的页数、每步之后的休眠时间（秒）、保留的快照个数、
+# 源库被修改导致重新开始的次数上限（超过后一步复制全部页）
+# 环境变量 PARKING_BACKUP_INTERVAL 为定时备份间隔（秒），设置后主程序运行期间定时备份
+BACKUP_DIR = os.path.join(BASE_DIR, "data", "backups")
+BACKUP_PAGES = 64
+BACKUP_SLEEP = 0.005
+BACKUP_KEEP = 7
+BACKUP_MAX_RESTARTS = 5
+BACKUP_INTERVAL = float(os.environ.get("PARKING_BACKUP_INTERVAL") or 0)
+
+# 结构版本迁移：数据回填每批的行数（每批一个短写事务）
+MIGRATION_BATCH_SIZE = 1000
@@ -1,9 +1,12 @@
 """
 智慧停车场管理系统主入口文件
 """
+import atexit
 import os
 import tkinter as tk
-from src.database import db
+from config import cfg
+from src.database import backup, db, profiler
+from src.tool import metrics
 from src.ui.ui_login import LoginWindow
 
 
@@ -12,8 +15,28 @@ def main():
     主函数
     初始化数据库并启动应用程序
     """
-    # 初始化数据库
-    db.init_db()
+    # 启用性能统计时，退出前输出统计报表
+    if metrics.is_enabled():
+        atexit.register(lambda: print(metrics.format_report()))
+    
+    # 启用SQL分析器时，慢查询写入日志，退出前输出按语句汇总的报表
+    if cfg.SQL_PROFILER_ENABLED:
+        profiler.enable()
+        atexit.register(lambda: print(profiler.format_report()))
+    
+    # 初始化数据库（配置了站点时初始化本站点的数据库）
+    if cfg.DEFAULT_SITE:
+        db.init_sites([cfg.DEFAULT_SITE])
+    else:
+        db.init_db()
+    
+    # 配置了定时备份时，在后台按间隔做在线备份
+    if cfg.BACKUP_INTERVAL:
+        backup.start_backup_scheduler(cfg.BACKUP_INTERVAL)
+    
+    # 配置了单写进程时，写操作交给它执行
+    if cfg.WRITER_SOCKET_PATH:
+        db.use_writer(cfg.WRITER_SOCKET_PATH)
     
     # 创建主窗口
     root = tk.Tk()
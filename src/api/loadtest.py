@@ -0,0 +1,117 @@
+"""
+接口服务压测工具
+多个长连接并发发送请求，统计吞吐量和延迟分位数
+
+用法：
+    python -m src.api.loadtest --path /api/occupancy --concurrency 50 --requests 20000
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, List, Optional
+
+
+async def _client(host: str, port: int, request: bytes, count: int, latencies: List[float], errors: List[int]) -> None:
+    """
+    单个长连接客户端：串行发送 count 个请求
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(count):
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status_line = await reader.readline()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                if name.strip().lower() == "content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            if not status_line.split()[1].startswith(b"2"):
+                errors.append(1)
+    finally:
+        writer.close()
+
+
+async def run_load(host: str,
+                   port: int,
+                   path: str,
+                   method: str = "GET",
+                   body: Optional[Dict] = None,
+                   concurrency: int = 50,
+                   requests: int = 10000) -> Dict:
+    """
+    执行压测
+
+    Args:
+        host: 服务地址
+        port: 服务端口
+        path: 请求路径
+        method: 请求方法
+        body: JSON请求体（可选）
+        concurrency: 并发连接数
+        requests: 请求总数
+
+    Returns:
+        Dict: 压测结果（requests、errors、seconds、rps、p50_ms、p95_ms、p99_ms）
+    """
+    payload = json.dumps(body, ensure_ascii=False).encode("utf-8") if body is not None else b""
+    request = (f"{method} {path} HTTP/1.1\r\nHost: {host}\r\n"
+               f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n").encode("latin-1") + payload
+
+    latencies: List[float] = []
+    errors: List[int] = []
+    per_client = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+    start = time.perf_counter()
+    await asyncio.gather(*(_client(host, port, request, count, latencies, errors)
+                           for count in per_client if count))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+
+    def percentile(p):
+        if not latencies:
+            return 0.0
+        return latencies[min(int(p / 100 * len(latencies)), len(latencies) - 1)] * 1000
+
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "seconds": elapsed,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+    }
+
+
+def main() -> None:
+    """
+    命令行入口
+    """
+    parser = argparse.ArgumentParser(description="接口服务压测")
+    parser.add_argument("--host", default="127.0.0.1", help="服务地址")
+    parser.add_argument("--port", type=int, default=8080, help="服务端口")
+    parser.add_argument("--path", default="/api/occupancy", help="请求路径")
+    parser.add_argument("--method", default="GET", help="请求方法")
+    parser.add_argument("--body", help="JSON请求体")
+    parser.add_argument("--concurrency", type=int, default=50, help="并发连接数")
+    parser.add_argument("--requests", type=int, default=10000, help="请求总数")
+    args = parser.parse_args()
+
+    result = asyncio.run(run_load(args.host, args.port, args.path, args.method,
+                                  json.loads(args.body) if args.body else None,
+                                  args.concurrency, args.requests))
+    print(f"请求 {result['requests']}，失败 {result['errors']}，耗时 {result['seconds']:.2f} 秒，"
+          f"吞吐 {result['rps']:.0f} 次/秒，p50 {result['p50_ms']:.2f} ms，"
+          f"p95 {result['p95_ms']:.2f} ms，p99 {result['p99_ms']:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+"""
+HTTP/JSON 接口服务
+基于 asyncio 的轻量 HTTP/1.1 服务，向自助机、小程序和监控系统开放入场、离场结算、
+费用查询、车位占用、居民查询和收入统计接口
+数据库调用通过异步数据库模块（adb）执行，不阻塞事件循环；支持长连接（keep-alive）和批量请求
+
+启动：
+    python -m src.api.server [--host 127.0.0.1] [--port 8080]
+
+多站点部署时，请求头 X-Parking-Site 指定站点
+"""
+import argparse
+import asyncio
+import json
+import logging
+from http import HTTPStatus
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from config import cfg
+from src.database import adb, db
+from src.tool import utils
+
+_logger = logging.getLogger("parking.api")
+
+
+class ApiError(Exception):
+    """
+    接口错误，转换为对应状态码的JSON响应
+    """
+    def __init__(self, status: int, message: str, **extra):
+        super().__init__(message)
+        self.status = status
+        self.body = {"error": message, **extra}
+
+
+def _require(params: Dict, name: str) -> str:
+    """
+    读取必填参数
+    """
+    value = params.get(name)
+    if value is None or not str(value).strip():
+        raise ApiError(400, f"missing parameter: {name}")
+    return str(value).strip()
+
+
+def _public_resident(resident: Dict) -> Dict:
+    """
+    居民信息中对外公开的字段（不含身份证号、出生日期）
+    """
+    return {key: resident[key] for key in ("id", "name", "phone", "plate", "address", "balance")}
+
+
+async def handle_health(params: Dict) -> Tuple[int, Any]:
+    """
+    健康检查
+    """
+    return 200, {"status": "ok"}
+
+
+async def handle_entry(params: Dict) -> Tuple[int, Any]:
+    """
+    入场登记：居民车牌按居民入场，其余按访客入场
+    """
+    plate = _require(params, "plate")
+    resident = await adb.get_resident_by_plate(plate)
+    record_type = 'resident' if resident else 'visitor'
+    entry_time = utils.now_str()
+
+    record_id, status = await adb.enter_vehicle(plate, resident['phone'] if resident else None,
+                                                entry_time, record_type)
+    if status == db.ENTRY_EXISTS:
+        raise ApiError(409, "already_parked", record_id=record_id)
+    if status == db.ENTRY_FULL:
+        raise ApiError(409, "lot_full")
+    return 201, {"record_id": record_id, "entry_time": entry_time, "type": record_type}
+
+
+async def handle_exit(params: Dict) -> Tuple[int, Any]:
+    """
+    离场结算：charge_balance 为真时从居民余额扣款，否则视为现场支付
+    """
+    plate = _require(params, "plate")
+    charge_balance = str(params.get("charge_balance", "")).lower() in ("1", "true", "yes")
+
+    status, result = await adb.settle_vehicle(plate, utils.now_str(), charge_balance)
+    if status == db.SETTLE_NOT_FOUND:
+        raise ApiError(404, "not_parked")
+    if status == db.SETTLE_INSUFFICIENT:
+        raise ApiError(402, "insufficient_balance", **result)
+    return 200, result
+
+
+async def handle_fee(params: Dict) -> Tuple[int, Any]:
+    """
+    当前费用查询
+    """
+    plate = _require(params, "plate")
+    record = await adb.get_active_parking_record(plate)
+    if not record:
+        raise ApiError(404, "not_parked")
+    fee, next_change = utils.quote_fee(record['id'], record['entry_time'])
+    return 200, {
+        "record_id": record['id'],
+        "entry_time": record['entry_time'],
+        "duration": utils.calculate_duration(record['entry_time']),
+        "fee": fee,
+        "next_change": next_change,
+    }
+
+
+async def handle_occupancy(params: Dict) -> Tuple[int, Any]:
+    """
+    车位占用情况
+    """
+    free, parked = await asyncio.gather(adb.get_free_spaces(), adb.get_current_parked_count())
+    return 200, {"free": free, "parked": parked}
+
+
+async def handle_resident(params: Dict) -> Tuple[int, Any]:
+    """
+    按手机号或车牌号查询居民
+    """
+    if params.get("phone"):
+        resident = await adb.get_resident_by_phone(_require(params, "phone"))
+    else:
+        resident = await adb.get_resident_by_plate(_require(params, "plate"))
+    if not resident:
+        raise ApiError(404, "resident_not_found")
+    return 200, _public_resident(resident)
+
+
+async def handle_revenue(params: Dict) -> Tuple[int, Any]:
+    """
+    收入统计
+    """
+    rows = await adb.get_revenue_statistics(_require(params, "start"), _require(params, "end"))
+    return 200, [{"date": date, "revenue": revenue} for date, revenue in rows]
+
+
+# (方法, 路径) -> 处理协程，参数为合并后的查询参数和JSON请求体
+ROUTES: Dict[Tuple[str, str], Callable[[Dict], Awaitable[Tuple[int, Any]]]] = {
+    ("GET", "/api/health"): handle_health,
+    ("POST", "/api/entry"): handle_entry,
+    ("POST", "/api/exit"): handle_exit,
+    ("GET", "/api/fee"): handle_fee,
+    ("GET", "/api/occupancy"): handle_occupancy,
+    ("GET", "/api/residents"): handle_resident,
+    ("GET", "/api/revenue"): handle_revenue,
+}
+
+
+async def dispatch(method: str, target: str, body: Any, site: Optional[str] = None) -> Tuple[int, Any]:
+    """
+    执行一个接口请求
+
+    Args:
+        method: 请求方法
+        target: 请求路径（可含查询参数）
+        body: 已解析的JSON请求体
+        site: 站点ID（可选）
+
+    Returns:
+        Tuple[int, Any]: 状态码和响应数据（处理过程中的异常也转换为本请求的错误响应，
+            不影响同一连接或同一批次中的其他请求）
+    """
+    url = urlsplit(target)
+    handler = ROUTES.get((method, url.path))
+    if handler is None:
+        if any(path == url.path for _, path in ROUTES):
+            return 405, {"error": "method_not_allowed"}
+        return 404, {"error": "not_found"}
+
+    params = dict(parse_qsl(url.query))
+    if isinstance(body, dict):
+        params.update(body)
+    try:
+        # 站点保存在上下文变量中，adb 在执行线程中沿用调用方的上下文
+        with db.use_site(site):
+            return await handler(params)
+    except ApiError as e:
+        return e.status, e.body
+    except ValueError as e:
+        # 参数格式错误（如时间字符串无法解析、站点ID无效）
+        return 400, {"error": "bad_request", "message": str(e)}
+    except Exception:
+        _logger.exception("接口请求处理失败：%s %s", method, target)
+        return 500, {"error": "internal_error"}
+
+
+async def dispatch_batch(requests: List[Dict], site: Optional[str] = None) -> Tuple[int, Any]:
+    """
+    依次执行一批子请求，减少客户端的往返次数
+
+    Args:
+        requests: 子请求列表，每项含 method、path、body（可选）
+        site: 站点ID（可选）
+
+    Returns:
+        Tuple[int, Any]: 状态码和各子请求的结果列表
+    """
+    if not isinstance(requests, list) or len(requests) > cfg.API_MAX_BATCH:
+        return 400, {"error": f"batch must be a list of at most {cfg.API_MAX_BATCH} requests"}
+    results = []
+    for item in requests:
+        if not isinstance(item, dict):
+            results.append({"status": 400, "body": {"error": "invalid request"}})
+            continue
+        status, data = await dispatch(str(item.get("method", "GET")).upper(), str(item.get("path", "")),
+                                      item.get("body"), site)
+        results.append({"status": status, "body": data})
+    return 200, results
+
+
+class ApiServer:
+    """
+    HTTP/JSON 接口服务
+    """
+    def __init__(self, host: str = cfg.API_HOST, port: int = cfg.API_PORT):
+        """
+        初始化服务
+
+        Args:
+            host: 监听地址
+            port: 监听端口，0表示自动分配
+        """
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> None:
+        """
+        开始监听
+        """
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self) -> None:
+        """
+        持续提供服务
+        """
+        await self._server.serve_forever()
+
+    async def close(self) -> None:
+        """
+        停止服务
+        """
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        处理一个连接上的全部请求（HTTP/1.1 默认保持连接）
+        """
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), cfg.API_KEEPALIVE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line.strip():
+                    break
+
+                keep_alive = True
+                try:
+                    method, target, version = request_line.decode("utf-8").split()
+                    headers = await self._read_headers(reader)
+                    keep_alive = (headers.get("connection", "").lower() != "close"
+                                  and version == "HTTP/1.1")
+                    length = int(headers.get("content-length") or 0)
+                    if length > cfg.API_MAX_BODY:
+                        raise ApiError(413, "body_too_large")
+                    raw = await reader.readexactly(length) if length else b""
+                    try:
+                        body = json.loads(raw) if raw else None
+                    except ValueError:
+                        raise ApiError(400, "invalid_json")
+
+                    site = headers.get("x-parking-site") or None
+                    if method == "POST" and urlsplit(target).path == "/api/batch":
+                        status, data = await dispatch_batch(body, site)
+                    else:
+                        status, data = await dispatch(method, target, body, site)
+                except ApiError as e:
+                    status, data = e.status, e.body
+                    keep_alive = False
+                except (ValueError, UnicodeDecodeError):
+                    status, data = 400, {"error": "bad_request"}
+                    keep_alive = False
+                except Exception:
+                    status, data = 500, {"error": "internal_error"}
+
+                self._write_response(writer, status, data, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_headers(reader: asyncio.StreamReader) -> Dict[str, str]:
+        """
+        读取请求头（名称转为小写）
+        """
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                return headers
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+    @staticmethod
+    def _write_response(writer: asyncio.StreamWriter, status: int, data: Any, keep_alive: bool) -> None:
+        """
+        写出JSON响应
+        """
+        payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1")
+            + payload
+        )
+
+
+async def serve(host: str, port: int) -> None:
+    """
+    启动接口服务并持续运行
+
+    Args:
+        host: 监听地址
+        port: 监听端口
+    """
+    server = ApiServer(host, port)
+    await server.start()
+    print(f"接口服务已启动：http://{server.host}:{server.port}")
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+
+def main() -> None:
+    """
+    命令行入口
+    """
+    parser = argparse.ArgumentParser(description="智慧停车场 HTTP/JSON 接口服务")
+    parser.add_argument("--host", default=cfg.API_HOST, help="监听地址")
+    parser.add_argument("--port", type=int, default=cfg.API_PORT, help="监听端口")
+    args = parser.parse_args()
+
+    if cfg.DEFAULT_SITE:
+        db.init_sites([cfg.DEFAULT_SITE])
+    else:
+        db.init_db()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
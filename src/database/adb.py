@@ -0,0 +1,224 @@
+"""
+异步数据库模块
+把 db 模块的公开函数包装为协程，供 asyncio 代码（接口服务、道闸服务等）调用而不阻塞事件循环
+写操作在专用的单个写线程中串行执行（SQLite 同一时刻只允许一个写事务，串行化避免写锁争用），
+读操作在读线程池中并行执行；每条通道限制同时排队的调用数，超过上限时调用方在事件循环中等待
+
+用法：
+    from src.database import adb
+    record_id, status = await adb.enter_vehicle(plate, phone, entry_time, 'visitor')
+"""
+import asyncio
+import contextvars
+import functools
+import inspect
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Dict, Optional
+
+from config.cfg import ADB_READER_THREADS, ADB_MAX_PENDING_READS, ADB_MAX_PENDING_WRITES
+from src.database import db
+
+# 在写线程中执行的函数（会修改数据库或进程内的居民车牌过滤器）
+WRITE_FUNCTIONS = {
+    "init_db",
+    "init_sites",
+    "load_resident_plate_filter",
+    "register_resident",
+    "enter_vehicle",
+    "create_parking_record",
+    "close_parking_record",
+    "settle_vehicle",
+    "update_resident_balance",
+}
+
+# 不包装的函数：切换数据库目标、站点等配置函数，以及返回连接对象的快照函数
+EXCLUDED_FUNCTIONS = {
+    "current_site",
+    "use_site",
+    "set_default_site",
+    "use_site_directory",
+    "set_connection_factory",
+    "use_database",
+    "use_memory_database",
+    "use_writer",
+    "snapshot_database",
+    "restore_database",
+    "get_statement_cache_stats",
+}
+
+
+class _Lane:
+    """
+    一条执行通道：线程池 + 排队上限 + 队列深度统计
+    """
+    def __init__(self, name: str, threads: int, max_pending: int):
+        """
+        初始化通道
+
+        Args:
+            name: 通道名称
+            threads: 线程数
+            max_pending: 同时排队（含执行中）的调用数上限
+        """
+        self.name = name
+        self._threads = threads
+        self._max_pending = max_pending
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # 信号量绑定事件循环，每个事件循环各用一个
+        self._slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = \
+            weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.max_pending = 0
+        self.completed = 0
+        self.throttled = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._threads,
+                                                    thread_name_prefix=f"adb-{self.name}")
+            return self._executor
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """
+        在通道线程中执行函数，保留调用方的上下文变量（如当前站点）
+
+        Args:
+            func: 同步函数
+            *args: 位置参数
+            **kwargs: 关键字参数
+
+        Returns:
+            函数返回值
+        """
+        loop = asyncio.get_running_loop()
+        slots = self._slots.get(loop)
+        if slots is None:
+            slots = self._slots[loop] = asyncio.Semaphore(self._max_pending)
+
+        if slots.locked():
+            # 排队已满，调用方在事件循环中等待（背压），不会无限堆积到线程池
+            self.throttled += 1
+        async with slots:
+            self.pending += 1
+            self.max_pending = max(self.max_pending, self.pending)
+            try:
+                context = contextvars.copy_context()
+                call = functools.partial(context.run, func, *args, **kwargs)
+                return await loop.run_in_executor(self._get_executor(), call)
+            finally:
+                self.pending -= 1
+                self.completed += 1
+
+    def stats(self) -> Dict[str, int]:
+        """
+        获取通道统计
+        """
+        return {
+            "threads": self._threads,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "throttled": self.throttled,
+            "limit": self._max_pending,
+        }
+
+    def reset_stats(self) -> None:
+        """
+        清空累计统计
+        """
+        self.max_pending = self.pending
+        self.completed = 0
+        self.throttled = 0
+
+    def shutdown(self) -> None:
+        """
+        关闭线程池（下次调用时重新创建）
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+_writer = _Lane("writer", 1, ADB_MAX_PENDING_WRITES)
+_readers = _Lane("reader", ADB_READER_THREADS, ADB_MAX_PENDING_READS)
+
+
+def get_queue_stats() -> Dict[str, Dict[str, int]]:
+    """
+    获取读写通道的队列深度统计
+
+    Returns:
+        Dict[str, Dict[str, int]]: 通道名称 -> 统计
+            （threads、pending、max_pending、completed、throttled、limit）
+    """
+    return {"writer": _writer.stats(), "reader": _readers.stats()}
+
+
+def reset_queue_stats() -> None:
+    """
+    清空队列深度统计
+    """
+    _writer.reset_stats()
+    _readers.reset_stats()
+
+
+def shutdown() -> None:
+    """
+    关闭读写线程池
+    """
+    _writer.shutdown()
+    _readers.shutdown()
+
+
+def _wrap(name: str, func: Callable) -> Callable:
+    """
+    把同步函数包装为协程函数
+    """
+    lane = _writer if name in WRITE_FUNCTIONS else _readers
+
+    @functools.wraps(func)
+    async def coroutine(*args, **kwargs):
+        return await lane.run(func, *args, **kwargs)
+
+    return coroutine
+
+
+def _wrap_generator(func: Callable) -> Callable:
+    """
+    把分批读取的生成器函数包装为异步生成器，每一批在读线程池中读取
+    """
+    _end = object()
+
+    @functools.wraps(func)
+    async def generator(*args, **kwargs) -> AsyncIterator:
+        chunks = func(*args, **kwargs)
+        while True:
+            chunk = await _readers.run(next, chunks, _end)
+            if chunk is _end:
+                return
+            yield chunk
+
+    return generator
+
+
+def _mirror() -> None:
+    """
+    为 db 模块的每个公开函数生成同名协程
+    """
+    for name, func in vars(db).items():
+        if name.startswith("_") or name in EXCLUDED_FUNCTIONS:
+            continue
+        if not inspect.isfunction(func) or func.__module__ != db.__name__:
+            continue
+        if inspect.isgeneratorfunction(inspect.unwrap(func)):
+            globals()[name] = _wrap_generator(func)
+        else:
+            globals()[name] = _wrap(name, func)
+
+
+_mirror()
@@ -0,0 +1,231 @@
+"""
+车位占用分析模块
+基于停车记录列式快照，用扫描线（sweep-line）计算占用曲线、峰值在场数、停车时长分布，
+以及按星期和小时统计的入场车次（周转），供容量规划使用
+进场、出场时间各排序一次后，任意时刻的在场数 = 已进场数 - 已离场数，用二分查找求得
+
+用法（导出分析报表）：
+    python -m src.database.analytics --start "2025-01-01 00:00:00" --end "2025-01-31 23:59:59" --csv report.csv
+"""
+import argparse
+import csv
+from bisect import bisect_right
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from config.cfg import ANALYTICS_DWELL_BINS
+from src.database import snapshot
+from src.database.snapshot import OPEN, ParkingSnapshot
+from src.tool.utils import now_str
+
+WEEKDAYS = ("周一", "周二", "周三", "周四", "周五", "周六", "周日")
+
+
+def _sorted_events(snap: ParkingSnapshot, indices: Sequence[int], until: int) -> Tuple[List[int], List[int]]:
+    """
+    取出记录的进场、出场时刻并分别排序，在场记录按 until 时刻离场计算
+    """
+    entry, exit_ = snap.entry, snap.exit
+    entries = sorted(entry[i] for i in indices)
+    exits = sorted(until if exit_[i] == OPEN else exit_[i] for i in indices)
+    return entries, exits
+
+
+def occupancy_curve(snap: ParkingSnapshot,
+                    start: int,
+                    end: int,
+                    step: int = 3600,
+                    record_type: Optional[str] = None,
+                    now: Optional[int] = None) -> List[Tuple[int, int]]:
+    """
+    计算占用曲线：每隔 step 秒的在场车辆数
+
+    Args:
+        snap: 停车记录快照
+        start: 开始时刻（秒）
+        end: 结束时刻（秒）
+        step: 采样间隔（秒）
+        record_type: 记录类型（可选）
+        now: 当前时刻（秒），在场记录计为在场到此刻，默认为当前时间
+
+    Returns:
+        List[Tuple[int, int]]: (时刻, 在场数) 列表
+    """
+    if now is None:
+        now = snapshot.to_timestamp(now_str())
+    entries, exits = _sorted_events(snap, snap.select(record_type=record_type), now + 1)
+    return [(t, bisect_right(entries, t) - bisect_right(exits, t)) for t in range(start, end + 1, step)]
+
+
+def peak_occupancy(snap: ParkingSnapshot,
+                   start: Optional[int] = None,
+                   end: Optional[int] = None,
+                   record_type: Optional[str] = None,
+                   now: Optional[int] = None) -> Tuple[int, Optional[int]]:
+    """
+    扫描线求峰值在场数
+
+    Args:
+        snap: 停车记录快照
+        start: 开始时刻（秒，可选）
+        end: 结束时刻（秒，可选）
+        record_type: 记录类型（可选）
+        now: 当前时刻（秒），默认为当前时间
+
+    Returns:
+        Tuple[int, Optional[int]]: 峰值在场数和首次达到峰值的时刻（没有记录时为None）
+    """
+    if now is None:
+        now = snapshot.to_timestamp(now_str())
+    entries, exits = _sorted_events(snap, snap.select(record_type=record_type), now + 1)
+
+    # 区间开始时已在场的车辆
+    if start is not None:
+        i, j = bisect_right(entries, start), bisect_right(exits, start)
+        count = i - j
+        peak, peak_at = count, (start if count else None)
+    else:
+        count, i, j, peak, peak_at = 0, 0, 0, 0, None
+
+    # 同一时刻先处理离场再处理进场，前后衔接的两辆车不重复计数
+    while i < len(entries):
+        t = entries[i]
+        if end is not None and t > end:
+            break
+        if j < len(exits) and exits[j] <= t:
+            count -= 1
+            j += 1
+            continue
+        count += 1
+        i += 1
+        if count > peak:
+            peak, peak_at = count, t
+    return peak, peak_at
+
+
+def dwell_histogram(snap: ParkingSnapshot,
+                    indices: Optional[Sequence[int]] = None,
+                    bins: Sequence[int] = ANALYTICS_DWELL_BINS) -> List[Tuple[str, int]]:
+    """
+    已离场记录的停车时长分布
+
+    Args:
+        snap: 停车记录快照
+        indices: 参与统计的记录下标（可选，默认全部已离场记录）
+        bins: 分段上界（分钟），升序
+
+    Returns:
+        List[Tuple[str, int]]: (时长区间, 车次) 列表，最后一段为超过最大上界的记录
+    """
+    if indices is None:
+        indices = snap.select(closed=True)
+    counts = [0] * (len(bins) + 1)
+    entry, exit_ = snap.entry, snap.exit
+    for i in indices:
+        if exit_[i] != OPEN:
+            counts[bisect_right(bins, (exit_[i] - entry[i]) // 60)] += 1
+
+    labels = []
+    low = 0
+    for high in bins:
+        labels.append(f"{low}-{high}分钟")
+        low = high
+    labels.append(f"{low}分钟以上")
+    return list(zip(labels, counts))
+
+
+def turnover_by_weekday_hour(snap: ParkingSnapshot,
+                             indices: Optional[Sequence[int]] = None) -> List[List[int]]:
+    """
+    按星期和小时统计入场车次
+
+    Args:
+        snap: 停车记录快照
+        indices: 参与统计的记录下标（可选，默认全部）
+
+    Returns:
+        List[List[int]]: 7x24 矩阵，[星期（周一为0）][小时] -> 入场车次
+    """
+    if indices is None:
+        indices = range(len(snap))
+    matrix = [[0] * 24 for _ in range(7)]
+    entry = snap.entry
+    for i in indices:
+        t = entry[i]
+        # 1970-01-01 是周四
+        matrix[(t // 86400 + 3) % 7][t % 86400 // 3600] += 1
+    return matrix
+
+
+def build_report(start_time: str, end_time: str, step: int = 3600, now: Optional[str] = None) -> Dict:
+    """
+    生成占用分析报表
+    加载快照时不限制进场时间下限，区间开始前进场、区间内仍在场的车辆也计入占用
+
+    Args:
+        start_time: 开始时间
+        end_time: 结束时间
+        step: 占用曲线采样间隔（秒）
+        now: 当前时间（可选）
+
+    Returns:
+        Dict: curve（(时间, 在场数)）、peak、peak_at、dwell、turnover、records
+    """
+    start, end = snapshot.to_timestamp(start_time), snapshot.to_timestamp(end_time)
+    now_ts = snapshot.to_timestamp(now or now_str())
+    snap = snapshot.load_snapshot(end_time=end_time)
+    in_range = snap.select(start, end)
+
+    peak, peak_at = peak_occupancy(snap, start, end, now=now_ts)
+    return {
+        "curve": [(snapshot.from_timestamp(t), count)
+                  for t, count in occupancy_curve(snap, start, end, step, now=now_ts)],
+        "peak": peak,
+        "peak_at": snapshot.from_timestamp(peak_at) if peak_at is not None else None,
+        "dwell": dwell_histogram(snap, in_range),
+        "turnover": turnover_by_weekday_hour(snap, in_range),
+        "records": len(in_range),
+    }
+
+
+def export_report_csv(report: Dict, path: str) -> None:
+    """
+    把占用分析报表导出为CSV（各部分依次写出，部分之间空一行）
+
+    Args:
+        report: build_report 的结果
+        path: 文件路径
+    """
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(["峰值在场数", report["peak"], "峰值时间", report["peak_at"] or ""])
+        writer.writerow(["入场车次", report["records"]])
+        writer.writerow([])
+        writer.writerow(["时间", "在场数"])
+        writer.writerows(report["curve"])
+        writer.writerow([])
+        writer.writerow(["停车时长", "车次"])
+        writer.writerows(report["dwell"])
+        writer.writerow([])
+        writer.writerow(["星期"] + [f"{hour}时" for hour in range(24)])
+        for weekday, row in zip(WEEKDAYS, report["turnover"]):
+            writer.writerow([weekday] + row)
+
+
+def main() -> None:
+    """
+    命令行入口
+    """
+    parser = argparse.ArgumentParser(description="车位占用分析")
+    parser.add_argument("--start", required=True, help="开始时间")
+    parser.add_argument("--end", required=True, help="结束时间")
+    parser.add_argument("--step", type=int, default=3600, help="占用曲线采样间隔（秒）")
+    parser.add_argument("--csv", required=True, help="导出的CSV文件路径")
+    args = parser.parse_args()
+
+    report = build_report(args.start, args.end, args.step)
+    export_report_csv(report, args.csv)
+    print(f"记录 {report['records']} 条，峰值在场 {report['peak']} 辆（{report['peak_at']}），已导出：{args.csv}")
+
+
+if __name__ == "__main__":
+    main()
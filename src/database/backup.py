@@ -0,0 +1,241 @@
+"""
+在线备份模块
+使用SQLite在线备份API分步复制数据库：每步只复制少量页并在步与步之间休眠，
+复制期间道闸入场、结算等写操作不会被长时间阻塞（直接复制数据库文件既不安全也会阻塞写入）
+备份先写入临时文件，通过完整性校验后才改名为正式快照，并按数量轮转保留
+
+用法：
+    python -m src.database.backup                 # 立即备份一次并轮转
+    python -m src.database.backup --schedule 3600 # 每小时备份一次
+    python -m src.database.backup --restore data/backups/parking-20250101-020000.db
+"""
+import argparse
+import glob
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from config import cfg
+from config.cfg import BACKUP_KEEP, BACKUP_MAX_RESTARTS, BACKUP_PAGES, BACKUP_SLEEP
+from src.database import db
+
+# 定时备份在后台线程中运行，结果写入日志（未配置日志时 WARNING 及以上级别输出到标准错误）
+_logger = logging.getLogger("parking.backup")
+
+
+class _TooManyRestarts(Exception):
+    """
+    分步备份因源库被反复修改而多次重新开始
+    """
+
+
+def _backup_dir() -> str:
+    """
+    获取快照目录（每次调用时读取配置，便于测试替换）
+    """
+    return cfg.BACKUP_DIR
+
+
+def _prefix(site: Optional[str] = None) -> str:
+    """
+    快照文件名前缀：单库为 parking，多站点时为站点ID
+    """
+    return site or db.current_site() or "parking"
+
+
+def verify_backup(path: str) -> bool:
+    """
+    对快照文件执行完整性校验
+
+    Args:
+        path: 快照文件路径
+
+    Returns:
+        bool: 校验是否通过
+    """
+    try:
+        conn = sqlite3.connect(Path(path).resolve().as_uri() + "?mode=ro", uri=True)
+        try:
+            return conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+        finally:
+            conn.close()
+    except sqlite3.DatabaseError:
+        return False
+
+
+def backup_database(dest_path: Optional[str] = None,
+                    pages: int = BACKUP_PAGES,
+                    sleep: float = BACKUP_SLEEP,
+                    progress: Optional[Callable[[Dict], None]] = None) -> Optional[str]:
+    """
+    在线备份当前数据库（或当前站点的数据库）
+
+    Args:
+        dest_path: 快照文件路径（可选），默认在快照目录下按时间命名
+        pages: 每步复制的页数
+        sleep: 每步之后的休眠时间（秒），让出写锁
+        progress: 进度回调（可选），参数含 remaining、total
+
+    Returns:
+        Optional[str]: 快照文件路径，完整性校验失败时返回None
+    """
+    if dest_path is None:
+        os.makedirs(_backup_dir(), exist_ok=True)
+        dest_path = os.path.join(_backup_dir(), f"{_prefix()}-{datetime.now():%Y%m%d-%H%M%S}.db")
+    tmp_path = dest_path + ".tmp"
+
+    restarts = [0, None]
+
+    def on_step(status, remaining, total):
+        # 其他连接修改了源库时备份会从头开始，剩余页数随之变大
+        if restarts[1] is not None and remaining > restarts[1]:
+            restarts[0] += 1
+            if restarts[0] > BACKUP_MAX_RESTARTS:
+                raise _TooManyRestarts()
+        restarts[1] = remaining
+        if progress:
+            progress({"remaining": remaining, "total": total})
+        if remaining and sleep:
+            time.sleep(sleep)
+
+    source = db._connect()
+    try:
+        for step_pages in (pages, -1):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            target = sqlite3.connect(tmp_path)
+            try:
+                source.backup(target, pages=step_pages, progress=on_step)
+                break
+            except _TooManyRestarts:
+                # 写入过于频繁，改为一步复制全部页（只短暂持有读锁）
+                continue
+            finally:
+                target.close()
+    finally:
+        source.close()
+
+    if not verify_backup(tmp_path):
+        os.remove(tmp_path)
+        return None
+    os.replace(tmp_path, dest_path)
+    return dest_path
+
+
+def list_backups(site: Optional[str] = None) -> List[str]:
+    """
+    列出快照文件
+
+    Args:
+        site: 站点ID（可选），默认当前站点
+
+    Returns:
+        List[str]: 快照文件路径，从旧到新
+    """
+    return sorted(glob.glob(os.path.join(_backup_dir(), f"{glob.escape(_prefix(site))}-*.db")))
+
+
+def rotate_backups(keep: int = BACKUP_KEEP, site: Optional[str] = None) -> List[str]:
+    """
+    只保留最新的 keep 个快照
+
+    Args:
+        keep: 保留个数
+        site: 站点ID（可选），默认当前站点
+
+    Returns:
+        List[str]: 已删除的快照文件路径
+    """
+    backups = list_backups(site)
+    removed = backups[:-keep] if keep > 0 else backups
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+def run_backup(keep: int = BACKUP_KEEP) -> Optional[str]:
+    """
+    备份一次并轮转旧快照
+
+    Args:
+        keep: 保留的快照个数
+
+    Returns:
+        Optional[str]: 新快照路径，失败时返回None（不删除旧快照）
+    """
+    path = backup_database()
+    if path:
+        rotate_backups(keep)
+    return path
+
+
+def start_backup_scheduler(interval: float,
+                           keep: int = BACKUP_KEEP,
+                           stop: Optional[threading.Event] = None) -> threading.Thread:
+    """
+    启动后台定时备份线程
+
+    Args:
+        interval: 备份间隔（秒）
+        keep: 保留的快照个数
+        stop: 设置后停止备份的事件（可选）
+
+    Returns:
+        threading.Thread: 备份线程（守护线程）
+    """
+    stop = stop or threading.Event()
+    site = db.current_site()
+
+    def loop():
+        # 新线程不继承调用方的上下文，按启动时的站点备份
+        with db.use_site(site):
+            while not stop.wait(interval):
+                try:
+                    path = run_backup(keep)
+                except (OSError, sqlite3.Error):
+                    _logger.exception("定时备份失败（站点：%s）", site or "-")
+                    continue
+                if path is None:
+                    _logger.error("定时备份失败：快照完整性校验未通过（站点：%s）", site or "-")
+                else:
+                    _logger.info("定时备份完成：%s", path)
+
+    thread = threading.Thread(target=loop, name="parking-backup", daemon=True)
+    thread.start()
+    return thread
+
+
+def main() -> None:
+    """
+    命令行入口
+    """
+    parser = argparse.ArgumentParser(description="数据库在线备份")
+    parser.add_argument("--out", help="快照文件路径，默认在快照目录下按时间命名")
+    parser.add_argument("--keep", type=int, default=BACKUP_KEEP, help="保留的快照个数")
+    parser.add_argument("--schedule", type=float, help="定时备份间隔（秒）")
+    parser.add_argument("--restore", help="用指定快照恢复数据库")
+    args = parser.parse_args()
+
+    if args.restore:
+        db.init_db(restore_from=args.restore)
+        print(f"已从快照恢复：{args.restore}")
+        return
+    if args.schedule:
+        print(f"定时备份已启动，间隔 {args.schedule} 秒")
+        try:
+            start_backup_scheduler(args.schedule, args.keep).join()
+        except KeyboardInterrupt:
+            pass
+        return
+
+    path = backup_database(args.out) if args.out else run_backup(args.keep)
+    print(f"备份完成：{path}" if path else "备份失败：快照完整性校验未通过")
+
+
+if __name__ == "__main__":
+    main()
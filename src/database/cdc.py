@@ -0,0 +1,193 @@
+"""
+变更数据捕获（CDC）消费模块
+停车记录和居民表的变更由触发器写入 changes 表（见 db._create_change_feed），
+外部系统（道闸控制器、物业计费等）按 seq 游标增量读取，开销只与变更条数有关，与表大小无关
+
+用法（持续输出变更）：
+    python -m src.database.cdc --consumer gate
+"""
+import argparse
+import json
+import sqlite3
+import time
+from typing import Dict, List, Optional
+
+from config.cfg import CDC_BATCH_SIZE, CDC_POLL_INTERVAL
+from src.database import db
+
+
+def _fetch(cursor: sqlite3.Cursor, after_seq: int, limit: int) -> List[Dict]:
+    """
+    读取 seq 大于游标的一批变更
+    """
+    cursor.execute(
+        """
+        SELECT seq, table_name, op, row_id, payload, changed_at
+        FROM changes WHERE seq > ? ORDER BY seq LIMIT ?
+        """,
+        (after_seq, limit)
+    )
+    return [
+        {
+            "seq": seq,
+            "table": table_name,
+            "op": op,
+            "row_id": row_id,
+            "data": json.loads(payload),
+            "changed_at": changed_at,
+        }
+        for seq, table_name, op, row_id, payload, changed_at in cursor.fetchall()
+    ]
+
+
+def get_changes(after_seq: int = 0, limit: int = CDC_BATCH_SIZE) -> List[Dict]:
+    """
+    读取游标之后的一批变更（不等待）
+
+    Args:
+        after_seq: 游标，即上一批最后一条变更的 seq
+        limit: 最多返回条数
+
+    Returns:
+        List[Dict]: 变更列表（seq、table、op、row_id、data、changed_at），按 seq 升序
+    """
+    conn = db._connect()
+    changes = _fetch(conn.cursor(), after_seq, limit)
+    conn.close()
+    return changes
+
+
+def wait_for_changes(after_seq: int = 0,
+                     limit: int = CDC_BATCH_SIZE,
+                     timeout: float = 30.0) -> List[Dict]:
+    """
+    长轮询：游标之后有变更时立即返回，否则等待新变更直到超时
+    等待期间只做主键范围查找，不扫描表
+
+    Args:
+        after_seq: 游标，即上一批最后一条变更的 seq
+        limit: 最多返回条数
+        timeout: 最长等待时间（秒）
+
+    Returns:
+        List[Dict]: 变更列表，超时时为空
+    """
+    deadline = time.monotonic() + timeout
+    conn = db._connect()
+    cursor = conn.cursor()
+    try:
+        while True:
+            try:
+                changes = _fetch(cursor, after_seq, limit)
+            except sqlite3.OperationalError as e:
+                # 共享缓存库中写事务未提交时读取会报表锁定，下次轮询重试
+                if "locked" not in str(e):
+                    raise
+                changes = []
+            remaining = deadline - time.monotonic()
+            if changes or remaining <= 0:
+                return changes
+            time.sleep(min(CDC_POLL_INTERVAL, remaining))
+    finally:
+        conn.close()
+
+
+def _ensure_consumer_table(cursor: sqlite3.Cursor) -> None:
+    """
+    创建消费者游标表
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS cdc_consumers (
+        name TEXT PRIMARY KEY,
+        last_seq INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+
+
+def get_consumer_cursor(consumer: str) -> int:
+    """
+    获取命名消费者已确认的游标
+
+    Args:
+        consumer: 消费者名称
+
+    Returns:
+        int: 已确认的 seq，未确认过时为0
+    """
+    conn = db._connect()
+    cursor = conn.cursor()
+    _ensure_consumer_table(cursor)
+    cursor.execute("SELECT last_seq FROM cdc_consumers WHERE name = ?", (consumer,))
+    row = cursor.fetchone()
+    conn.commit()
+    conn.close()
+    return row[0] if row else 0
+
+
+def ack_changes(consumer: str, seq: int) -> None:
+    """
+    确认命名消费者已处理到 seq（游标只前进不后退）
+
+    Args:
+        consumer: 消费者名称
+        seq: 已处理的最后一条变更的 seq
+    """
+    conn = db._connect()
+    cursor = conn.cursor()
+    db._begin_write(conn)
+    _ensure_consumer_table(cursor)
+    cursor.execute(
+        """
+        INSERT INTO cdc_consumers (name, last_seq) VALUES (?, ?)
+        ON CONFLICT(name) DO UPDATE SET last_seq = MAX(last_seq, excluded.last_seq)
+        """,
+        (consumer, seq)
+    )
+    conn.commit()
+    conn.close()
+
+
+def prune_changes(before_seq: Optional[int] = None) -> int:
+    """
+    删除已被全部命名消费者确认的变更
+
+    Args:
+        before_seq: 只删除 seq 不大于该值的变更（可选），默认取全部消费者游标的最小值
+
+    Returns:
+        int: 删除的条数
+    """
+    conn = db._connect()
+    cursor = conn.cursor()
+    db._begin_write(conn)
+    _ensure_consumer_table(cursor)
+    if before_seq is None:
+        cursor.execute("SELECT MIN(last_seq) FROM cdc_consumers")
+        before_seq = cursor.fetchone()[0] or 0
+    cursor.execute("DELETE FROM changes WHERE seq <= ?", (before_seq,))
+    deleted = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return deleted
+
+
+def main() -> None:
+    """
+    命令行入口
+    """
+    parser = argparse.ArgumentParser(description="持续输出停车场数据变更")
+    parser.add_argument("--consumer", required=True, help="消费者名称，用于保存游标")
+    args = parser.parse_args()
+
+    after_seq = get_consumer_cursor(args.consumer)
+    while True:
+        changes = wait_for_changes(after_seq)
+        for change in changes:
+            print(json.dumps(change, ensure_ascii=False))
+        if changes:
+            after_seq = changes[-1]["seq"]
+            ack_changes(args.consumer, after_seq)
+
+
+if __name__ == "__main__":
+    main()
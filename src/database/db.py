@@ -3,72 +3,1089 @@
 实现停车场管理系统的数据库初始化和CRUD操作
 """
 import sqlite3
+import functools
 import hashlib
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
-from config.cfg import DB_PATH, DEFAULT_ADMIN_USERNAME, DEFAULT_ADMIN_PASSWORD
+from config import cfg
+from config.cfg import (
+    TIME_FORMAT,
+    DEFAULT_ADMIN_USERNAME,
+    DEFAULT_ADMIN_PASSWORD,
+    LOT_CAPACITY,
+    LOT_CAPACITY_BY_TYPE,
+    RESIDENT_PLATE_FILTER_CAPACITY,
+    RESIDENT_PLATE_FILTER_ERROR_RATE,
+    STATEMENT_CACHE_SIZE,
+)
+from src.database import migrations, statements
+from src.database.migrations import Migration
+from src.database.statements import QueryRegistry, StatementCacheTracker
+from src.tool import metrics
+from src.tool.utils import calc_fee, invalidate_fee_quote, normalize_plate
+from src.tool.bloom_filter import BloomFilter
+from src.tool.plate_index import PlateTrigramIndex
 
+# 居民车牌布隆过滤器（按站点区分），init_db 时构建；没有过滤器时所有查询都走数据库
+_resident_plate_filters: Dict[Optional[str], BloomFilter] = {}
 
-def init_db() -> None:
+# 居民车牌模糊匹配索引（按站点区分），首次模糊查询时构建
+_resident_plate_indexes: Dict[Optional[str], PlateTrigramIndex] = {}
+
+# 当前数据库文件与内存库URI，均为None时使用 cfg.DB_PATH（每次连接时读取，便于测试替换）
+_db_path: Optional[str] = None
+_db_uri: Optional[str] = None
+
+# 共享缓存内存库的保活连接：内存库在最后一个连接关闭时销毁
+_memory_keeper: Optional[sqlite3.Connection] = None
+
+# 创建连接使用的连接类，SQL分析器等工具可替换为子类
+_connection_factory = sqlite3.Connection
+
+# 多站点（多小区）部署：每个站点一个数据库文件（分片）
+# 当前上下文的站点由 use_site 设置，未设置时使用进程默认站点，两者都为None时使用单库；
+# 显式指定了数据库目标（use_database / use_memory_database）时站点设置不生效，沙箱和测试库优先
+_current_site: ContextVar[Optional[str]] = ContextVar("parking_site", default=None)
+_default_site: Optional[str] = cfg.DEFAULT_SITE
+# 站点数据库目录，为None时使用 cfg.SITE_DB_DIR
+_site_dir: Optional[str] = None
+
+_SITE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+# 保留字，不能作为站点ID（跨站点汇总使用）
+_RESERVED_SITE_IDS = {"all"}
+
+# 常驻查询连接（每线程、每站点一个），连接的语句缓存可跨调用复用
+# 切换数据库目标或连接类时代数加一，并立即关闭所有线程的旧连接（否则旧连接会让共享缓存内存库继续存活）
+_reader_generation = 0
+_reader_local = threading.local()
+# 所有线程的常驻查询连接 (所属线程, 连接)，由 _reader_lock 保护
+_reader_connections: List[Tuple[threading.Thread, sqlite3.Connection]] = []
+_reader_lock = threading.Lock()
+
+# 写操作函数名 -> 本进程内的实现，单写进程按名称调用
+_write_functions: Dict[str, Callable] = {}
+# 单写进程客户端，为None时写操作在本进程执行
+_writer_client = None
+
+
+def current_site() -> Optional[str]:
+    """
+    获取当前调用所属的站点
+    
+    Returns:
+        Optional[str]: 站点ID，单库模式或显式指定了数据库目标时为None
+    """
+    if _db_uri is not None or _db_path is not None:
+        return None
+    return _current_site.get() or _default_site
+
+
+def _site_path(site: str) -> str:
+    """
+    获取站点数据库文件路径
+    
+    Args:
+        site: 站点ID
+        
+    Returns:
+        str: 数据库文件路径
+    """
+    if not _SITE_ID_PATTERN.match(site) or site in _RESERVED_SITE_IDS:
+        raise ValueError(f"无效的站点ID：{site}")
+    return os.path.join(_site_dir or cfg.SITE_DB_DIR, f"{site}.db")
+
+
+def _connect(cached_statements: int = 128, check_same_thread: bool = True) -> sqlite3.Connection:
+    """
+    按当前数据库目标创建连接（设置了站点时路由到该站点的数据库）
+    
+    Args:
+        cached_statements: 连接的语句缓存大小
+        check_same_thread: 是否只允许创建连接的线程使用（常驻查询连接需由其他线程关闭）
+    
+    Returns:
+        sqlite3.Connection: 数据库连接
+    """
+    options = {"factory": _connection_factory, "cached_statements": cached_statements,
+               "check_same_thread": check_same_thread}
+    site = current_site()
+    if site is not None:
+        return sqlite3.connect(_site_path(site), **options)
+    if _db_uri is not None:
+        return sqlite3.connect(_db_uri, uri=True, **options)
+    return sqlite3.connect(_db_path or cfg.DB_PATH, **options)
+
+
+def _routed_write(func: Callable) -> Callable:
+    """
+    写操作路由装饰器：配置了单写进程时把调用转发给它执行，否则在本进程执行
+    单写进程不可用（未启动）时退回本进程执行
+    
+    Args:
+        func: 写操作函数，参数和返回值须可JSON序列化
+        
+    Returns:
+        Callable: 包装后的函数
+    """
+    _write_functions[func.__name__] = func
+    
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        client = _writer_client
+        if client is not None:
+            from src.database.writer import WriterUnavailable
+            try:
+                return client.call(func.__name__, args, kwargs, current_site())
+            except WriterUnavailable:
+                pass
+        return func(*args, **kwargs)
+    
+    return wrapper
+
+
+def use_writer(socket_path: Optional[str] = None) -> None:
+    """
+    设置单写进程：之后本进程的写操作都通过本地Unix套接字交给它执行，读操作仍直接访问数据库
+    
+    Args:
+        socket_path: 单写进程的套接字路径，为None时恢复在本进程写入
+    """
+    global _writer_client
+    
+    if _writer_client is not None:
+        _writer_client.close()
+        _writer_client = None
+    if socket_path:
+        from src.database.writer import WriterClient
+        _writer_client = WriterClient(socket_path)
+
+
+def _invalidate_readers() -> None:
+    """
+    使各线程的常驻查询连接失效并立即关闭
+    """
+    global _reader_generation
+    with _reader_lock:
+        _reader_generation += 1
+        for _, conn in _reader_connections:
+            conn.close()
+        _reader_connections.clear()
+
+
+def _register_reader(conn: sqlite3.Connection) -> None:
+    """
+    登记当前线程新建的常驻查询连接，同时关闭已退出线程遗留的连接
+    
+    Args:
+        conn: 数据库连接
+    """
+    with _reader_lock:
+        alive = []
+        for thread, reader in _reader_connections:
+            if thread.is_alive():
+                alive.append((thread, reader))
+            else:
+                reader.close()
+        alive.append((threading.current_thread(), conn))
+        _reader_connections[:] = alive
+
+
+def _reader() -> Tuple[sqlite3.Connection, StatementCacheTracker]:
+    """
+    获取当前线程、当前站点的常驻查询连接及其语句缓存跟踪器
+    
+    Returns:
+        Tuple[sqlite3.Connection, StatementCacheTracker]: 连接和跟踪器
+    """
+    readers = getattr(_reader_local, "readers", None)
+    if readers is None:
+        readers = _reader_local.readers = {}
+    key = (_reader_generation, current_site())
+    reader = readers.get(key)
+    if reader is None:
+        for stale in [k for k in readers if k[0] != _reader_generation]:
+            readers.pop(stale)[0].close()
+        conn = _connect(STATEMENT_CACHE_SIZE, check_same_thread=False)
+        _register_reader(conn)
+        reader = readers[key] = (conn, StatementCacheTracker(STATEMENT_CACHE_SIZE))
+    return reader
+
+
+def _query(sql: str, params) -> List[Dict]:
+    """
+    在常驻查询连接上执行查询
+    
+    Args:
+        sql: SQL文本（来自查询注册表，同一形状始终是同一文本）
+        params: 参数
+        
+    Returns:
+        List[Dict]: 结果行
+    """
+    conn, tracker = _reader()
+    tracker.touch(sql)
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    cursor.execute(sql, params)
+    rows = cursor.fetchall()
+    cursor.close()
+    return [dict(row) for row in rows]
+
+
+def get_statement_cache_stats() -> Dict:
+    """
+    获取查询注册表和语句缓存的统计
+    
+    Returns:
+        Dict: shapes（已生成的查询形状数）、cache_size、hits、misses、hit_rate
+    """
+    result = statements.get_stats()
+    result["shapes"] = len(_parking_records_queries)
+    result["cache_size"] = STATEMENT_CACHE_SIZE
+    return result
+
+
+@contextmanager
+def use_site(site: Optional[str]):
+    """
+    在当前上下文（线程/协程）内把数据库调用路由到指定站点（显式指定了数据库目标时不生效）
+    
+    Args:
+        site: 站点ID，为None时使用单库
+    """
+    token = _current_site.set(site)
+    try:
+        yield
+    finally:
+        _current_site.reset(token)
+
+
+def set_default_site(site: Optional[str] = None) -> None:
+    """
+    设置进程默认站点（未通过 use_site 指定站点的调用都使用它）
+    
+    Args:
+        site: 站点ID，为None时使用单库
+    """
+    global _default_site
+    _default_site = site
+
+
+def use_site_directory(path: Optional[str] = None) -> None:
+    """
+    切换站点数据库所在目录
+    
+    Args:
+        path: 目录路径，为None时恢复使用 cfg.SITE_DB_DIR
+    """
+    global _site_dir
+    
+    _site_dir = path
+    _invalidate_readers()
+    for site in [site for site in _resident_plate_filters if site is not None]:
+        del _resident_plate_filters[site]
+    for site in [site for site in _resident_plate_indexes if site is not None]:
+        del _resident_plate_indexes[site]
+
+
+def init_sites(sites: Optional[List[str]] = None) -> None:
+    """
+    初始化各站点的数据库
+    
+    Args:
+        sites: 站点ID列表（可选），默认使用 cfg.SITE_IDS
+    """
+    os.makedirs(_site_dir or cfg.SITE_DB_DIR, exist_ok=True)
+    for site in sites or cfg.SITE_IDS:
+        with use_site(site):
+            init_db()
+
+
+def run_on_sites(func: Callable, *args, sites: Optional[List[str]] = None, **kwargs) -> Dict[str, Any]:
+    """
+    在多个站点上并行执行同一个数据库函数
+    
+    Args:
+        func: 数据库函数（如 get_revenue_statistics）
+        *args: 位置参数
+        sites: 站点ID列表（可选），默认使用 cfg.SITE_IDS
+        **kwargs: 关键字参数
+        
+    Returns:
+        Dict[str, Any]: 站点ID -> 函数返回值
+    """
+    sites = list(sites or cfg.SITE_IDS)
+    if not sites:
+        return {}
+    
+    def call(site):
+        with use_site(site):
+            return func(*args, **kwargs)
+    
+    # 每个站点是独立的数据库文件，查询之间没有锁竞争
+    with ThreadPoolExecutor(max_workers=min(len(sites), cfg.SITE_FANOUT_WORKERS)) as pool:
+        results = list(pool.map(call, sites))
+    return dict(zip(sites, results))
+
+
+def set_connection_factory(factory: Optional[type] = None) -> None:
+    """
+    设置创建数据库连接所用的连接类
+    
+    Args:
+        factory: sqlite3.Connection 的子类，为None时恢复默认
+    """
+    global _connection_factory
+    _connection_factory = factory or sqlite3.Connection
+    _invalidate_readers()
+
+
+def _begin_write(conn: sqlite3.Connection) -> None:
+    """
+    开启写事务并立即获取写锁，等待写锁的时间计入性能统计
+    
+    Args:
+        conn: 数据库连接
+    """
+    if not metrics.is_enabled():
+        conn.execute("BEGIN IMMEDIATE")
+        return
+    start = time.perf_counter()
+    conn.execute("BEGIN IMMEDIATE")
+    metrics.record_lock_wait(time.perf_counter() - start)
+
+
+def _reset_target() -> None:
+    """
+    释放当前数据库目标持有的资源
+    """
+    global _db_path, _db_uri, _memory_keeper
+    
+    if _memory_keeper is not None:
+        _memory_keeper.close()
+        _memory_keeper = None
+    _db_path = None
+    _db_uri = None
+    # 过滤器和索引属于旧数据库，切换后需重新构建
+    _resident_plate_filters.pop(None, None)
+    _resident_plate_indexes.pop(None, None)
+    _invalidate_readers()
+
+
+def use_database(path: Optional[str] = None) -> None:
+    """
+    切换到指定的数据库文件
+    
+    Args:
+        path: 数据库文件路径，为None时恢复使用 cfg.DB_PATH
+    """
+    global _db_path
+    
+    _reset_target()
+    _db_path = path
+
+
+def use_memory_database(name: str = "parking_sandbox") -> None:
+    """
+    切换到共享缓存的内存数据库（沙箱模式，用于测试和模拟）
+    同一进程内的所有连接共享同一份数据，不会读写磁盘
+    
+    Args:
+        name: 内存库名称，不同名称的内存库互相隔离
+    """
+    global _db_uri, _memory_keeper
+    
+    _reset_target()
+    _db_uri = f"file:{name}?mode=memory&cache=shared"
+    _memory_keeper = sqlite3.connect(_db_uri, uri=True)
+
+
+def snapshot_database() -> sqlite3.Connection:
+    """
+    使用SQLite备份API把当前数据库复制到一个私有内存库中
+    
+    Returns:
+        sqlite3.Connection: 保存快照的内存连接，由调用方负责关闭
+    """
+    snapshot = sqlite3.connect(":memory:")
+    conn = _connect()
+    conn.backup(snapshot)
+    conn.close()
+    return snapshot
+
+
+def restore_database(snapshot: sqlite3.Connection) -> None:
+    """
+    使用SQLite备份API把快照内容覆盖回当前数据库
+    
+    Args:
+        snapshot: snapshot_database 返回的快照连接
+    """
+    conn = _connect()
+    snapshot.backup(conn)
+    conn.close()
+    
+    # 居民数据已整体替换，重建过滤器
+    load_resident_plate_filter()
+    _reset_resident_plate_index()
+
+
+def _restore_from_file(path: str) -> None:
+    """
+    用快照文件整体覆盖当前数据库（SQLite备份API，快照须通过完整性校验）
+    
+    Args:
+        path: 快照文件路径
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"快照文件不存在：{path}")
+    source = sqlite3.connect(path)
+    try:
+        try:
+            result = source.execute("PRAGMA integrity_check").fetchone()[0]
+        except sqlite3.DatabaseError as e:
+            result = str(e)
+        if result != "ok":
+            raise ValueError(f"快照文件校验失败：{path}（{result}）")
+        conn = _connect()
+        source.backup(conn)
+        conn.close()
+    finally:
+        source.close()
+    
+    # 居民数据已整体替换，模糊匹配索引需重建（过滤器在 init_db 末尾重建）
+    _reset_resident_plate_index()
+
+
+@metrics.instrument
+def init_db(restore_from: Optional[str] = None) -> None:
     """
     初始化数据库
     创建所需的表结构并设置默认管理员账号
+    
+    Args:
+        restore_from: 快照文件路径（可选），指定时先用快照覆盖当前数据库再初始化
     """
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    if restore_from:
+        _restore_from_file(restore_from)
+    
+    conn = _connect()
+    try:
+        cursor = conn.cursor()
+        
+        # 创建居民表
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS residents (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            id_card TEXT NOT NULL,
+            phone TEXT UNIQUE NOT NULL,
+            plate TEXT UNIQUE NOT NULL,
+            address TEXT NOT NULL,
+            balance REAL DEFAULT 0.0,
+            birth_date TEXT NOT NULL,
+            plate_key TEXT -- 规范化车牌号，所有按车牌的查询都使用它
+        )
+        ''')
+        
+        # 创建停车记录表
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS parking_records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            plate TEXT NOT NULL,
+            phone TEXT,
+            entry_time TEXT NOT NULL,
+            exit_time TEXT,
+            type TEXT NOT NULL, -- 'resident' 或 'visitor'
+            fee REAL DEFAULT 0.0,
+            plate_key TEXT -- 规范化车牌号
+        )
+        ''')
+        
+        # 创建管理员表
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS admins (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL
+        )
+        ''')
+        
+        # 创建车位占用计数表：zone 为 'total' 或车辆类型
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS lot_occupancy (
+            zone TEXT PRIMARY KEY,
+            capacity INTEGER NOT NULL,
+            occupied INTEGER NOT NULL DEFAULT 0
+        )
+        ''')
+        
+        # 检查是否已存在管理员账号
+        cursor.execute("SELECT * FROM admins WHERE username = ?", (DEFAULT_ADMIN_USERNAME,))
+        if not cursor.fetchone():
+            # 创建默认管理员账号
+            hashed_password = hashlib.sha256(DEFAULT_ADMIN_PASSWORD.encode()).hexdigest()
+            cursor.execute(
+                "INSERT INTO admins (username, password) VALUES (?, ?)",
+                (DEFAULT_ADMIN_USERNAME, hashed_password)
+            )
+        
+        # 按配置同步车位容量，并按在场记录重新校准占用数
+        _sync_lot_occupancy(cursor)
+        
+        conn.commit()
+        
+        # 执行尚未执行的结构版本迁移：规范化车牌、居民搜索、事件日志、停车汇总、变更数据捕获等，
+        # 需要回填的迁移分批执行
+        migrations.migrate(conn, SCHEMA_MIGRATIONS)
+        
+        # 迁移时因重复在场记录退化为普通索引的，重复记录处理后重新尝试建立唯一索引
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'idx_parking_records_open_plate_key'")
+        if cursor.fetchone():
+            _begin_write(conn)
+            _create_parking_plate_key_indexes(cursor)
+            conn.commit()
+    finally:
+        conn.close()
+    
+    # 构建居民车牌过滤器
+    load_resident_plate_filter()
+
+
+def _lot_zones() -> Dict[str, int]:
+    """
+    获取配置的车位分区及容量，未配置容量的分区不限制
+    
+    Returns:
+        Dict[str, int]: 分区 -> 容量
+    """
+    zones = {} if LOT_CAPACITY is None else {'total': LOT_CAPACITY}
+    zones.update(LOT_CAPACITY_BY_TYPE)
+    return zones
+
+
+def _sync_lot_occupancy(cursor: sqlite3.Cursor) -> None:
+    """
+    按配置写入各分区容量，并从停车记录重新统计占用数（仅初始化时全表统计一次）
+    
+    Args:
+        cursor: 数据库游标
+    """
+    zones = _lot_zones()
+    placeholders = ", ".join("?" for _ in zones)
+    cursor.execute(f"DELETE FROM lot_occupancy WHERE zone NOT IN ({placeholders})", list(zones))
+    for zone, capacity in zones.items():
+        cursor.execute(
+            """
+            INSERT INTO lot_occupancy (zone, capacity, occupied) VALUES (?, ?, 0)
+            ON CONFLICT(zone) DO UPDATE SET capacity = excluded.capacity
+            """,
+            (zone, capacity)
+        )
+    cursor.execute(
+        """
+        UPDATE lot_occupancy SET occupied = (
+            SELECT COUNT(*) FROM parking_records
+            WHERE exit_time IS NULL
+              AND (lot_occupancy.zone = 'total' OR parking_records.type = lot_occupancy.zone)
+        )
+        """
+    )
+
+
+def _create_resident_search_index(cursor: sqlite3.Cursor) -> None:
+    """
+    创建居民全文搜索表（FTS5三元组分词，支持任意子串匹配）及同步触发器
+    SQLite未编译FTS5时跳过，搜索自动退化为前缀查询
+    外部内容FTS表必须与同步触发器同时就绪，已有居民只能整体 rebuild 而不能分批写入
+    （居民数量有限，单个事务即可完成）
+    
+    Args:
+        cursor: 数据库游标
+    """
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_residents_name ON residents(name)")
+    
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'residents_fts'")
+    if cursor.fetchone():
+        return
+    
+    try:
+        cursor.execute('''
+        CREATE VIRTUAL TABLE residents_fts USING fts5(
+            name, phone, plate, address,
+            content='residents', content_rowid='id', tokenize='trigram'
+        )
+        ''')
+    except sqlite3.OperationalError:
+        return
     
-    # 创建居民表
     cursor.execute('''
-    CREATE TABLE IF NOT EXISTS residents (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        id_card TEXT NOT NULL,
-        phone TEXT UNIQUE NOT NULL,
-        plate TEXT UNIQUE NOT NULL,
-        address TEXT NOT NULL,
-        balance REAL DEFAULT 0.0,
-        birth_date TEXT NOT NULL
+    CREATE TRIGGER IF NOT EXISTS residents_fts_insert AFTER INSERT ON residents BEGIN
+        INSERT INTO residents_fts (rowid, name, phone, plate, address)
+        VALUES (new.id, new.name, new.phone, new.plate, new.address);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS residents_fts_delete AFTER DELETE ON residents BEGIN
+        INSERT INTO residents_fts (residents_fts, rowid, name, phone, plate, address)
+        VALUES ('delete', old.id, old.name, old.phone, old.plate, old.address);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS residents_fts_update AFTER UPDATE OF name, phone, plate, address ON residents BEGIN
+        INSERT INTO residents_fts (residents_fts, rowid, name, phone, plate, address)
+        VALUES ('delete', old.id, old.name, old.phone, old.plate, old.address);
+        INSERT INTO residents_fts (rowid, name, phone, plate, address)
+        VALUES (new.id, new.name, new.phone, new.plate, new.address);
+    END
+    ''')
+    
+    # 为已有居民建立索引
+    cursor.execute("INSERT INTO residents_fts (residents_fts) VALUES ('rebuild')")
+
+
+def _create_resident_parking_stats(cursor: sqlite3.Cursor) -> None:
+    """
+    创建居民停车汇总表（停车次数、累计费用、最近离场时间），结算时增量维护
+    已有记录的汇总由迁移分批回填（见 _backfill_resident_parking_stats）
+    
+    Args:
+        cursor: 数据库游标
+    """
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_parking_records_phone_entry "
+        "ON parking_records(phone, entry_time)"
+    )
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS resident_parking_stats (
+        phone TEXT PRIMARY KEY,
+        visits INTEGER NOT NULL DEFAULT 0,
+        total_fee REAL NOT NULL DEFAULT 0.0,
+        last_visit TEXT -- 最近一次离场时间
     )
     ''')
+
+
+def _batch_end(cursor: sqlite3.Cursor, table: str, last_id: int, batch_size: int) -> Optional[int]:
+    """
+    分批回填时确定本批的ID上界
+    
+    Args:
+        cursor: 数据库游标
+        table: 表名
+        last_id: 上一批最后的ID
+        batch_size: 批大小
+    
+    Returns:
+        Optional[int]: 本批最后的ID，没有更多数据时返回None
+    """
+    cursor.execute(
+        f"SELECT MAX(id) FROM (SELECT id FROM {table} WHERE id > ? ORDER BY id LIMIT ?)",
+        (last_id, batch_size)
+    )
+    return cursor.fetchone()[0]
+
+
+def _backfill_resident_parking_stats(cursor: sqlite3.Cursor, last_id: int, batch_size: int) -> Optional[int]:
+    """
+    分批回填居民停车汇总：本批停车记录涉及的手机号按其全部已结算记录重新汇总
+    重新汇总与结算时的增量维护互不冲突，重复执行结果不变
+    
+    Args:
+        cursor: 数据库游标
+        last_id: 上一批最后的停车记录ID
+        batch_size: 批大小
+    
+    Returns:
+        Optional[int]: 本批最后的停车记录ID，没有更多数据时返回None
+    """
+    end = _batch_end(cursor, "parking_records", last_id, batch_size)
+    if end is None:
+        return None
+    cursor.execute(
+        """
+        INSERT OR REPLACE INTO resident_parking_stats (phone, visits, total_fee, last_visit)
+        SELECT phone, COUNT(*), COALESCE(SUM(fee), 0.0), MAX(exit_time)
+        FROM parking_records
+        WHERE exit_time IS NOT NULL AND phone IN (
+            SELECT phone FROM parking_records
+            WHERE id > ? AND id <= ? AND phone IS NOT NULL AND exit_time IS NOT NULL
+        )
+        GROUP BY phone
+        """,
+        (last_id, end)
+    )
+    return end
+
+
+# 事件类型
+EVENT_ENTRY = 'entry'
+EVENT_EXIT = 'exit'
+EVENT_DEBIT = 'debit'
+EVENT_RECHARGE = 'recharge'
+
+
+def _create_event_log(cursor: sqlite3.Cursor) -> None:
+    """
+    创建只追加的事件日志表，所有状态变更在同一事务内写入一条事件
+    已有数据的期初事件由迁移分批写入（见 _seed_record_events、_seed_balance_events），
+    保证从日志重放得到的结果与现有数据一致
     
-    # 创建停车记录表
+    Args:
+        cursor: 数据库游标
+    """
     cursor.execute('''
-    CREATE TABLE IF NOT EXISTS parking_records (
+    CREATE TABLE IF NOT EXISTS events (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
-        plate TEXT NOT NULL,
-        phone TEXT,
-        entry_time TEXT NOT NULL,
-        exit_time TEXT,
-        type TEXT NOT NULL, -- 'resident' 或 'visitor'
-        fee REAL DEFAULT 0.0
+        kind TEXT NOT NULL, -- 'entry'、'exit'、'debit' 或 'recharge'
+        event_time TEXT NOT NULL,
+        record_id INTEGER, -- 进出场事件对应的停车记录
+        resident_id INTEGER, -- 余额事件对应的居民
+        zone TEXT, -- 进出场车辆类型
+        amount REAL NOT NULL DEFAULT 0.0 -- 出场为停车费，余额事件为变动金额（扣款为负）
     )
     ''')
+    # 事件只允许追加
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS events_no_update BEFORE UPDATE ON events BEGIN
+        SELECT RAISE(ABORT, 'events is append-only');
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS events_no_delete BEFORE DELETE ON events BEGIN
+        SELECT RAISE(ABORT, 'events is append-only');
+    END
+    ''')
+
+
+def _seed_record_events(cursor: sqlite3.Cursor, last_id: int, batch_size: int) -> Optional[int]:
+    """
+    分批为已有停车记录写入期初进出场事件，已有对应事件的跳过
+    回填期间照常入场、结算产生的事件不会重复写入，重复执行结果不变
+    
+    Args:
+        cursor: 数据库游标
+        last_id: 上一批最后的停车记录ID
+        batch_size: 批大小
+    
+    Returns:
+        Optional[int]: 本批最后的停车记录ID，没有更多数据时返回None
+    """
+    end = _batch_end(cursor, "parking_records", last_id, batch_size)
+    if end is None:
+        return None
+    cursor.execute(
+        """
+        INSERT INTO events (kind, event_time, record_id, zone)
+        SELECT 'entry', entry_time, id, type FROM parking_records p
+        WHERE id > ? AND id <= ?
+          AND NOT EXISTS (SELECT 1 FROM events e WHERE e.record_id = p.id AND e.kind = 'entry')
+        ORDER BY id
+        """,
+        (last_id, end)
+    )
+    cursor.execute(
+        """
+        INSERT INTO events (kind, event_time, record_id, zone, amount)
+        SELECT 'exit', exit_time, id, type, COALESCE(fee, 0.0) FROM parking_records p
+        WHERE id > ? AND id <= ? AND exit_time IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM events e WHERE e.record_id = p.id AND e.kind = 'exit')
+        ORDER BY id
+        """,
+        (last_id, end)
+    )
+    return end
+
+
+def _seed_balance_events(cursor: sqlite3.Cursor, last_id: int, batch_size: int) -> Optional[int]:
+    """
+    分批为居民写入期初余额事件：金额为当前余额与已有余额事件合计之差（按分比较）
+    回填期间照常充值、扣款产生的事件已计入合计，重复执行结果不变
+    
+    Args:
+        cursor: 数据库游标
+        last_id: 上一批最后的居民ID
+        batch_size: 批大小
     
-    # 创建管理员表
+    Returns:
+        Optional[int]: 本批最后的居民ID，没有更多数据时返回None
+    """
+    end = _batch_end(cursor, "residents", last_id, batch_size)
+    if end is None:
+        return None
+    cursor.execute(
+        """
+        INSERT INTO events (kind, event_time, resident_id, amount)
+        SELECT CASE WHEN delta > 0 THEN 'recharge' ELSE 'debit' END, ?, id, delta
+        FROM (
+            SELECT r.id, r.balance - COALESCE(
+                (SELECT SUM(amount) FROM events e WHERE e.resident_id = r.id), 0.0) AS delta
+            FROM residents r
+            WHERE r.id > ? AND r.id <= ?
+        )
+        WHERE ABS(delta) >= 0.005
+        ORDER BY id
+        """,
+        (datetime.now().strftime(TIME_FORMAT), last_id, end)
+    )
+    return end
+
+
+def _prepare_record_events(cursor: sqlite3.Cursor) -> None:
+    """
+    迁移的结构变更：创建事件日志，并为期初事件查重建立临时索引（回填完成后删除）
+    
+    Args:
+        cursor: 数据库游标
+    """
+    _create_event_log(cursor)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_events_seed_record ON events(record_id, kind)")
+
+
+def _create_change_feed(cursor: sqlite3.Cursor) -> None:
+    """
+    创建变更表及触发器：停车记录和居民的增删改由触发器写入 changes 表，
+    seq 单调递增，外部系统按 seq 游标增量读取（见 src.database.cdc）
+    
+    Args:
+        cursor: 数据库游标
+    """
     cursor.execute('''
-    CREATE TABLE IF NOT EXISTS admins (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        password TEXT NOT NULL
+    CREATE TABLE IF NOT EXISTS changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        table_name TEXT NOT NULL,
+        op TEXT NOT NULL, -- 'insert'、'update' 或 'delete'
+        row_id INTEGER NOT NULL,
+        payload TEXT NOT NULL, -- 变更后（删除时为删除前）的行数据，JSON格式
+        changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now', 'localtime'))
     )
     ''')
     
-    # 检查是否已存在管理员账号
-    cursor.execute("SELECT * FROM admins WHERE username = ?", (DEFAULT_ADMIN_USERNAME,))
-    if not cursor.fetchone():
-        # 创建默认管理员账号
-        hashed_password = hashlib.sha256(DEFAULT_ADMIN_PASSWORD.encode()).hexdigest()
+    record_json = ("json_object('plate', {0}.plate, 'phone', {0}.phone, 'entry_time', {0}.entry_time, "
+                   "'exit_time', {0}.exit_time, 'type', {0}.type, 'fee', {0}.fee)")
+    resident_json = ("json_object('name', {0}.name, 'phone', {0}.phone, 'plate', {0}.plate, "
+                     "'balance', {0}.balance)")
+    triggers = [
+        ("cdc_parking_records_insert", "INSERT", "parking_records", "insert", record_json.format("new"), "new"),
+        # 只关注结算，回填 plate_key 等内部列的更新不产生变更
+        ("cdc_parking_records_update", "UPDATE OF exit_time, fee", "parking_records", "update",
+         record_json.format("new"), "new"),
+        ("cdc_residents_insert", "INSERT", "residents", "insert", resident_json.format("new"), "new"),
+        ("cdc_residents_update", "UPDATE OF name, phone, plate, balance", "residents", "update",
+         resident_json.format("new"), "new"),
+        ("cdc_residents_delete", "DELETE", "residents", "delete", resident_json.format("old"), "old"),
+    ]
+    for name, event, table, op, payload, row in triggers:
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON {table} BEGIN
+            INSERT INTO changes (table_name, op, row_id, payload)
+            VALUES ('{table}', '{op}', {row}.id, {payload});
+        END
+        ''')
+
+
+def _append_event(
+    cursor: sqlite3.Cursor,
+    kind: str,
+    event_time: str,
+    record_id: Optional[int] = None,
+    resident_id: Optional[int] = None,
+    zone: Optional[str] = None,
+    amount: float = 0.0
+) -> None:
+    """
+    在调用方的写事务内追加一条事件
+    
+    Args:
+        cursor: 数据库游标
+        kind: 事件类型
+        event_time: 事件时间
+        record_id: 停车记录ID（可选）
+        resident_id: 居民ID（可选）
+        zone: 车辆类型（可选）
+        amount: 金额
+    """
+    cursor.execute(
+        """
+        INSERT INTO events (kind, event_time, record_id, resident_id, zone, amount)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        (kind, event_time, record_id, resident_id, zone, amount)
+    )
+
+
+def _add_plate_key_column(table: str) -> Callable[[sqlite3.Cursor], None]:
+    """
+    生成迁移的结构变更函数：旧数据库的表补充 plate_key 列
+    
+    Args:
+        table: 表名
+        
+    Returns:
+        Callable: 结构变更函数
+    """
+    def prepare(cursor: sqlite3.Cursor) -> None:
+        cursor.execute(f"PRAGMA table_info({table})")
+        if "plate_key" not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN plate_key TEXT")
+    
+    return prepare
+
+
+def _backfill_plate_keys(table: str) -> Callable[[sqlite3.Cursor, int, int], Optional[int]]:
+    """
+    生成迁移的分批回填函数：按ID顺序为未回填的行写入规范化车牌号
+    
+    Args:
+        table: 表名
+        
+    Returns:
+        Callable: 分批回填函数
+    """
+    def step(cursor: sqlite3.Cursor, last_id: int, batch_size: int) -> Optional[int]:
         cursor.execute(
-            "INSERT INTO admins (username, password) VALUES (?, ?)",
-            (DEFAULT_ADMIN_USERNAME, hashed_password)
+            f"SELECT id, plate FROM {table} WHERE id > ? AND plate_key IS NULL ORDER BY id LIMIT ?",
+            (last_id, batch_size)
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            return None
+        cursor.executemany(
+            f"UPDATE {table} SET plate_key = ? WHERE id = ?",
+            [(normalize_plate(plate), row_id) for row_id, plate in rows]
         )
+        return rows[-1][0]
+    
+    return step
+
+
+def _create_resident_plate_key_index(cursor: sqlite3.Cursor) -> None:
+    """
+    建立居民规范化车牌索引
+    居民车牌规范化后唯一；历史数据若存在仅写法不同的重复车牌，退化为普通索引
+    """
+    try:
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_residents_plate_key ON residents(plate_key)")
+    except sqlite3.IntegrityError:
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_residents_plate_key_dup ON residents(plate_key)")
+
+
+def _create_parking_plate_key_indexes(cursor: sqlite3.Cursor) -> None:
+    """
+    建立停车记录的规范化车牌索引
+    同一车牌最多一条在场记录：部分唯一索引既保证约束，也供在场记录查询使用；
+    历史数据若已有重复的在场记录，退化为普通部分索引，入场时改为事务内先查后插
+    """
+    try:
+        cursor.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_parking_records_open_plate_key_unique "
+            "ON parking_records(plate_key) WHERE exit_time IS NULL"
+        )
+        cursor.execute("DROP INDEX IF EXISTS idx_parking_records_open_plate_key")
+    except sqlite3.IntegrityError:
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_parking_records_open_plate_key "
+            "ON parking_records(plate_key) WHERE exit_time IS NULL"
+        )
+    # 历史记录按车牌+时间查询
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_parking_records_plate_key_entry "
+        "ON parking_records(plate_key, entry_time)"
+    )
+
+
+# 结构版本迁移（按版本号依次执行，见 src.database.migrations）
+# 新的列、索引和数据回填在此追加新版本，不要修改已发布的版本
+SCHEMA_MIGRATIONS = [
+    Migration(1, "居民表规范化车牌列",
+              prepare=_add_plate_key_column("residents"),
+              step=_backfill_plate_keys("residents"),
+              finish=_create_resident_plate_key_index),
+    Migration(2, "停车记录规范化车牌列",
+              prepare=_add_plate_key_column("parking_records"),
+              step=_backfill_plate_keys("parking_records"),
+              finish=_create_parking_plate_key_indexes),
+    # 收入统计、导出和分析快照都按进场时间范围过滤
+    Migration(3, "停车记录进场时间索引",
+              finish=lambda cursor: cursor.execute(
+                  "CREATE INDEX IF NOT EXISTS idx_parking_records_entry_time ON parking_records(entry_time)"
+              )),
+    Migration(4, "居民全文搜索",
+              prepare=_create_resident_search_index),
+    # 期初事件按记录、居民查重，回填期间使用临时索引，完成后删除
+    Migration(5, "事件日志及期初进出场事件",
+              prepare=_prepare_record_events,
+              step=_seed_record_events,
+              finish=lambda cursor: cursor.execute("DROP INDEX IF EXISTS idx_events_seed_record")),
+    Migration(6, "事件日志期初余额",
+              prepare=lambda cursor: cursor.execute(
+                  "CREATE INDEX IF NOT EXISTS idx_events_seed_resident ON events(resident_id)"
+              ),
+              step=_seed_balance_events,
+              finish=lambda cursor: cursor.execute("DROP INDEX IF EXISTS idx_events_seed_resident")),
+    Migration(7, "居民停车汇总",
+              prepare=_create_resident_parking_stats,
+              step=_backfill_resident_parking_stats),
+    Migration(8, "变更数据捕获",
+              prepare=_create_change_feed),
+]
+
+
+@metrics.instrument
+def load_resident_plate_filter() -> None:
+    """
+    从residents表加载全部车牌，重建内存中的居民车牌过滤器
+    注意：过滤器只感知本进程内的注册，其他进程新注册的居民需重新加载
+    """
+    conn = _connect()
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT COUNT(*) FROM residents")
+    resident_count = cursor.fetchone()[0]
+    
+    # 预留一倍余量，保证后续注册不会让误判率迅速上升
+    plate_filter = BloomFilter(
+        max(RESIDENT_PLATE_FILTER_CAPACITY, resident_count * 2),
+        RESIDENT_PLATE_FILTER_ERROR_RATE
+    )
+    cursor.execute("SELECT plate_key FROM residents")
+    while True:
+        rows = cursor.fetchmany(10000)
+        if not rows:
+            break
+        plate_filter.update(row[0] for row in rows)
     
-    conn.commit()
     conn.close()
+    _resident_plate_filters[current_site()] = plate_filter
 
 
-def register_resident(
+@metrics.instrument
+def is_possible_resident_plate(plate: str) -> bool:
+    """
+    快速判断车牌是否可能属于居民（不访问数据库）
+    
+    Args:
+        plate: 车牌号
+        
+    Returns:
+        bool: False表示一定不是居民车牌，True表示可能是（需查库确认）
+    """
+    plate_filter = _resident_plate_filters.get(current_site())
+    if plate_filter is None:
+        return True
+    return plate_filter.might_contain(normalize_plate(plate))
+
+
+@_routed_write
+def _insert_resident(
     name: str,
     phone: str,
     plate: str,
@@ -76,9 +1093,9 @@ def register_resident(
     balance: float,
     id_card: str,
     birth_date: str
-) -> bool:
+) -> int:
     """
-    注册新居民
+    写入新居民记录（可由单写进程执行）
     
     Args:
         name: 姓名
@@ -90,30 +1107,75 @@ def register_resident(
         birth_date: 出生日期
         
     Returns:
-        bool: 注册结果
+        int: 居民ID，手机号或车牌号已存在时返回0
     """
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = _connect()
         cursor = conn.cursor()
+        _begin_write(conn)
         
+        plate_key = normalize_plate(plate)
         cursor.execute(
             """
             INSERT INTO residents 
-            (name, id_card, phone, plate, address, balance, birth_date)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
+            (name, id_card, phone, plate, address, balance, birth_date, plate_key)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             """,
-            (name, id_card, phone, plate, address, balance, birth_date)
+            (name, id_card, phone, plate, address, balance, birth_date, plate_key)
         )
         
+        resident_id = cursor.lastrowid
+        if balance:
+            _append_event(cursor, EVENT_RECHARGE if balance > 0 else EVENT_DEBIT,
+                          datetime.now().strftime(TIME_FORMAT), resident_id=resident_id, amount=balance)
         conn.commit()
         conn.close()
-        return True
+        return resident_id
     except sqlite3.IntegrityError:
         # 手机号或车牌号已存在
         conn.close()
+        return 0
+
+
+@metrics.instrument
+def register_resident(
+    name: str,
+    phone: str,
+    plate: str,
+    address: str,
+    balance: float,
+    id_card: str,
+    birth_date: str
+) -> bool:
+    """
+    注册新居民
+    
+    Args:
+        name: 姓名
+        phone: 手机号
+        plate: 车牌号
+        address: 地址
+        balance: 余额
+        id_card: 身份证号
+        birth_date: 出生日期
+        
+    Returns:
+        bool: 注册结果
+    """
+    resident_id = _insert_resident(name, phone, plate, address, balance, id_card, birth_date)
+    if not resident_id:
         return False
+    
+    # 写入可能发生在单写进程中，进程内的过滤器和索引在这里更新
+    site = current_site()
+    if site in _resident_plate_filters:
+        _resident_plate_filters[site].add(normalize_plate(plate))
+    if site in _resident_plate_indexes:
+        _resident_plate_indexes[site].add(resident_id, plate)
+    return True
 
 
+@metrics.instrument
 def get_resident_by_phone(phone: str) -> Optional[Dict]:
     """
     根据手机号获取居民信息
@@ -124,7 +1186,7 @@ def get_resident_by_phone(phone: str) -> Optional[Dict]:
     Returns:
         Dict: 居民信息，不存在则返回None
     """
-    conn = sqlite3.connect(DB_PATH)
+    conn = _connect()
     conn.row_factory = sqlite3.Row  # 使返回结果可以通过列名访问
     cursor = conn.cursor()
     
@@ -138,6 +1200,7 @@ def get_resident_by_phone(phone: str) -> Optional[Dict]:
     return None
 
 
+@metrics.instrument
 def get_resident_by_plate(plate: str) -> Optional[Dict]:
     """
     根据车牌号获取居民信息
@@ -148,20 +1211,131 @@ def get_resident_by_plate(plate: str) -> Optional[Dict]:
     Returns:
         Dict: 居民信息，不存在则返回None
     """
-    conn = sqlite3.connect(DB_PATH)
+    # 过滤器判定一定不是居民车牌时直接返回，省去一次数据库往返
+    if not is_possible_resident_plate(plate):
+        return None
+    
+    conn = _connect()
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
-    cursor.execute("SELECT * FROM residents WHERE plate = ?", (plate,))
+    cursor.execute("SELECT * FROM residents WHERE plate_key = ?", (normalize_plate(plate),))
     row = cursor.fetchone()
     
     conn.close()
     
-    if row:
-        return dict(row)
-    return None
+    if row:
+        return dict(row)
+    return None
+
+
+# enter_vehicle 的入场结果
+ENTRY_CREATED = 'created'
+ENTRY_EXISTS = 'exists'
+ENTRY_FULL = 'full'
+
+
+@metrics.instrument
+@_routed_write
+def enter_vehicle(
+    plate: str,
+    phone: Optional[str],
+    entry_time: str,
+    record_type: str
+) -> Tuple[int, str]:
+    """
+    车辆入场：在一个写事务内完成"已在场检查 + 占用车位 + 创建记录"
+    依赖在场记录的部分唯一索引，插入与已在场判断由一条语句完成，并发入场不会产生重复记录
+    
+    Args:
+        plate: 车牌号
+        phone: 手机号
+        entry_time: 进场时间
+        record_type: 记录类型 ('resident' 或 'visitor')
+        
+    Returns:
+        Tuple[int, str]: (记录ID, 结果)
+            结果为 ENTRY_CREATED 时记录ID为新记录；
+            为 ENTRY_EXISTS 时记录ID为已有的在场记录；
+            为 ENTRY_FULL 时记录ID为0
+    """
+    plate_key = normalize_plate(plate)
+    conn = _connect()
+    cursor = conn.cursor()
+    _begin_write(conn)
+    
+    try:
+        cursor.execute(
+            """
+            INSERT INTO parking_records 
+            (plate, phone, entry_time, type, plate_key)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (plate_key) WHERE exit_time IS NULL DO NOTHING
+            RETURNING id
+            """,
+            (plate, phone, entry_time, record_type, plate_key)
+        )
+        row = cursor.fetchone()
+    except sqlite3.OperationalError as exc:
+        # 只有缺少唯一索引（ON CONFLICT 找不到对应约束）才退化，锁超时等其他错误照常抛出
+        if "ON CONFLICT clause does not match" not in str(exc):
+            conn.rollback()
+            conn.close()
+            raise
+        # 旧数据库存在重复在场记录、未能建立唯一索引时，在同一写事务内先查后插
+        cursor.execute(
+            "SELECT 1 FROM parking_records WHERE plate_key = ? AND exit_time IS NULL LIMIT 1",
+            (plate_key,)
+        )
+        if cursor.fetchone():
+            row = None
+        else:
+            cursor.execute(
+                """
+                INSERT INTO parking_records 
+                (plate, phone, entry_time, type, plate_key)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (plate, phone, entry_time, record_type, plate_key)
+            )
+            row = (cursor.lastrowid,)
+    
+    if row is None:
+        cursor.execute(
+            """
+            SELECT id FROM parking_records 
+            WHERE plate_key = ? AND exit_time IS NULL 
+            ORDER BY entry_time DESC LIMIT 1
+            """,
+            (plate_key,)
+        )
+        existing_id = cursor.fetchone()[0]
+        conn.rollback()
+        conn.close()
+        return existing_id, ENTRY_EXISTS
+    
+    # 在同一写事务内占用车位：总车位和该类型车位都有空余才能入场，否则连同新记录一起回滚
+    cursor.execute(
+        """
+        UPDATE lot_occupancy SET occupied = occupied + 1
+        WHERE zone IN ('total', ?) AND occupied < capacity
+        """,
+        (record_type,)
+    )
+    expected_zones = len({'total', record_type} & set(_lot_zones()))
+    if cursor.rowcount < expected_zones:
+        conn.rollback()
+        conn.close()
+        return 0, ENTRY_FULL
+    
+    _append_event(cursor, EVENT_ENTRY, entry_time, record_id=row[0], zone=record_type)
+    conn.commit()
+    conn.close()
+    
+    return row[0], ENTRY_CREATED
 
 
+@metrics.instrument
 def create_parking_record(
     plate: str,
     phone: Optional[str],
@@ -178,27 +1352,80 @@ def create_parking_record(
         record_type: 记录类型 ('resident' 或 'visitor')
         
     Returns:
-        int: 记录ID
+        int: 记录ID，车位已满或车辆已在场时返回0
     """
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    record_id, status = enter_vehicle(plate, phone, entry_time, record_type)
+    return record_id if status == ENTRY_CREATED else 0
+
+
+def _close_record(cursor: sqlite3.Cursor, record_id: int, exit_time: str, fee: float) -> bool:
+    """
+    在调用方的写事务内关闭停车记录，同时释放车位、追加出场事件、累加居民停车汇总
     
+    Args:
+        cursor: 数据库游标
+        record_id: 记录ID
+        exit_time: 出场时间
+        fee: 费用
+        
+    Returns:
+        bool: 记录存在且尚未结算时返回True
+    """
     cursor.execute(
         """
-        INSERT INTO parking_records 
-        (plate, phone, entry_time, type)
-        VALUES (?, ?, ?, ?)
+        UPDATE parking_records 
+        SET exit_time = ?, fee = ? 
+        WHERE id = ? AND exit_time IS NULL
+        RETURNING type, phone
         """,
-        (plate, phone, entry_time, record_type)
+        (exit_time, fee, record_id)
     )
+    row = cursor.fetchone()
+    if row is None:
+        return False
     
-    record_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    record_type, phone = row
+    invalidate_fee_quote(record_id)
+    # 同一事务内释放车位
+    cursor.execute(
+        """
+        UPDATE lot_occupancy SET occupied = MAX(occupied - 1, 0)
+        WHERE zone IN ('total', ?)
+        """,
+        (record_type,)
+    )
+    _append_event(cursor, EVENT_EXIT, exit_time, record_id=record_id, zone=record_type, amount=fee or 0.0)
+    # 同一事务内累加居民停车汇总
+    if phone:
+        _add_resident_visit(cursor, phone, fee, exit_time)
+    return True
+
+
+def _add_resident_visit(cursor: sqlite3.Cursor, phone: str, fee: Optional[float], exit_time: str) -> None:
+    """
+    在调用方的写事务内把一次已结算的停车累加到居民停车汇总
     
-    return record_id
+    Args:
+        cursor: 数据库游标
+        phone: 手机号
+        fee: 费用
+        exit_time: 出场时间
+    """
+    cursor.execute(
+        """
+        INSERT INTO resident_parking_stats (phone, visits, total_fee, last_visit)
+        VALUES (?, 1, ?, ?)
+        ON CONFLICT(phone) DO UPDATE SET
+            visits = visits + 1,
+            total_fee = total_fee + excluded.total_fee,
+            last_visit = MAX(COALESCE(last_visit, ''), excluded.last_visit)
+        """,
+        (phone, fee or 0.0, exit_time)
+    )
 
 
+@metrics.instrument
+@_routed_write
 def close_parking_record(record_id: int, exit_time: str, fee: float) -> bool:
     """
     关闭停车记录（结算）
@@ -212,19 +1439,11 @@ def close_parking_record(record_id: int, exit_time: str, fee: float) -> bool:
         bool: 操作结果
     """
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = _connect()
         cursor = conn.cursor()
+        _begin_write(conn)
         
-        cursor.execute(
-            """
-            UPDATE parking_records 
-            SET exit_time = ?, fee = ? 
-            WHERE id = ? AND exit_time IS NULL
-            """,
-            (exit_time, fee, record_id)
-        )
-        
-        success = cursor.rowcount > 0
+        success = _close_record(cursor, record_id, exit_time, fee)
         conn.commit()
         conn.close()
         
@@ -234,6 +1453,83 @@ def close_parking_record(record_id: int, exit_time: str, fee: float) -> bool:
         return False
 
 
+# settle_vehicle 的结算结果
+SETTLE_OK = 'ok'
+SETTLE_NOT_FOUND = 'not_found'
+SETTLE_INSUFFICIENT = 'insufficient'
+
+
+@metrics.instrument
+@_routed_write
+def settle_vehicle(plate: str, exit_time: str, charge_balance: bool = False) -> Tuple[str, Dict]:
+    """
+    车辆离场结算：在一个写事务内完成"查找在场记录 + 计费 + （居民）扣款 + 关闭记录"
+    
+    Args:
+        plate: 车牌号
+        exit_time: 出场时间
+        charge_balance: 是否从车牌所属居民的余额中扣款
+        
+    Returns:
+        Tuple[str, Dict]: (结果, 详情)
+            结果为 SETTLE_OK 时详情含 record_id、entry_time、fee，扣款时另含 balance；
+            为 SETTLE_INSUFFICIENT 时详情含 fee、balance；
+            为 SETTLE_NOT_FOUND 时详情为空
+    """
+    plate_key = normalize_plate(plate)
+    conn = _connect()
+    cursor = conn.cursor()
+    _begin_write(conn)
+    
+    cursor.execute(
+        """
+        SELECT id, entry_time FROM parking_records 
+        WHERE plate_key = ? AND exit_time IS NULL 
+        ORDER BY entry_time DESC LIMIT 1
+        """,
+        (plate_key,)
+    )
+    row = cursor.fetchone()
+    if row is None:
+        conn.rollback()
+        conn.close()
+        return SETTLE_NOT_FOUND, {}
+    
+    record_id, entry_time = row
+    fee = calc_fee(entry_time, exit_time)
+    result = {'record_id': record_id, 'entry_time': entry_time, 'fee': fee}
+    
+    if charge_balance:
+        # 余额充足时才扣款，判断与扣款由同一条语句完成
+        cursor.execute(
+            """
+            UPDATE residents SET balance = balance - ? 
+            WHERE plate_key = ? AND balance >= ?
+            RETURNING id, balance
+            """,
+            (fee, plate_key, fee)
+        )
+        charged = cursor.fetchone()
+        if charged is None:
+            cursor.execute("SELECT balance FROM residents WHERE plate_key = ?", (plate_key,))
+            balance_row = cursor.fetchone()
+            conn.rollback()
+            conn.close()
+            if balance_row is None:
+                return SETTLE_NOT_FOUND, {}
+            return SETTLE_INSUFFICIENT, {'fee': fee, 'balance': balance_row[0]}
+        resident_id, result['balance'] = charged
+        _append_event(cursor, EVENT_DEBIT, exit_time, resident_id=resident_id, amount=-fee)
+    
+    _close_record(cursor, record_id, exit_time, fee)
+    conn.commit()
+    conn.close()
+    
+    return SETTLE_OK, result
+
+
+@metrics.instrument
+@_routed_write
 def update_resident_balance(resident_id: int, amount: float) -> bool:
     """
     更新居民余额
@@ -246,8 +1542,9 @@ def update_resident_balance(resident_id: int, amount: float) -> bool:
         bool: 操作结果
     """
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = _connect()
         cursor = conn.cursor()
+        _begin_write(conn)
         
         cursor.execute(
             "UPDATE residents SET balance = balance + ? WHERE id = ?",
@@ -255,6 +1552,9 @@ def update_resident_balance(resident_id: int, amount: float) -> bool:
         )
         
         success = cursor.rowcount > 0
+        if success:
+            _append_event(cursor, EVENT_RECHARGE if amount >= 0 else EVENT_DEBIT,
+                          datetime.now().strftime(TIME_FORMAT), resident_id=resident_id, amount=amount)
         conn.commit()
         conn.close()
         
@@ -264,6 +1564,7 @@ def update_resident_balance(resident_id: int, amount: float) -> bool:
         return False
 
 
+@metrics.instrument
 def get_active_parking_record(plate: str) -> Optional[Dict]:
     """
     获取车辆的当前活跃停车记录
@@ -274,17 +1575,17 @@ def get_active_parking_record(plate: str) -> Optional[Dict]:
     Returns:
         Dict: 停车记录，不存在则返回None
     """
-    conn = sqlite3.connect(DB_PATH)
+    conn = _connect()
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
     cursor.execute(
         """
         SELECT * FROM parking_records 
-        WHERE plate = ? AND exit_time IS NULL 
+        WHERE plate_key = ? AND exit_time IS NULL 
         ORDER BY entry_time DESC LIMIT 1
         """,
-        (plate,)
+        (normalize_plate(plate),)
     )
     
     row = cursor.fetchone()
@@ -295,54 +1596,314 @@ def get_active_parking_record(plate: str) -> Optional[Dict]:
     return None
 
 
+@metrics.instrument
+def get_open_parking_records() -> List[Dict]:
+    """
+    获取全部在场（未离场）的停车记录
+    
+    Returns:
+        List[Dict]: 在场记录（id、plate、entry_time、type），按进场时间排序
+    """
+    return _query(
+        "SELECT id, plate, entry_time, type FROM parking_records "
+        "WHERE exit_time IS NULL ORDER BY entry_time",
+        ()
+    )
+
+
+# 停车记录查询的可选过滤条件：参数名 -> 条件
+_PARKING_RECORD_FILTERS = (
+    ("plate", "plate_key = ?"),
+    ("phone", "phone = ?"),
+    ("start_time", "entry_time >= ?"),
+    ("end_time", "entry_time <= ?"),
+    ("record_type", "type = ?"),
+)
+
+
+def _build_parking_records_query(shape: Tuple[Tuple[str, ...], bool]) -> str:
+    """
+    生成停车记录查询的SQL文本
+    
+    Args:
+        shape: (使用的过滤条件名, 是否分页)
+        
+    Returns:
+        str: SQL文本
+    """
+    names, paginated = shape
+    conditions = [condition for name, condition in _PARKING_RECORD_FILTERS if name in names]
+    query = "SELECT * FROM parking_records"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY entry_time DESC"
+    if paginated:
+        query += " LIMIT ? OFFSET ?"
+    return query
+
+
+# 停车记录查询注册表：每种过滤条件组合只生成一次SQL
+_parking_records_queries = QueryRegistry(_build_parking_records_query)
+
+
+@metrics.instrument
 def get_parking_records(plate: Optional[str] = None,
                        start_time: Optional[str] = None,
                        end_time: Optional[str] = None,
-                       record_type: Optional[str] = None) -> List[Dict]:
+                       record_type: Optional[str] = None,
+                       phone: Optional[str] = None,
+                       offset: int = 0,
+                       limit: Optional[int] = None) -> List[Dict]:
     """
     查询停车记录
     
     Args:
         plate: 车牌号（可选）
+        phone: 手机号（可选）
         start_time: 开始时间（可选）
         end_time: 结束时间（可选）
         record_type: 记录类型（可选）
+        offset: 跳过的条数（仅分页时有效）
+        limit: 返回的最大条数（可选），为None时不分页
+        
+    Returns:
+        List[Dict]: 停车记录列表，按进场时间倒序
+    """
+    values = {
+        "plate": normalize_plate(plate) if plate else None,
+        "phone": phone,
+        "start_time": start_time,
+        "end_time": end_time,
+        "record_type": record_type,
+    }
+    names = tuple(name for name, _ in _PARKING_RECORD_FILTERS if values[name])
+    params = [values[name] for name in names]
+    if limit is not None:
+        params += [limit, offset]
+    
+    return _query(_parking_records_queries.get((names, limit is not None)), params)
+
+
+@metrics.instrument
+def get_parking_history(phone: Optional[str] = None,
+                        plate: Optional[str] = None,
+                        offset: int = 0,
+                        limit: int = 20) -> List[Dict]:
+    """
+    分页查询某位居民（按手机号）或某辆车（按车牌号）的停车记录，按进场时间倒序
+    分别使用 (phone, entry_time) 和 (plate_key, entry_time) 索引，无需排序全部历史
+    
+    Args:
+        phone: 手机号（与车牌号二选一）
+        plate: 车牌号（与手机号二选一）
+        offset: 跳过的条数
+        limit: 返回的最大条数
         
     Returns:
         List[Dict]: 停车记录列表
     """
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    if phone:
+        return get_parking_records(phone=phone, offset=offset, limit=limit)
+    if plate:
+        return get_parking_records(plate=plate, offset=offset, limit=limit)
+    return []
+
+
+@metrics.instrument
+def get_resident_parking_stats(phone: str) -> Dict:
+    """
+    获取居民停车汇总（不扫描历史记录）
+    
+    Args:
+        phone: 手机号
+        
+    Returns:
+        Dict: 汇总数据（visits、total_fee、last_visit），无记录时为0
+    """
+    conn = _connect()
     cursor = conn.cursor()
     
-    query = "SELECT * FROM parking_records WHERE 1=1"
-    params = []
+    cursor.execute(
+        "SELECT visits, total_fee, last_visit FROM resident_parking_stats WHERE phone = ?",
+        (phone,)
+    )
+    row = cursor.fetchone()
+    conn.close()
     
-    if plate:
-        query += " AND plate = ?"
-        params.append(plate)
+    if not row:
+        return {"visits": 0, "total_fee": 0.0, "last_visit": None}
+    return {"visits": row[0], "total_fee": row[1], "last_visit": row[2]}
+
+
+@metrics.instrument
+def iter_closed_parking_records(after_id: int = 0,
+                                chunk_size: int = 5000,
+                                start_time: Optional[str] = None,
+                                end_time: Optional[str] = None) -> Iterator[List[Tuple]]:
+    """
+    按ID顺序分批读取已结算的停车记录
+    每批单独查询（按ID键集分页），不会长时间占用读事务
     
+    Args:
+        after_id: 从该ID之后开始读取
+        chunk_size: 每批记录数
+        start_time: 进场开始时间（可选）
+        end_time: 进场结束时间（可选）
+        
+    Yields:
+        List[Tuple]: 一批 (id, plate, entry_time, exit_time, fee) 元组
+    """
+    query = """
+        SELECT id, plate, entry_time, exit_time, fee
+        FROM parking_records
+        WHERE id > ? AND exit_time IS NOT NULL
+    """
+    params = []
     if start_time:
         query += " AND entry_time >= ?"
         params.append(start_time)
-    
     if end_time:
         query += " AND entry_time <= ?"
         params.append(end_time)
+    query += " ORDER BY id LIMIT ?"
     
-    if record_type:
-        query += " AND type = ?"
-        params.append(record_type)
-    
-    query += " ORDER BY entry_time DESC"
+    last_id = after_id
+    while True:
+        conn = _connect()
+        cursor = conn.cursor()
+        cursor.execute(query, [last_id] + params + [chunk_size])
+        rows = cursor.fetchall()
+        conn.close()
+        
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+# 导出停车记录的列
+EXPORT_COLUMNS = ("id", "plate", "phone", "entry_time", "exit_time", "type", "fee")
+
+
+def _export_filter(after_id: int,
+                   plate: Optional[str],
+                   start_time: Optional[str],
+                   end_time: Optional[str],
+                   record_type: Optional[str]) -> Tuple[str, List]:
+    """
+    生成导出查询的过滤条件和参数
+    """
+    values = {
+        "plate": normalize_plate(plate) if plate else None,
+        "start_time": start_time,
+        "end_time": end_time,
+        "record_type": record_type,
+    }
+    conditions = ["id > ?"]
+    params: List[Any] = [after_id]
+    for name, condition in _PARKING_RECORD_FILTERS:
+        if values.get(name):
+            conditions.append(condition)
+            params.append(values[name])
+    return " AND ".join(conditions), params
+
+
+@metrics.instrument
+def count_parking_records(after_id: int = 0,
+                          plate: Optional[str] = None,
+                          start_time: Optional[str] = None,
+                          end_time: Optional[str] = None,
+                          record_type: Optional[str] = None) -> int:
+    """
+    统计满足条件的停车记录数（用于导出进度）
     
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
+    Args:
+        after_id: 只统计该ID之后的记录
+        plate: 车牌号（可选）
+        start_time: 进场开始时间（可选）
+        end_time: 进场结束时间（可选）
+        record_type: 记录类型（可选）
+        
+    Returns:
+        int: 记录数
+    """
+    where, params = _export_filter(after_id, plate, start_time, end_time, record_type)
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT COUNT(*) FROM parking_records WHERE {where}", params)
+    count = cursor.fetchone()[0]
     conn.close()
+    return count
+
+
+@metrics.instrument
+def iter_parking_records(after_id: int = 0,
+                         chunk_size: int = 5000,
+                         plate: Optional[str] = None,
+                         start_time: Optional[str] = None,
+                         end_time: Optional[str] = None,
+                         record_type: Optional[str] = None) -> Iterator[List[Tuple]]:
+    """
+    按ID顺序分批读取停车记录（含在场记录），过滤在数据库中完成
+    每批单独查询（按ID键集分页），内存占用只与批大小有关
     
-    return [dict(row) for row in rows]
+    Args:
+        after_id: 从该ID之后开始读取
+        chunk_size: 每批记录数
+        plate: 车牌号（可选）
+        start_time: 进场开始时间（可选）
+        end_time: 进场结束时间（可选）
+        record_type: 记录类型（可选）
+        
+    Yields:
+        List[Tuple]: 一批记录，字段顺序同 EXPORT_COLUMNS
+    """
+    where, params = _export_filter(after_id, plate, start_time, end_time, record_type)
+    query = (f"SELECT {', '.join(EXPORT_COLUMNS)} FROM parking_records "
+             f"WHERE {where} ORDER BY id LIMIT ?")
+    
+    while True:
+        conn = _connect()
+        cursor = conn.cursor()
+        cursor.execute(query, params + [chunk_size])
+        rows = cursor.fetchall()
+        conn.close()
+        
+        if not rows:
+            return
+        yield rows
+        params[0] = rows[-1][0]
+
+
+@metrics.instrument
+def iter_resident_phones(chunk_size: int = 2000) -> Iterator[List[str]]:
+    """
+    按ID顺序分批读取全部居民手机号
+    
+    Args:
+        chunk_size: 每批条数
+        
+    Yields:
+        List[str]: 一批手机号
+    """
+    last_id = 0
+    while True:
+        conn = _connect()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT id, phone FROM residents WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, chunk_size)
+        )
+        rows = cursor.fetchall()
+        conn.close()
+        
+        if not rows:
+            return
+        yield [phone for _, phone in rows]
+        last_id = rows[-1][0]
 
 
+@metrics.instrument
 def get_all_residents() -> List[Dict]:
     """
     获取所有居民信息
@@ -350,7 +1911,7 @@ def get_all_residents() -> List[Dict]:
     Returns:
         List[Dict]: 居民信息列表
     """
-    conn = sqlite3.connect(DB_PATH)
+    conn = _connect()
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
@@ -361,6 +1922,136 @@ def get_all_residents() -> List[Dict]:
     return [dict(row) for row in rows]
 
 
+@metrics.instrument
+def search_residents(keyword: str = "", offset: int = 0, limit: int = 20) -> List[Dict]:
+    """
+    分页搜索居民（姓名、手机号、车牌号、地址）
+    关键字不少于3个字符时走全文索引做子串匹配，更短的关键字按前缀匹配姓名、手机号和车牌号
+    
+    Args:
+        keyword: 搜索关键字，为空时按ID顺序列出全部居民
+        offset: 跳过的条数
+        limit: 返回的最大条数
+        
+    Returns:
+        List[Dict]: 居民信息列表
+    """
+    keyword = keyword.strip()
+    
+    conn = _connect()
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    
+    rows = None
+    if not keyword:
+        cursor.execute("SELECT * FROM residents ORDER BY id LIMIT ? OFFSET ?", (limit, offset))
+        rows = cursor.fetchall()
+    elif len(keyword) >= 3:
+        try:
+            # 关键字作为短语查询，内部的双引号需转义
+            phrase = '"' + keyword.replace('"', '""') + '"'
+            cursor.execute(
+                """
+                SELECT r.* FROM residents_fts f
+                JOIN residents r ON r.id = f.rowid
+                WHERE residents_fts MATCH ?
+                ORDER BY f.rowid LIMIT ? OFFSET ?
+                """,
+                (phrase, limit, offset)
+            )
+            rows = cursor.fetchall()
+        except sqlite3.OperationalError:
+            # 未启用FTS5，退化为前缀查询
+            rows = None
+    
+    if rows is None:
+        # 前缀范围查询，可以使用各列上的索引
+        upper = keyword + "\U0010ffff"
+        plate_key = normalize_plate(keyword)
+        cursor.execute(
+            """
+            SELECT * FROM residents WHERE id IN (
+                SELECT id FROM residents WHERE phone >= ? AND phone < ?
+                UNION
+                SELECT id FROM residents WHERE plate_key >= ? AND plate_key < ?
+                UNION
+                SELECT id FROM residents WHERE name >= ? AND name < ?
+            )
+            ORDER BY id LIMIT ? OFFSET ?
+            """,
+            (keyword, upper, plate_key, plate_key + "\U0010ffff", keyword, upper, limit, offset)
+        )
+        rows = cursor.fetchall()
+    
+    conn.close()
+    return [dict(row) for row in rows]
+
+
+def _reset_resident_plate_index() -> None:
+    """
+    丢弃车牌模糊匹配索引，下次模糊查询时重新构建
+    """
+    _resident_plate_indexes.pop(current_site(), None)
+
+
+def _get_resident_plate_index() -> PlateTrigramIndex:
+    """
+    获取车牌模糊匹配索引，未构建时从residents表分批加载规范化车牌
+    
+    Returns:
+        PlateTrigramIndex: 车牌索引
+    """
+    site = current_site()
+    index = _resident_plate_indexes.get(site)
+    if index is None:
+        index = PlateTrigramIndex()
+        conn = _connect()
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, COALESCE(plate_key, plate) FROM residents")
+        while True:
+            rows = cursor.fetchmany(10000)
+            if not rows:
+                break
+            index.update(rows)
+        conn.close()
+        _resident_plate_indexes[site] = index
+    return index
+
+
+@metrics.instrument
+def fuzzy_search_residents_by_plate(plate: str, limit: int = 10) -> List[Dict]:
+    """
+    按车牌模糊查找居民，容忍 8/B、0/D 等识别易混字符
+    
+    Args:
+        plate: 车牌号（可能含识别错误）
+        limit: 返回的最大条数
+        
+    Returns:
+        List[Dict]: 居民信息列表，按相似度降序，每项附带 similarity 字段
+    """
+    matches = _get_resident_plate_index().search(plate, limit)
+    if not matches:
+        return []
+    
+    conn = _connect()
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    
+    placeholders = ", ".join("?" for _ in matches)
+    cursor.execute(f"SELECT * FROM residents WHERE id IN ({placeholders})", [item_id for item_id, _ in matches])
+    residents = {row['id']: dict(row) for row in cursor.fetchall()}
+    conn.close()
+    
+    result = []
+    for item_id, score in matches:
+        if item_id in residents:
+            residents[item_id]['similarity'] = score
+            result.append(residents[item_id])
+    return result
+
+
+@metrics.instrument
 def verify_admin(username: str, password: str) -> bool:
     """
     验证管理员账号
@@ -374,7 +2065,7 @@ def verify_admin(username: str, password: str) -> bool:
     """
     hashed_password = hashlib.sha256(password.encode()).hexdigest()
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = _connect()
     cursor = conn.cursor()
     
     cursor.execute(
@@ -388,6 +2079,7 @@ def verify_admin(username: str, password: str) -> bool:
     return result
 
 
+@metrics.instrument
 def get_revenue_statistics(start_date: str, end_date: str) -> List[Tuple[str, float]]:
     """
     获取收入统计数据
@@ -399,7 +2091,7 @@ def get_revenue_statistics(start_date: str, end_date: str) -> List[Tuple[str, fl
     Returns:
         List[Tuple[str, float]]: 日期和收入的列表
     """
-    conn = sqlite3.connect(DB_PATH)
+    conn = _connect()
     cursor = conn.cursor()
     
     cursor.execute(
@@ -427,6 +2119,7 @@ def get_revenue_statistics(start_date: str, end_date: str) -> List[Tuple[str, fl
     return results
 
 
+@metrics.instrument
 def get_current_parked_count() -> Dict[str, int]:
     """
     获取当前在场车辆数
@@ -434,7 +2127,7 @@ def get_current_parked_count() -> Dict[str, int]:
     Returns:
         Dict[str, int]: 包含总数量、居民车辆数和访客车辆数
     """
-    conn = sqlite3.connect(DB_PATH)
+    conn = _connect()
     cursor = conn.cursor()
     
     # 总数量
@@ -456,4 +2149,68 @@ def get_current_parked_count() -> Dict[str, int]:
         'total': total_count,
         'resident': resident_count,
         'visitor': visitor_count
-    }
\ No newline at end of file
+    }
+
+
+@metrics.instrument
+def get_free_spaces() -> Dict[str, int]:
+    """
+    获取各分区剩余车位数（读取计数表，不扫描停车记录）
+    
+    Returns:
+        Dict[str, int]: 分区（'total' 或车辆类型）-> 剩余车位数，只包含配置了容量的分区
+    """
+    conn = _connect()
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT zone, capacity - occupied FROM lot_occupancy")
+    rows = cursor.fetchall()
+    conn.close()
+    
+    return {zone: max(free, 0) for zone, free in rows}
+
+
+@metrics.instrument
+def get_all_sites_revenue_statistics(start_date: str,
+                                     end_date: str,
+                                     sites: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+    """
+    获取多个站点合计的收入统计数据（各站点并行查询后按日期合并）
+    
+    Args:
+        start_date: 开始日期
+        end_date: 结束日期
+        sites: 站点ID列表（可选），默认使用 cfg.SITE_IDS
+        
+    Returns:
+        List[Tuple[str, float]]: 日期和收入的列表
+    """
+    totals: Dict[str, float] = {}
+    for results in run_on_sites(get_revenue_statistics, start_date, end_date, sites=sites).values():
+        for date, revenue in results:
+            totals[date] = totals.get(date, 0.0) + (revenue or 0.0)
+    return sorted(totals.items())
+
+
+@metrics.instrument
+def get_all_sites_occupancy(sites: Optional[List[str]] = None) -> Dict[str, Dict[str, int]]:
+    """
+    获取多个站点的在场车辆数和剩余车位数（各站点并行查询）
+    
+    Args:
+        sites: 站点ID列表（可选），默认使用 cfg.SITE_IDS
+        
+    Returns:
+        Dict[str, Dict[str, int]]: 站点ID -> 占用数据（parked、free，未配置总车位数时 free 为None），
+            另有键 'all' 为全部站点的合计（'all' 是保留字，不能作为站点ID）
+    """
+    def occupancy():
+        return {'parked': get_current_parked_count()['total'], 'free': get_free_spaces().get('total')}
+    
+    result = run_on_sites(occupancy, sites=sites)
+    free = [item['free'] for item in result.values()]
+    result['all'] = {
+        'parked': sum(item['parked'] for item in result.values()),
+        'free': None if None in free else sum(free)
+    }
+    return result
@@ -0,0 +1,188 @@
+"""
+旧数据库合并模块
+早期版本使用 parking_system.db（resident_users / resident_vehicles / visitor_records / parking_records），
+本模块把这类旧数据库合并进当前数据库：居民按手机号和车牌去重导入，停车记录按旧库ID分批导入，
+每批一个短写事务，批次进度与该批数据在同一事务内提交，中断后再次执行从上次的位置继续，重复执行不会重复导入
+
+用法：
+    python -m src.database.legacy --merge old/parking_system.db
+    python -m src.database.legacy --status
+"""
+import argparse
+import os
+import sqlite3
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from config.cfg import MIGRATION_BATCH_SIZE
+from src.database import db, migrations
+from src.tool.utils import normalize_plate
+
+# 旧库 parking_records 与 visitor_records 的字段统一为：旧ID、车牌、手机号、进场、出场、费用、类型
+_LEGACY_SOURCES = {
+    "parking_records": """
+        SELECT p.id, p.license_plate, COALESCE(u.phone_number, v.phone_number),
+               p.entry_time, p.exit_time, p.total_cost,
+               CASE WHEN p.user_type = 'resident' THEN 'resident' ELSE 'visitor' END
+        FROM parking_records p
+        LEFT JOIN resident_users u ON u.id = p.resident_id
+        LEFT JOIN visitor_records v ON v.id = p.visitor_record_id
+        WHERE p.id > ? ORDER BY p.id LIMIT ?
+    """,
+    # 已被 parking_records 引用的访客记录不再重复导入
+    "visitor_records": """
+        SELECT v.id, v.license_plate, v.phone_number, v.entry_time, v.exit_time, v.total_cost, 'visitor'
+        FROM visitor_records v
+        WHERE v.id > ?
+          AND NOT EXISTS (SELECT 1 FROM parking_records p WHERE p.visitor_record_id = v.id)
+        ORDER BY v.id LIMIT ?
+    """,
+}
+
+
+def _ensure_progress_table(conn: sqlite3.Connection) -> None:
+    """
+    创建合并进度表：每个旧库文件的每张表一行，记录已导入的最后一个旧库ID
+    """
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS legacy_imports (
+        source TEXT NOT NULL,
+        table_name TEXT NOT NULL,
+        last_id INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (source, table_name)
+    )
+    ''')
+    conn.commit()
+
+
+def _import_residents(legacy: sqlite3.Connection) -> int:
+    """
+    导入旧库居民（每位居民取第一辆登记车辆），手机号或车牌号已存在的跳过
+    """
+    cursor = legacy.execute(
+        """
+        SELECT u.name, u.phone_number, u.address, u.balance,
+               (SELECT license_plate FROM resident_vehicles
+                WHERE resident_id = u.id ORDER BY id LIMIT 1)
+        FROM resident_users u
+        ORDER BY u.id
+        """
+    )
+    imported = 0
+    for name, phone, address, balance, plate in cursor:
+        if plate and db.register_resident(name, phone, plate, address or "", balance or 0.0, "", ""):
+            imported += 1
+    return imported
+
+
+def _import_records(conn: sqlite3.Connection,
+                    legacy: sqlite3.Connection,
+                    source: str,
+                    table: str,
+                    batch_size: int,
+                    progress: Optional[Callable[[Dict], None]]) -> int:
+    """
+    分批导入旧库停车记录；同一车牌已有在场记录时，旧库的在场记录跳过
+    """
+    cursor = conn.cursor()
+    cursor.execute("INSERT OR IGNORE INTO legacy_imports (source, table_name) VALUES (?, ?)", (source, table))
+    conn.commit()
+    cursor.execute("SELECT last_id FROM legacy_imports WHERE source = ? AND table_name = ?", (source, table))
+    last_id = cursor.fetchone()[0]
+
+    imported = 0
+    while True:
+        rows = legacy.execute(_LEGACY_SOURCES[table], (last_id, batch_size)).fetchall()
+        if not rows:
+            return imported
+
+        db._begin_write(conn)
+        for _, plate, phone, entry_time, exit_time, fee, record_type in rows:
+            cursor.execute(
+                """
+                INSERT OR IGNORE INTO parking_records (plate, phone, entry_time, exit_time, type, fee, plate_key)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (plate, phone, entry_time, exit_time, record_type, fee or 0.0, normalize_plate(plate))
+            )
+            if cursor.rowcount == 0:
+                continue
+            record_id = cursor.lastrowid
+            imported += 1
+            db._append_event(cursor, db.EVENT_ENTRY, entry_time, record_id=record_id, zone=record_type)
+            if exit_time:
+                db._append_event(cursor, db.EVENT_EXIT, exit_time, record_id=record_id,
+                                 zone=record_type, amount=fee or 0.0)
+                if phone:
+                    db._add_resident_visit(cursor, phone, fee, exit_time)
+        last_id = rows[-1][0]
+        cursor.execute(
+            "UPDATE legacy_imports SET last_id = ? WHERE source = ? AND table_name = ?",
+            (last_id, source, table)
+        )
+        conn.commit()
+        if progress:
+            progress({"table": table, "last_id": last_id, "imported": imported})
+
+
+def merge_legacy_database(path: str,
+                          batch_size: int = MIGRATION_BATCH_SIZE,
+                          progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """
+    把旧数据库合并进当前数据库（或当前站点的数据库）
+
+    Args:
+        path: 旧数据库文件路径（只读打开，不会被修改）
+        batch_size: 每批导入的记录数
+        progress: 进度回调（可选），每提交一批调用一次
+
+    Returns:
+        Dict: 本次导入的 residents、parking_records、visitor_records 数量
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    source = str(Path(path).resolve())
+    legacy = sqlite3.connect(Path(source).as_uri() + "?mode=ro", uri=True)
+    conn = db._connect()
+    try:
+        _ensure_progress_table(conn)
+        result = {"residents": _import_residents(legacy)}
+        for table in _LEGACY_SOURCES:
+            result[table] = _import_records(conn, legacy, source, table, batch_size, progress)
+
+        # 导入的在场记录计入车位占用
+        db._begin_write(conn)
+        db._sync_lot_occupancy(conn.cursor())
+        conn.commit()
+    finally:
+        legacy.close()
+        conn.close()
+    return result
+
+
+def main() -> None:
+    """
+    命令行入口
+    """
+    parser = argparse.ArgumentParser(description="数据库结构版本与旧数据库合并")
+    parser.add_argument("--merge", nargs="+", metavar="PATH", help="要合并的旧数据库文件")
+    parser.add_argument("--batch-size", type=int, default=MIGRATION_BATCH_SIZE, help="每批导入的记录数")
+    parser.add_argument("--status", action="store_true", help="显示数据库结构版本和迁移记录")
+    args = parser.parse_args()
+
+    db.init_db()
+    if args.merge:
+        for path in args.merge:
+            result = merge_legacy_database(path, args.batch_size)
+            print(f"已合并 {path}：居民 {result['residents']} 位，"
+                  f"停车记录 {result['parking_records'] + result['visitor_records']} 条")
+    if args.status or not args.merge:
+        conn = db._connect()
+        print(f"数据库结构版本：{migrations.get_version(conn)}")
+        for item in migrations.get_history(conn):
+            print(f"  v{item['version']} {item['description']}：{item['applied_at'] or '执行中'}")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+数据库版本迁移模块
+数据库的结构版本保存在 PRAGMA user_version 中，init_db 按版本号依次执行尚未执行的迁移，
+新增列、索引和数据回填都以迁移的形式发布，已部署的旧数据库也能逐步升级
+
+每个迁移分三个阶段，各事务出错时先回滚再抛出，不会留下半批数据，也不会一直持有写锁：
+    prepare：结构变更（加列、建表等），单独一个短事务
+    step：   可选的分批回填，每批一个短事务，不会长时间占用写锁；
+             批次进度与该批数据在同一事务内提交，中断后再次执行从上次提交的位置继续
+    finish： 收尾（建索引等），与版本号更新在同一事务内提交
+"""
+import sqlite3
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence
+
+from config.cfg import MIGRATION_BATCH_SIZE, TIME_FORMAT
+
+
+class Migration:
+    """
+    一个版本迁移
+    """
+    def __init__(self,
+                 version: int,
+                 description: str,
+                 prepare: Optional[Callable[[sqlite3.Cursor], None]] = None,
+                 step: Optional[Callable[[sqlite3.Cursor, int, int], Optional[int]]] = None,
+                 finish: Optional[Callable[[sqlite3.Cursor], None]] = None):
+        """
+        初始化迁移
+
+        Args:
+            version: 版本号，执行完成后数据库的 user_version
+            description: 说明
+            prepare: 结构变更函数（可选）
+            step: 分批回填函数（可选），参数为游标、上一批最后的ID、批大小，
+                  返回本批最后的ID，没有需要处理的数据时返回None
+            finish: 收尾函数（可选）
+        """
+        self.version = version
+        self.description = description
+        self.prepare = prepare
+        self.step = step
+        self.finish = finish
+
+
+def get_version(conn: sqlite3.Connection) -> int:
+    """
+    获取数据库的结构版本
+
+    Args:
+        conn: 数据库连接
+
+    Returns:
+        int: 版本号，从未迁移过的数据库为0
+    """
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _ensure_progress_table(conn: sqlite3.Connection) -> None:
+    """
+    创建迁移进度表：每个开始执行的迁移一行，记录回填进度和完成时间
+    """
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        last_id INTEGER NOT NULL DEFAULT 0,
+        applied_at TEXT -- 完成时间，执行中为NULL
+    )
+    ''')
+    conn.commit()
+
+
+def _transaction(conn: sqlite3.Connection, work: Callable[[sqlite3.Cursor], None]) -> None:
+    """
+    在一个写事务内执行 work，出错时回滚并释放写锁后再抛出
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        work(conn.cursor())
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+def _run(conn: sqlite3.Connection,
+         migration: Migration,
+         batch_size: int,
+         progress: Optional[Callable[[Dict], None]]) -> None:
+    """
+    执行一个迁移
+    """
+    def prepare(cursor: sqlite3.Cursor) -> None:
+        if migration.prepare:
+            migration.prepare(cursor)
+        cursor.execute(
+            "INSERT OR IGNORE INTO schema_migrations (version, description) VALUES (?, ?)",
+            (migration.version, migration.description)
+        )
+
+    _transaction(conn, prepare)
+
+    if migration.step:
+        last_id = conn.execute(
+            "SELECT last_id FROM schema_migrations WHERE version = ?", (migration.version,)
+        ).fetchone()[0]
+        while True:
+            batch = {}
+
+            def step(cursor: sqlite3.Cursor) -> None:
+                batch["next_id"] = migration.step(cursor, last_id, batch_size)
+                if batch["next_id"] is not None:
+                    cursor.execute(
+                        "UPDATE schema_migrations SET last_id = ? WHERE version = ?",
+                        (batch["next_id"], migration.version)
+                    )
+
+            _transaction(conn, step)
+            if batch["next_id"] is None:
+                break
+            last_id = batch["next_id"]
+            if progress:
+                progress({"version": migration.version, "description": migration.description, "last_id": last_id})
+
+    def finish(cursor: sqlite3.Cursor) -> None:
+        if migration.finish:
+            migration.finish(cursor)
+        cursor.execute(
+            "UPDATE schema_migrations SET applied_at = ? WHERE version = ?",
+            (datetime.now().strftime(TIME_FORMAT), migration.version)
+        )
+        # user_version 位于数据库文件头，随事务一起提交
+        cursor.execute(f"PRAGMA user_version = {int(migration.version)}")
+
+    _transaction(conn, finish)
+
+
+def migrate(conn: sqlite3.Connection,
+            migrations: Sequence[Migration],
+            target: Optional[int] = None,
+            batch_size: int = MIGRATION_BATCH_SIZE,
+            progress: Optional[Callable[[Dict], None]] = None) -> int:
+    """
+    按版本号依次执行尚未执行的迁移
+
+    Args:
+        conn: 数据库连接（不能处于事务中）
+        migrations: 全部迁移
+        target: 目标版本（可选），默认执行到最新
+        batch_size: 回填每批的行数
+        progress: 回填进度回调（可选），每提交一批调用一次
+
+    Returns:
+        int: 执行后的数据库版本
+    """
+    if conn.in_transaction:
+        # 提交调用方未完成的事务可能写入半批数据，由调用方决定提交还是回滚
+        raise ValueError("执行迁移前连接不能处于事务中")
+    _ensure_progress_table(conn)
+    version = get_version(conn)
+    for migration in sorted(migrations, key=lambda m: m.version):
+        if migration.version <= version:
+            continue
+        if target is not None and migration.version > target:
+            break
+        _run(conn, migration, batch_size, progress)
+        version = migration.version
+    return version
+
+
+def get_history(conn: sqlite3.Connection) -> List[Dict]:
+    """
+    获取迁移执行记录
+
+    Args:
+        conn: 数据库连接
+
+    Returns:
+        List[Dict]: 每个迁移的 version、description、last_id、applied_at
+    """
+    _ensure_progress_table(conn)
+    cursor = conn.execute(
+        "SELECT version, description, last_id, applied_at FROM schema_migrations ORDER BY version"
+    )
+    return [
+        {"version": version, "description": description, "last_id": last_id, "applied_at": applied_at}
+        for version, description, last_id, applied_at in cursor.fetchall()
+    ]
@@ -0,0 +1,312 @@
+"""
+SQL分析器模块
+为数据库连接挂载 trace/progress 回调，记录每条语句的耗时与虚拟机步数，
+超过阈值的语句连同参数和 EXPLAIN QUERY PLAN 结果写入滚动的慢查询日志
+"""
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import weakref
+from logging.handlers import RotatingFileHandler
+from typing import Dict, List, Optional
+
+from config.cfg import (
+    SLOW_QUERY_THRESHOLD_MS,
+    SLOW_QUERY_LOG_PATH,
+    SLOW_QUERY_LOG_MAX_BYTES,
+    SLOW_QUERY_LOG_BACKUP_COUNT,
+)
+from src.database import db
+
+# 进度回调的触发间隔（虚拟机指令数），步数统计的精度即为该值
+PROGRESS_INTERVAL = 100
+
+_threshold = SLOW_QUERY_THRESHOLD_MS / 1000
+_logger = logging.getLogger("parking.slow_query")
+_logger.propagate = False
+_handler: Optional[logging.Handler] = None
+
+# 规范化SQL -> 汇总数据
+_summary: Dict[str, Dict] = {}
+_summary_lock = threading.Lock()
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    规范化SQL：折叠空白、字面量替换为?，用于汇总同类语句
+
+    Args:
+        sql: 原始SQL
+
+    Returns:
+        str: 规范化后的SQL
+    """
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _IN_LIST.sub("(?)", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+class _Statement:
+    """
+    正在执行的一条语句的统计数据
+    """
+    __slots__ = ("sql", "params", "expanded", "elapsed", "start_steps")
+
+    def __init__(self, sql: str, params, start_steps: int):
+        self.sql = sql
+        self.params = params
+        self.expanded = None
+        self.elapsed = 0.0
+        self.start_steps = start_steps
+
+
+class ProfilingCursor(sqlite3.Cursor):
+    """
+    带分析功能的游标
+    语句耗时包括执行和取数据的时间，在下一次执行、关闭或数据取完时结算
+    """
+    def __init__(self, connection: "ProfilingConnection"):
+        super().__init__(connection)
+        self._statement: Optional[_Statement] = None
+        connection._cursors.add(self)
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            if self._statement is not None:
+                self._statement.elapsed += time.perf_counter() - start
+
+    def _begin(self, sql: str, params) -> None:
+        self._finish()
+        conn = self.connection
+        conn._traced = None
+        self._statement = _Statement(sql, params, conn._steps)
+
+    def _finish(self) -> None:
+        statement = self._statement
+        if statement is None:
+            return
+        self._statement = None
+        self.connection._record(statement)
+
+    def execute(self, sql, parameters=()):
+        self._begin(sql, parameters)
+        result = self._timed(super().execute, sql, parameters)
+        if self._statement is not None:
+            self._statement.expanded = self.connection._traced
+        if self.description is None:
+            # 非查询语句执行完即结束
+            self._finish()
+        return result
+
+    def executemany(self, sql, seq_of_parameters):
+        self._begin(sql, "<many>")
+        result = self._timed(super().executemany, sql, seq_of_parameters)
+        self._finish()
+        return result
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(super().fetchmany, self.arraysize if size is None else size)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self._finish()
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+
+class ProfilingConnection(sqlite3.Connection):
+    """
+    带分析功能的数据库连接
+    通过 db.set_connection_factory 注入，所有 db 函数的连接都会使用它
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._steps = 0
+        self._traced: Optional[str] = None
+        self._explaining = False
+        self._cursors = weakref.WeakSet()
+        self.set_progress_handler(self._on_progress, PROGRESS_INTERVAL)
+        self.set_trace_callback(self._on_trace)
+
+    def _on_progress(self) -> int:
+        self._steps += PROGRESS_INTERVAL
+        return 0
+
+    def _on_trace(self, sql: str) -> None:
+        # 记录绑定参数后的完整SQL（只保留第一条，触发器内部语句忽略）
+        if not self._explaining and self._traced is None:
+            self._traced = sql
+
+    def cursor(self, factory=ProfilingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        cursor = self.cursor()
+        cursor.execute(sql, parameters)
+        return cursor
+
+    def executemany(self, sql, seq_of_parameters):
+        cursor = self.cursor()
+        cursor.executemany(sql, seq_of_parameters)
+        return cursor
+
+    def close(self):
+        for cursor in list(self._cursors):
+            cursor._finish()
+        super().close()
+
+    def _explain(self, statement: _Statement) -> List[str]:
+        """
+        获取语句的查询计划
+        """
+        if not statement.sql.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "INSERT", "WITH")):
+            return []
+        self._explaining = True
+        try:
+            cursor = sqlite3.Connection.cursor(self)
+            params = statement.params if statement.params != "<many>" else ()
+            cursor.execute("EXPLAIN QUERY PLAN " + statement.sql, params)
+            plan = [row[-1] for row in cursor.fetchall()]
+            cursor.close()
+            return plan
+        except sqlite3.Error:
+            return []
+        finally:
+            self._explaining = False
+
+    def _record(self, statement: _Statement) -> None:
+        """
+        汇总一条语句，超过阈值时写慢查询日志
+        """
+        steps = self._steps - statement.start_steps
+        key = normalize_sql(statement.sql)
+        with _summary_lock:
+            item = _summary.get(key)
+            if item is None:
+                item = _summary[key] = {"sql": key, "count": 0, "total_ms": 0.0,
+                                        "max_ms": 0.0, "steps": 0, "slow": 0}
+            item["count"] += 1
+            item["total_ms"] += statement.elapsed * 1000
+            item["max_ms"] = max(item["max_ms"], statement.elapsed * 1000)
+            item["steps"] += steps
+            if statement.elapsed >= _threshold:
+                item["slow"] += 1
+
+        if statement.elapsed >= _threshold and _handler is not None:
+            _logger.warning(json.dumps({
+                "elapsed_ms": round(statement.elapsed * 1000, 3),
+                "vm_steps": steps,
+                "sql": key,
+                "params": statement.params if isinstance(statement.params, str) else list(statement.params),
+                "expanded_sql": statement.expanded,
+                "query_plan": self._explain(statement),
+            }, ensure_ascii=False, default=str))
+
+
+def enable(threshold_ms: Optional[float] = None, log_path: Optional[str] = None) -> None:
+    """
+    启用SQL分析器
+
+    Args:
+        threshold_ms: 慢查询阈值（毫秒），默认使用配置值
+        log_path: 慢查询日志路径，默认使用配置值
+    """
+    global _threshold, _handler
+
+    disable()
+    if threshold_ms is not None:
+        _threshold = threshold_ms / 1000
+
+    log_path = log_path or SLOW_QUERY_LOG_PATH
+    os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+    _handler = RotatingFileHandler(
+        log_path,
+        maxBytes=SLOW_QUERY_LOG_MAX_BYTES,
+        backupCount=SLOW_QUERY_LOG_BACKUP_COUNT,
+        encoding="utf-8"
+    )
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    _logger.addHandler(_handler)
+    _logger.setLevel(logging.WARNING)
+
+    db.set_connection_factory(ProfilingConnection)
+
+
+def disable() -> None:
+    """
+    停用SQL分析器（已有汇总数据保留）
+    """
+    global _handler
+
+    db.set_connection_factory(None)
+    if _handler is not None:
+        _logger.removeHandler(_handler)
+        _handler.close()
+        _handler = None
+
+
+def reset() -> None:
+    """
+    清空汇总数据
+    """
+    with _summary_lock:
+        _summary.clear()
+
+
+def get_summary() -> List[Dict]:
+    """
+    获取按规范化SQL分组的汇总数据
+
+    Returns:
+        List[Dict]: 汇总列表，按累计耗时降序
+    """
+    with _summary_lock:
+        items = [dict(item) for item in _summary.values()]
+    for item in items:
+        item["avg_ms"] = item["total_ms"] / item["count"] if item["count"] else 0.0
+    items.sort(key=lambda item: item["total_ms"], reverse=True)
+    return items
+
+
+def format_report(limit: int = 20) -> str:
+    """
+    生成文本格式的汇总报表
+
+    Args:
+        limit: 最多显示的语句数
+
+    Returns:
+        str: 报表内容
+    """
+    lines = [f"{'count':>8}{'total_ms':>12}{'avg_ms':>10}{'max_ms':>10}{'vm_steps':>12}{'slow':>6}  sql"]
+    for item in get_summary()[:limit]:
+        lines.append(
+            f"{item['count']:>8}{item['total_ms']:>12.2f}{item['avg_ms']:>10.3f}"
+            f"{item['max_ms']:>10.3f}{item['steps']:>12}{item['slow']:>6}  {item['sql'][:120]}"
+        )
+    return "\n".join(lines)
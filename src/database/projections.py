@@ -0,0 +1,335 @@
+"""
+事件投影模块
+从只追加的 events 表重放事件，构建车位占用、居民余额和每日收入等派生数据
+每个投影记录已处理到的事件ID，增量更新只读取新事件；派生数据损坏时可从头重放重建，
+也可与业务表比对校验
+
+用法：
+    python -m src.database.projections [--rebuild] [--verify]
+"""
+import abc
+import argparse
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+from src.database import db
+
+# 每批重放的事件数
+REPLAY_BATCH_SIZE = 5000
+
+
+class Projection(abc.ABC):
+    """
+    投影基类（未实现全部抽象方法的子类不能实例化）
+    """
+    # 投影名称
+    name = ""
+    # 投影数据表
+    tables: Tuple[str, ...] = ()
+
+    @abc.abstractmethod
+    def create(self, cursor: sqlite3.Cursor) -> None:
+        """
+        创建投影数据表
+        """
+
+    @abc.abstractmethod
+    def apply(self, cursor: sqlite3.Cursor, events: List[Tuple]) -> None:
+        """
+        把一批事件应用到投影数据表
+
+        Args:
+            cursor: 数据库游标（在调用方的写事务内）
+            events: (id, kind, event_time, record_id, resident_id, zone, amount) 元组列表
+        """
+
+    @abc.abstractmethod
+    def verify(self, cursor: sqlite3.Cursor) -> List[Tuple]:
+        """
+        与业务表比对
+
+        Returns:
+            List[Tuple]: 不一致项 (键, 投影值, 业务表值)
+        """
+
+
+class OccupancyProjection(Projection):
+    """
+    车位占用投影：按分区统计在场车辆数
+    """
+    name = "occupancy"
+    tables = ("proj_occupancy",)
+
+    def create(self, cursor):
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS proj_occupancy (
+            zone TEXT PRIMARY KEY,
+            occupied INTEGER NOT NULL DEFAULT 0
+        )
+        ''')
+
+    def apply(self, cursor, events):
+        deltas: Dict[str, int] = {}
+        for _, kind, _, _, _, zone, _ in events:
+            if kind == db.EVENT_ENTRY:
+                delta = 1
+            elif kind == db.EVENT_EXIT:
+                delta = -1
+            else:
+                continue
+            for key in ("total", zone):
+                deltas[key] = deltas.get(key, 0) + delta
+        cursor.executemany(
+            """
+            INSERT INTO proj_occupancy (zone, occupied) VALUES (?, ?)
+            ON CONFLICT(zone) DO UPDATE SET occupied = occupied + excluded.occupied
+            """,
+            list(deltas.items())
+        )
+
+    def verify(self, cursor):
+        cursor.execute("SELECT zone, occupied FROM proj_occupancy")
+        projected = dict(cursor.fetchall())
+        cursor.execute("SELECT zone, occupied FROM lot_occupancy")
+        actual = dict(cursor.fetchall())
+        # 只比对计数表中配置的分区
+        return [(zone, projected.get(zone, 0), occupied)
+                for zone, occupied in sorted(actual.items())
+                if projected.get(zone, 0) != occupied]
+
+
+class BalanceProjection(Projection):
+    """
+    居民余额投影：累加充值和扣款事件
+    """
+    name = "balances"
+    tables = ("proj_balances",)
+
+    def create(self, cursor):
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS proj_balances (
+            resident_id INTEGER PRIMARY KEY,
+            balance REAL NOT NULL DEFAULT 0.0
+        )
+        ''')
+
+    def apply(self, cursor, events):
+        deltas: Dict[int, float] = {}
+        for _, kind, _, _, resident_id, _, amount in events:
+            if kind in (db.EVENT_RECHARGE, db.EVENT_DEBIT):
+                deltas[resident_id] = deltas.get(resident_id, 0.0) + amount
+        cursor.executemany(
+            """
+            INSERT INTO proj_balances (resident_id, balance) VALUES (?, ?)
+            ON CONFLICT(resident_id) DO UPDATE SET balance = balance + excluded.balance
+            """,
+            list(deltas.items())
+        )
+
+    def verify(self, cursor):
+        cursor.execute("SELECT resident_id, balance FROM proj_balances")
+        projected = dict(cursor.fetchall())
+        cursor.execute("SELECT id, balance FROM residents")
+        actual = dict(cursor.fetchall())
+        # 金额为浮点累加，按分比较
+        return [(resident_id, projected.get(resident_id, 0.0), actual.get(resident_id, 0.0))
+                for resident_id in sorted(set(projected) | set(actual))
+                if abs(projected.get(resident_id, 0.0) - actual.get(resident_id, 0.0)) >= 0.005]
+
+
+class RevenueProjection(Projection):
+    """
+    每日收入投影：按出场日期累计离场次数和停车费
+    """
+    name = "revenue"
+    tables = ("proj_daily_revenue",)
+
+    def create(self, cursor):
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS proj_daily_revenue (
+            date TEXT PRIMARY KEY,
+            exits INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0.0
+        )
+        ''')
+
+    def apply(self, cursor, events):
+        rollup: Dict[str, List] = {}
+        for _, kind, event_time, _, _, _, amount in events:
+            if kind != db.EVENT_EXIT:
+                continue
+            item = rollup.setdefault(event_time[:10], [0, 0.0])
+            item[0] += 1
+            item[1] += amount
+        cursor.executemany(
+            """
+            INSERT INTO proj_daily_revenue (date, exits, revenue) VALUES (?, ?, ?)
+            ON CONFLICT(date) DO UPDATE SET
+                exits = exits + excluded.exits,
+                revenue = revenue + excluded.revenue
+            """,
+            [(date, exits, revenue) for date, (exits, revenue) in rollup.items()]
+        )
+
+    def verify(self, cursor):
+        cursor.execute("SELECT date, exits, revenue FROM proj_daily_revenue")
+        projected = {date: (exits, revenue) for date, exits, revenue in cursor.fetchall()}
+        cursor.execute(
+            """
+            SELECT date(exit_time), COUNT(*), COALESCE(SUM(fee), 0.0) FROM parking_records
+            WHERE exit_time IS NOT NULL GROUP BY date(exit_time)
+            """
+        )
+        actual = {date: (exits, revenue) for date, exits, revenue in cursor.fetchall()}
+        mismatches = []
+        for date in sorted(set(projected) | set(actual)):
+            p_exits, p_revenue = projected.get(date, (0, 0.0))
+            a_exits, a_revenue = actual.get(date, (0, 0.0))
+            if p_exits != a_exits or abs(p_revenue - a_revenue) >= 0.005:
+                mismatches.append((date, projected.get(date), actual.get(date)))
+        return mismatches
+
+
+# 已注册的投影
+PROJECTIONS: Dict[str, Projection] = {
+    projection.name: projection
+    for projection in (OccupancyProjection(), BalanceProjection(), RevenueProjection())
+}
+
+
+def _prepare(cursor: sqlite3.Cursor, projection: Projection) -> int:
+    """
+    创建投影数据表和进度表，返回投影已处理到的事件ID
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS projection_offsets (
+        name TEXT PRIMARY KEY,
+        last_event_id INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    projection.create(cursor)
+    cursor.execute("SELECT last_event_id FROM projection_offsets WHERE name = ?", (projection.name,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def update_projection(name: str, batch_size: int = REPLAY_BATCH_SIZE) -> int:
+    """
+    增量更新投影：从已处理的事件ID之后继续重放
+    每批事件与进度在同一事务内提交，中断后重跑不会重复计算
+
+    Args:
+        name: 投影名称
+        batch_size: 每批重放的事件数
+
+    Returns:
+        int: 本次重放的事件数
+    """
+    projection = PROJECTIONS[name]
+    conn = db._connect()
+    cursor = conn.cursor()
+    replayed = 0
+
+    while True:
+        db._begin_write(conn)
+        offset = _prepare(cursor, projection)
+        cursor.execute(
+            """
+            SELECT id, kind, event_time, record_id, resident_id, zone, amount
+            FROM events WHERE id > ? ORDER BY id LIMIT ?
+            """,
+            (offset, batch_size)
+        )
+        events = cursor.fetchall()
+        if not events:
+            conn.commit()
+            break
+        projection.apply(cursor, events)
+        cursor.execute(
+            """
+            INSERT INTO projection_offsets (name, last_event_id) VALUES (?, ?)
+            ON CONFLICT(name) DO UPDATE SET last_event_id = excluded.last_event_id
+            """,
+            (name, events[-1][0])
+        )
+        conn.commit()
+        replayed += len(events)
+
+    conn.close()
+    return replayed
+
+
+def rebuild_projection(name: str, batch_size: int = REPLAY_BATCH_SIZE) -> int:
+    """
+    清空投影数据并从第一条事件开始重放
+
+    Args:
+        name: 投影名称
+        batch_size: 每批重放的事件数
+
+    Returns:
+        int: 重放的事件数
+    """
+    projection = PROJECTIONS[name]
+    conn = db._connect()
+    cursor = conn.cursor()
+    db._begin_write(conn)
+    _prepare(cursor, projection)
+    for table in projection.tables:
+        cursor.execute(f"DELETE FROM {table}")
+    cursor.execute("DELETE FROM projection_offsets WHERE name = ?", (name,))
+    conn.commit()
+    conn.close()
+    return update_projection(name, batch_size)
+
+
+def update_all_projections() -> Dict[str, int]:
+    """
+    增量更新全部投影
+
+    Returns:
+        Dict[str, int]: 投影名称 -> 本次重放的事件数
+    """
+    return {name: update_projection(name) for name in PROJECTIONS}
+
+
+def verify_projections(names: Optional[List[str]] = None) -> Dict[str, List[Tuple]]:
+    """
+    先增量更新投影，再与业务表比对
+
+    Args:
+        names: 投影名称列表（可选），默认全部
+
+    Returns:
+        Dict[str, List[Tuple]]: 投影名称 -> 不一致项列表（为空表示一致）
+    """
+    result = {}
+    for name in names or list(PROJECTIONS):
+        update_projection(name)
+        conn = db._connect()
+        result[name] = PROJECTIONS[name].verify(conn.cursor())
+        conn.close()
+    return result
+
+
+def main() -> None:
+    """
+    命令行入口
+    """
+    parser = argparse.ArgumentParser(description="从事件日志重放投影并校验派生数据")
+    parser.add_argument("--rebuild", action="store_true", help="清空投影后从头重放")
+    parser.add_argument("--verify", action="store_true", help="与业务表比对")
+    args = parser.parse_args()
+
+    for name in PROJECTIONS:
+        count = rebuild_projection(name) if args.rebuild else update_projection(name)
+        print(f"{name}: 重放 {count} 条事件")
+    if args.verify:
+        for name, mismatches in verify_projections().items():
+            print(f"{name}: {'一致' if not mismatches else f'{len(mismatches)} 项不一致'}")
+            for item in mismatches[:20]:
+                print(f"    {item}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""
+停车记录列式快照模块
+统计分析时把 parking_records 按列读入紧凑数组：时间为64位整数秒，费用为双精度浮点，
+车牌和记录类型做字典编码。每条记录约37字节，而逐行转成字典每条要数百字节；
+加载时按主键分批读取，不会一次性取出整张表
+
+时间戳按存储的本地时间直接换算（不做时区转换），与 TIME_FORMAT 字符串一一对应
+"""
+from array import array
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Hashable, Iterable, List, Optional
+
+from config.cfg import SNAPSHOT_CHUNK_SIZE, TIME_FORMAT
+from src.database import db
+
+# 在场记录的出场时间
+OPEN = -1
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def to_timestamp(time_str: str) -> int:
+    """
+    时间字符串转为快照使用的整数秒
+
+    Args:
+        time_str: TIME_FORMAT 格式的时间字符串
+
+    Returns:
+        int: 秒数
+    """
+    return int((datetime.strptime(time_str, TIME_FORMAT) - _EPOCH).total_seconds())
+
+
+def from_timestamp(seconds: int) -> str:
+    """
+    快照使用的整数秒转为时间字符串
+
+    Args:
+        seconds: 秒数
+
+    Returns:
+        str: TIME_FORMAT 格式的时间字符串
+    """
+    return (_EPOCH + timedelta(seconds=seconds)).strftime(TIME_FORMAT)
+
+
+class ParkingSnapshot:
+    """
+    停车记录列式快照
+    第 i 条记录的各字段分别是 ids[i]、entry[i]、exit[i]、fee[i]、
+    plates[plate_codes[i]]、types[type_codes[i]]
+    """
+    def __init__(self):
+        """
+        初始化空快照
+        """
+        self.ids = array("q")
+        self.entry = array("q")
+        self.exit = array("q")
+        self.fee = array("d")
+        self.plate_codes = array("I")
+        self.type_codes = array("B")
+        self.plates: List[str] = []
+        self.types: List[str] = []
+        self._plate_lookup: Dict[str, int] = {}
+        self._type_lookup: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def append(self, record_id: int, entry: int, exit_: Optional[int], fee: Optional[float],
+               plate: str, record_type: str) -> None:
+        """
+        追加一条记录
+
+        Args:
+            record_id: 记录ID
+            entry: 进场时间（秒）
+            exit_: 出场时间（秒），在场记录为None
+            fee: 费用，在场记录为None
+            plate: 车牌号（规范化形式）
+            record_type: 记录类型
+        """
+        plate_code = self._plate_lookup.get(plate)
+        if plate_code is None:
+            plate_code = self._plate_lookup[plate] = len(self.plates)
+            self.plates.append(plate)
+        type_code = self._type_lookup.get(record_type)
+        if type_code is None:
+            type_code = self._type_lookup[record_type] = len(self.types)
+            self.types.append(record_type)
+
+        self.ids.append(record_id)
+        self.entry.append(entry)
+        self.exit.append(OPEN if exit_ is None else exit_)
+        self.fee.append(fee or 0.0)
+        self.plate_codes.append(plate_code)
+        self.type_codes.append(type_code)
+
+    def nbytes(self) -> int:
+        """
+        列数组占用的字节数（不含字典）
+
+        Returns:
+            int: 字节数
+        """
+        columns = (self.ids, self.entry, self.exit, self.fee, self.plate_codes, self.type_codes)
+        return sum(column.itemsize * len(column) for column in columns)
+
+    def select(self,
+               start: Optional[int] = None,
+               end: Optional[int] = None,
+               record_type: Optional[str] = None,
+               closed: Optional[bool] = None) -> array:
+        """
+        按条件筛选记录
+
+        Args:
+            start: 进场时间下限（秒，含）
+            end: 进场时间上限（秒，含）
+            record_type: 记录类型
+            closed: True 只要已离场记录，False 只要在场记录
+
+        Returns:
+            array: 满足条件的记录下标
+        """
+        selected = range(len(self))
+        if start is not None or end is not None:
+            low = start if start is not None else -2 ** 63
+            high = end if end is not None else 2 ** 63 - 1
+            entry = self.entry
+            selected = [i for i in selected if low <= entry[i] <= high]
+        if record_type is not None:
+            code = self._type_lookup.get(record_type)
+            type_codes = self.type_codes
+            selected = [i for i in selected if type_codes[i] == code]
+        if closed is not None:
+            exit_ = self.exit
+            selected = [i for i in selected if (exit_[i] != OPEN) == closed]
+        return array("I", selected)
+
+    def group_by(self,
+                 key: Callable[[int], Hashable],
+                 indices: Optional[Iterable[int]] = None,
+                 value: str = "count") -> Dict[Hashable, float]:
+        """
+        分组汇总
+
+        Args:
+            key: 下标 -> 分组键的函数（可用 day_key、type_key、plate_key 生成）
+            indices: 参与汇总的记录下标（可选，默认全部）
+            value: 'count' 计数，'fee' 费用求和，'duration' 已离场记录的停车时长求和（秒）
+
+        Returns:
+            Dict[Hashable, float]: 分组键 -> 汇总值
+        """
+        if indices is None:
+            indices = range(len(self))
+        totals: Dict[Hashable, float] = defaultdict(float)
+        if value == "count":
+            for i in indices:
+                totals[key(i)] += 1
+        elif value == "fee":
+            fee = self.fee
+            for i in indices:
+                totals[key(i)] += fee[i]
+        elif value == "duration":
+            entry, exit_ = self.entry, self.exit
+            for i in indices:
+                if exit_[i] != OPEN:
+                    totals[key(i)] += exit_[i] - entry[i]
+        else:
+            raise ValueError(f"不支持的汇总值：{value}")
+        return dict(totals)
+
+    def day_key(self) -> Callable[[int], int]:
+        """
+        按进场日期分组的键函数（键为1970-01-01起的天数，可用 day_to_str 转为日期）
+        """
+        entry = self.entry
+        return lambda i: entry[i] // 86400
+
+    def type_key(self) -> Callable[[int], str]:
+        """
+        按记录类型分组的键函数
+        """
+        type_codes, types = self.type_codes, self.types
+        return lambda i: types[type_codes[i]]
+
+    def plate_key(self) -> Callable[[int], str]:
+        """
+        按车牌分组的键函数
+        """
+        plate_codes, plates = self.plate_codes, self.plates
+        return lambda i: plates[plate_codes[i]]
+
+    def revenue_by_day(self, start: Optional[int] = None, end: Optional[int] = None) -> List[tuple]:
+        """
+        按进场日期统计已离场记录的收入（与 db.get_revenue_statistics 口径一致）
+
+        Args:
+            start: 进场时间下限（秒，含）
+            end: 进场时间上限（秒，含）
+
+        Returns:
+            List[tuple]: (日期, 收入) 列表，按日期升序
+        """
+        totals = self.group_by(self.day_key(), self.select(start, end, closed=True), "fee")
+        return [(day_to_str(day), revenue) for day, revenue in sorted(totals.items())]
+
+
+def day_to_str(day: int) -> str:
+    """
+    天数转为日期字符串
+
+    Args:
+        day: 1970-01-01起的天数
+
+    Returns:
+        str: YYYY-MM-DD
+    """
+    return (_EPOCH + timedelta(days=day)).strftime("%Y-%m-%d")
+
+
+def load_snapshot(start_time: Optional[str] = None,
+                  end_time: Optional[str] = None,
+                  chunk_size: int = SNAPSHOT_CHUNK_SIZE) -> ParkingSnapshot:
+    """
+    从当前数据库（或当前站点）按主键分批加载停车记录快照
+
+    Args:
+        start_time: 进场时间下限（可选）
+        end_time: 进场时间上限（可选）
+        chunk_size: 每批读取的记录数
+
+    Returns:
+        ParkingSnapshot: 列式快照
+    """
+    conditions = ["id > ?"]
+    params: list = []
+    if start_time:
+        conditions.append("entry_time >= ?")
+        params.append(start_time)
+    if end_time:
+        conditions.append("entry_time <= ?")
+        params.append(end_time)
+    # 时间在SQLite中换算为秒，避免逐行调用 strptime
+    sql = (
+        "SELECT id, CAST(strftime('%s', entry_time) AS INTEGER), "
+        "CAST(strftime('%s', exit_time) AS INTEGER), fee, COALESCE(plate_key, plate), type "
+        f"FROM parking_records WHERE {' AND '.join(conditions)} ORDER BY id LIMIT ?"
+    )
+
+    snapshot = ParkingSnapshot()
+    conn = db._connect()
+    cursor = conn.cursor()
+    last_id = 0
+    while True:
+        cursor.execute(sql, (last_id, *params, chunk_size))
+        rows = cursor.fetchall()
+        for row in rows:
+            snapshot.append(*row)
+        if len(rows) < chunk_size:
+            break
+        last_id = rows[-1][0]
+    conn.close()
+    return snapshot
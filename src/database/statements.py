@@ -0,0 +1,114 @@
+"""
+预编译语句注册模块
+动态拼接的查询按过滤条件组合只生成一次SQL文本，配合常驻连接的语句缓存，
+同一组合的查询不再重复解析；语句缓存的命中情况按LRU规则同步统计
+"""
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable
+
+# 全部连接累计的语句缓存命中/未命中次数
+_hits = 0
+_misses = 0
+_stats_lock = threading.Lock()
+
+
+class QueryRegistry:
+    """
+    查询注册表：查询形状（过滤条件组合等）-> SQL文本
+    """
+    def __init__(self, builder: Callable[[Hashable], str]):
+        """
+        初始化注册表
+
+        Args:
+            builder: 根据查询形状生成SQL文本的函数
+        """
+        self._builder = builder
+        self._queries: Dict[Hashable, str] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._queries)
+
+    def get(self, shape: Hashable) -> str:
+        """
+        获取查询形状对应的SQL文本，首次使用时生成
+
+        Args:
+            shape: 查询形状
+
+        Returns:
+            str: SQL文本
+        """
+        sql = self._queries.get(shape)
+        if sql is None:
+            with self._lock:
+                sql = self._queries.setdefault(shape, self._builder(shape))
+        return sql
+
+
+class StatementCacheTracker:
+    """
+    跟踪一个连接的语句缓存
+    sqlite3 模块不公开缓存命中情况，这里按与其相同的LRU规则记录最近使用的SQL文本
+    """
+    def __init__(self, capacity: int):
+        """
+        初始化跟踪器
+
+        Args:
+            capacity: 连接的语句缓存大小（cached_statements）
+        """
+        self._capacity = capacity
+        self._recent: OrderedDict = OrderedDict()
+
+    def touch(self, sql: str) -> bool:
+        """
+        记录一次语句执行
+
+        Args:
+            sql: SQL文本
+
+        Returns:
+            bool: 是否命中缓存
+        """
+        global _hits, _misses
+
+        hit = sql in self._recent
+        if hit:
+            self._recent.move_to_end(sql)
+        else:
+            self._recent[sql] = None
+            if len(self._recent) > self._capacity:
+                self._recent.popitem(last=False)
+        with _stats_lock:
+            if hit:
+                _hits += 1
+            else:
+                _misses += 1
+        return hit
+
+
+def get_stats() -> Dict:
+    """
+    获取语句缓存统计
+
+    Returns:
+        Dict: hits、misses、hit_rate
+    """
+    with _stats_lock:
+        hits, misses = _hits, _misses
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "hit_rate": hits / total if total else 0.0}
+
+
+def reset_stats() -> None:
+    """
+    清空语句缓存统计
+    """
+    global _hits, _misses
+
+    with _stats_lock:
+        _hits = 0
+        _misses = 0
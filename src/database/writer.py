@@ -0,0 +1,239 @@
+"""
+单写进程模块
+多个道闸进程和管理界面同时写 parking.db 时会争用写锁（database is locked）。
+启用单写进程后，所有写操作通过本地Unix套接字交给它串行执行，读操作仍直接访问数据库。
+请求和响应都是一行JSON，客户端可以不等响应连续发送多个请求（流水线），按请求ID对应响应
+
+启动单写进程：
+    python -m src.database.writer --socket /tmp/parking_writer.sock
+其他进程设置环境变量 PARKING_WRITER_SOCKET 为同一路径（或调用 db.use_writer）即可
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import socket
+import threading
+from concurrent.futures import Future
+from typing import Dict, Optional
+
+from config.cfg import WRITER_SOCKET_PATH, WRITER_TIMEOUT
+from src.database import db
+
+
+class WriterUnavailable(ConnectionError):
+    """
+    无法连接单写进程（请求尚未发出，调用方可以安全地改为本地执行）
+    """
+
+
+class WriterError(Exception):
+    """
+    单写进程执行写操作时出错
+    """
+
+
+class WriterClient:
+    """
+    单写进程客户端
+    线程安全：多个线程共用一条连接，请求按发送顺序流水线执行，后台线程按请求ID分发响应
+    """
+    def __init__(self, socket_path: str, timeout: float = WRITER_TIMEOUT):
+        """
+        初始化客户端（首次调用时才建立连接）
+
+        Args:
+            socket_path: 单写进程的套接字路径
+            timeout: 等待响应的超时时间（秒）
+        """
+        self._path = socket_path
+        self._timeout = timeout
+        self._sock: Optional[socket.socket] = None
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, Future] = {}
+
+    def _ensure_connected(self) -> socket.socket:
+        """
+        建立连接并启动响应读取线程（调用方持有锁）
+        """
+        if self._sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self._path)
+            except OSError as e:
+                sock.close()
+                raise WriterUnavailable(f"单写进程不可用：{self._path}") from e
+            self._sock = sock
+            threading.Thread(target=self._read_replies, args=(sock,), daemon=True).start()
+        return self._sock
+
+    def _read_replies(self, sock: socket.socket) -> None:
+        """
+        读取响应并交给对应的等待方；连接断开时让全部等待中的请求失败
+        """
+        try:
+            with sock.makefile("rb") as replies:
+                for line in replies:
+                    reply = json.loads(line)
+                    future = self._pending.pop(reply["id"], None)
+                    if future is not None:
+                        future.set_result(reply)
+        except (OSError, ValueError):
+            pass
+        with self._lock:
+            if self._sock is sock:
+                self._sock = None
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for future in pending:
+            if not future.done():
+                future.set_exception(ConnectionError("与单写进程的连接已断开"))
+
+    def call(self, name: str, args: tuple, kwargs: dict, site: Optional[str] = None):
+        """
+        请求单写进程执行一个写操作
+
+        Args:
+            name: db 中的写操作函数名
+            args: 位置参数
+            kwargs: 关键字参数
+            site: 站点ID（可选）
+
+        Returns:
+            写操作的返回值（元组以列表形式返回）
+
+        Raises:
+            TimeoutError: 超时未收到响应。请求已经发出，单写进程可能仍会（或已经）提交这次写入，
+                调用方不能假定写入未生效，也不应直接改为本地重试
+        """
+        future: Future = Future()
+        with self._lock:
+            sock = self._ensure_connected()
+            req_id = next(self._ids)
+            self._pending[req_id] = future
+            request = {"id": req_id, "fn": name, "args": list(args), "kwargs": kwargs, "site": site}
+            try:
+                sock.sendall(json.dumps(request, ensure_ascii=False).encode("utf-8") + b"\n")
+            except OSError as e:
+                self._pending.pop(req_id, None)
+                raise ConnectionError("发送写请求失败") from e
+
+        try:
+            reply = future.result(self._timeout)
+        except TimeoutError:
+            # 不再等待这个响应，之后到达的响应直接丢弃
+            self._pending.pop(req_id, None)
+            raise
+        if not reply["ok"]:
+            raise WriterError(reply["error"])
+        return reply["result"]
+
+    def close(self) -> None:
+        """
+        关闭连接
+        """
+        with self._lock:
+            sock, self._sock = self._sock, None
+        if sock is not None:
+            sock.close()
+
+
+def execute(request: Dict) -> Dict:
+    """
+    在单写进程中执行一个写请求
+
+    Args:
+        request: 请求（id、fn、args、kwargs、site）
+
+    Returns:
+        Dict: 响应（id、ok、result 或 error）
+    """
+    func = db._write_functions.get(request.get("fn"))
+    if func is None:
+        return {"id": request.get("id"), "ok": False, "error": f"unknown write function: {request.get('fn')}"}
+    try:
+        with db.use_site(request.get("site")):
+            result = func(*request.get("args", []), **request.get("kwargs", {}))
+        return {"id": request["id"], "ok": True, "result": result}
+    except Exception as e:
+        return {"id": request.get("id"), "ok": False, "error": f"{type(e).__name__}: {e}"}
+
+
+async def serve(socket_path: str, ready: Optional[threading.Event] = None,
+                stop: Optional[asyncio.Event] = None) -> None:
+    """
+    运行单写进程服务：所有连接的请求在同一线程中逐个执行，写事务之间不会争用锁
+
+    Args:
+        socket_path: 套接字路径
+        ready: 开始监听后设置的事件（可选）
+        stop: 设置后停止服务的事件（可选），为None时一直运行
+    """
+    connections = set()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        connections.add(asyncio.current_task())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    reply = execute(json.loads(line))
+                except ValueError:
+                    reply = {"id": None, "ok": False, "error": "invalid request"}
+                writer.write(json.dumps(reply, ensure_ascii=False).encode("utf-8") + b"\n")
+                # 流水线：只在缓冲区积压时才等待发送，连续请求不逐条等待
+                if writer.transport.get_write_buffer_size() > 64 * 1024:
+                    await writer.drain()
+            await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            connections.discard(asyncio.current_task())
+            writer.close()
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = await asyncio.start_unix_server(handle, socket_path)
+    if ready is not None:
+        ready.set()
+    try:
+        async with server:
+            if stop is None:
+                await server.serve_forever()
+            else:
+                await stop.wait()
+        # 停止时断开仍在等待请求的连接
+        for task in list(connections):
+            task.cancel()
+        await asyncio.gather(*connections, return_exceptions=True)
+    finally:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+def main() -> None:
+    """
+    命令行入口
+    """
+    parser = argparse.ArgumentParser(description="停车场数据库单写进程")
+    parser.add_argument("--socket", default=WRITER_SOCKET_PATH, required=WRITER_SOCKET_PATH is None,
+                        help="Unix套接字路径")
+    args = parser.parse_args()
+
+    if db.current_site() is None:
+        db.init_db()
+    else:
+        db.init_sites([db.current_site()])
+    print(f"单写进程已启动：{args.socket}")
+    try:
+        asyncio.run(serve(args.socket))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
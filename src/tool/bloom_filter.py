@@ -0,0 +1,94 @@
+"""
+布隆过滤器模块
+用于在内存中快速判断车牌是否"一定不存在"，避免无谓的数据库查询
+"""
+import hashlib
+import math
+from typing import Iterable
+
+
+class BloomFilter:
+    """
+    布隆过滤器
+    只会出现误判"可能存在"，不会漏判"一定不存在"
+    """
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        """
+        初始化布隆过滤器
+
+        Args:
+            capacity: 预计容纳的元素个数
+            error_rate: 期望的误判率
+        """
+        capacity = max(int(capacity), 1)
+        if not 0 < error_rate < 1:
+            raise ValueError("误判率必须在0和1之间")
+
+        # 按容量和误判率计算位数组长度与哈希函数个数
+        bit_count = math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        self._bit_count = max(bit_count, 8)
+        self._hash_count = max(round(self._bit_count / capacity * math.log(2)), 1)
+        self._bits = bytearray((self._bit_count + 7) // 8)
+        self._count = 0
+
+    def __len__(self) -> int:
+        """
+        已加入的元素个数
+        """
+        return self._count
+
+    def __contains__(self, item: str) -> bool:
+        return self.might_contain(item)
+
+    @property
+    def size_in_bytes(self) -> int:
+        """
+        位数组占用的字节数
+        """
+        return len(self._bits)
+
+    def _positions(self, item: str):
+        """
+        双重哈希生成k个位下标
+        """
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self._hash_count):
+            yield (h1 + i * h2) % self._bit_count
+
+    def add(self, item: str) -> None:
+        """
+        加入一个元素
+
+        Args:
+            item: 元素
+        """
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self._count += 1
+
+    def update(self, items: Iterable[str]) -> None:
+        """
+        批量加入元素
+
+        Args:
+            items: 元素序列
+        """
+        for item in items:
+            self.add(item)
+
+    def might_contain(self, item: str) -> bool:
+        """
+        判断元素是否可能存在
+
+        Args:
+            item: 元素
+
+        Returns:
+            bool: False表示一定不存在，True表示可能存在
+        """
+        for pos in self._positions(item):
+            if not self._bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
@@ -0,0 +1,170 @@
+"""
+在场车辆显示刷新调度模块
+在场表格显示每辆车的停车时长（精确到分钟）和当前费用（整小时变化），
+两者只在各自的边界时刻变化。调度器用最小堆按"下一个边界时刻"排列在场记录，
+每次刷新只取出已到边界的记录重新计算，不必逐行重算整张表
+"""
+import heapq
+import math
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import cfg
+from config.cfg import TIME_FORMAT
+from src.tool.utils import format_duration
+
+
+def _next_boundary(entry: int, now: int) -> int:
+    """
+    计算显示内容下一次变化的时刻
+
+    Args:
+        entry: 进场时刻（秒级时间戳）
+        now: 当前时刻（秒级时间戳）
+
+    Returns:
+        int: 下一次变化的时刻：时长的分钟数进位，或费用进入下一个计费小时（整小时后1秒）
+    """
+    seconds = now - entry
+    next_minute = entry + (seconds // 60 + 1) * 60
+    next_hour = entry + math.ceil(seconds / 3600) * 3600 + 1
+    return min(next_minute, next_hour)
+
+
+class BoundaryScheduler:
+    """
+    在场记录的边界调度器
+    记录ID -> [进场时刻, 显示的时长, 显示的费用, 下一个边界时刻]；
+    堆中的过期项（记录已移除或已重新调度）在弹出时跳过
+    """
+    def __init__(self):
+        """
+        初始化空调度器
+        """
+        self._heap: List[Tuple[int, int]] = []
+        self._rows: Dict[int, list] = {}
+        self._rate = cfg.PARKING_RATE_PER_HOUR
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, record_id: int) -> bool:
+        return record_id in self._rows
+
+    def _display(self, entry: int, now: int) -> Tuple[str, float]:
+        """
+        计算显示的时长和费用（与 calculate_duration、calc_fee 结果一致）
+        """
+        seconds = now - entry
+        return format_duration(seconds), math.ceil(seconds / 3600) * self._rate
+
+    def _schedule(self, record_id: int, row: list, now: int) -> None:
+        """
+        把记录的下一个边界放入堆
+        """
+        row[3] = _next_boundary(row[0], now)
+        heapq.heappush(self._heap, (row[3], record_id))
+
+    def add(self, record_id: int, entry_time: str, now: int) -> Tuple[str, float]:
+        """
+        加入一条在场记录
+
+        Args:
+            record_id: 停车记录ID
+            entry_time: 进场时间字符串
+            now: 当前时刻（秒级时间戳）
+
+        Returns:
+            Tuple[str, float]: 当前应显示的时长和费用
+        """
+        entry = int(datetime.strptime(entry_time, TIME_FORMAT).timestamp())
+        duration, fee = self._display(entry, now)
+        row = [entry, duration, fee, 0]
+        self._rows[record_id] = row
+        self._schedule(record_id, row, now)
+        return duration, fee
+
+    def remove(self, record_id: int) -> bool:
+        """
+        移除一条记录（车辆离场），堆中的对应项在弹出时丢弃
+
+        Args:
+            record_id: 停车记录ID
+
+        Returns:
+            bool: 记录是否存在
+        """
+        if self._rows.pop(record_id, None) is None:
+            return False
+        # 过期项过多时重建堆
+        if len(self._heap) > 2 * len(self._rows) + 64:
+            self._heap = [(row[3], rid) for rid, row in self._rows.items()]
+            heapq.heapify(self._heap)
+        return True
+
+    def sync(self, records: Iterable[Dict], now: int) -> Tuple[List[Tuple[int, str, float]], List[int]]:
+        """
+        与当前在场记录同步：加入新进场的记录，移除已离场的记录
+
+        Args:
+            records: 当前在场记录（含 id、entry_time）
+            now: 当前时刻（秒级时间戳）
+
+        Returns:
+            Tuple: 新加入的 (记录ID, 时长, 费用) 列表和已移除的记录ID列表
+        """
+        current = {record['id']: record['entry_time'] for record in records}
+        removed = [record_id for record_id in self._rows if record_id not in current]
+        for record_id in removed:
+            self.remove(record_id)
+        added = [(record_id, *self.add(record_id, entry_time, now))
+                 for record_id, entry_time in current.items() if record_id not in self._rows]
+        return added, removed
+
+    def due(self, now: int) -> List[Tuple[int, str, float]]:
+        """
+        取出到达边界的记录并重新计算
+
+        Args:
+            now: 当前时刻（秒级时间戳）
+
+        Returns:
+            List[Tuple[int, str, float]]: 显示内容有变化的 (记录ID, 时长, 费用) 列表
+        """
+        if self._rate != cfg.PARKING_RATE_PER_HOUR:
+            # 费率已修改：全部费用需要重算
+            self._rate = cfg.PARKING_RATE_PER_HOUR
+            self._heap = []
+            candidates = list(self._rows)
+        else:
+            candidates = []
+            while self._heap and self._heap[0][0] <= now:
+                at, record_id = heapq.heappop(self._heap)
+                row = self._rows.get(record_id)
+                if row is not None and row[3] == at:
+                    candidates.append(record_id)
+
+        changed = []
+        for record_id in candidates:
+            row = self._rows[record_id]
+            duration, fee = self._display(row[0], now)
+            if (duration, fee) != (row[1], row[2]):
+                row[1], row[2] = duration, fee
+                changed.append((record_id, duration, fee))
+            self._schedule(record_id, row, now)
+        return changed
+
+    def next_due(self) -> Optional[int]:
+        """
+        获取最近的边界时刻
+
+        Returns:
+            Optional[int]: 秒级时间戳，没有记录时返回None
+        """
+        while self._heap:
+            at, record_id = self._heap[0]
+            row = self._rows.get(record_id)
+            if row is not None and row[3] == at:
+                return at
+            heapq.heappop(self._heap)
+        return None
@@ -0,0 +1,179 @@
+"""
+数据导出模块
+把停车记录和收入统计流式导出为CSV或JSONL：记录按ID分批读取、逐批写出，内存占用只与批大小有关；
+文件名以 .gz 结尾时使用gzip压缩；中断后可从上次导出的最后一条记录ID续传：
+普通文件追加写入，gzip文件写入新的分片文件（records.part1.csv.gz 等），已中断的文件不再改动
+
+用法：
+    python -m src.tool.export records --out records_2025-01.csv.gz --start "2025-01-01 00:00:00" --end "2025-01-31 23:59:59"
+    python -m src.tool.export records --out records.jsonl --after-id 120000            # 只导出ID大于120000的记录
+    python -m src.tool.export records --out records.jsonl --after-id 120000 --resume   # 续传
+    python -m src.tool.export revenue --out revenue_2025-01.csv --start "2025-01-01 00:00:00" --end "2025-01-31 23:59:59"
+"""
+import argparse
+import csv
+import gzip
+import json
+import os
+from typing import IO, Callable, Dict, Optional
+
+from config.cfg import EXPORT_CHUNK_SIZE
+from src.database import db
+
+FORMATS = ("csv", "jsonl")
+
+
+def _detect_format(path: str, fmt: Optional[str]) -> str:
+    """
+    确定导出格式：未指定时按扩展名判断（.jsonl / .jsonl.gz 为JSONL，其余为CSV）
+    """
+    if fmt is None:
+        fmt = "jsonl" if path.removesuffix(".gz").endswith(".jsonl") else "csv"
+    if fmt not in FORMATS:
+        raise ValueError(f"不支持的导出格式：{fmt}")
+    return fmt
+
+
+def _open(path: str, append: bool) -> IO[str]:
+    """
+    打开导出文件（gzip文件总是新建）
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, "wt", newline="", encoding="utf-8")
+    return open(path, "at" if append else "wt", newline="", encoding="utf-8")
+
+
+def _part_path(path: str) -> str:
+    """
+    gzip文件续传时使用的分片文件路径：在格式扩展名前插入 .partN，N 取第一个未使用的编号
+    中断时gzip文件的末尾不完整，在其后追加会使整个文件无法解压，因此每次续传写入单独的文件
+    """
+    root, ext = os.path.splitext(path.removesuffix(".gz"))
+    part = 1
+    while os.path.exists(f"{root}.part{part}{ext}.gz"):
+        part += 1
+    return f"{root}.part{part}{ext}.gz"
+
+
+def export_records(path: str,
+                   fmt: Optional[str] = None,
+                   after_id: int = 0,
+                   plate: Optional[str] = None,
+                   start_time: Optional[str] = None,
+                   end_time: Optional[str] = None,
+                   record_type: Optional[str] = None,
+                   chunk_size: int = EXPORT_CHUNK_SIZE,
+                   progress: Optional[Callable[[Dict], None]] = None,
+                   resume: bool = False) -> Dict:
+    """
+    流式导出停车记录
+
+    Args:
+        path: 导出文件路径，以 .gz 结尾时压缩
+        fmt: 'csv' 或 'jsonl'（可选，默认按扩展名判断）
+        after_id: 只导出ID大于它的记录；续传时为上次导出的最后一条记录ID
+        plate: 车牌号（可选）
+        start_time: 进场开始时间（可选）
+        end_time: 进场结束时间（可选）
+        record_type: 记录类型（可选）
+        chunk_size: 每批记录数
+        progress: 进度回调（可选），每写完一批调用一次
+        resume: 是否续传：导出文件必须已存在，不再写表头；普通文件追加写入，gzip文件写入新的分片文件
+
+    Returns:
+        Dict: 导出结果（path 本次写入的文件、last_id、exported、total）
+    """
+    fmt = _detect_format(path, fmt)
+    if resume:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"续传的导出文件不存在：{path}")
+        if path.endswith(".gz"):
+            path = _part_path(path)
+    state = {
+        "path": path,
+        "last_id": after_id,
+        "exported": 0,
+        "total": db.count_parking_records(after_id, plate, start_time, end_time, record_type),
+    }
+
+    with _open(path, append=resume) as f:
+        if fmt == "csv":
+            writer = csv.writer(f)
+            if not resume:
+                writer.writerow(db.EXPORT_COLUMNS)
+
+        for rows in db.iter_parking_records(after_id, chunk_size, plate, start_time, end_time, record_type):
+            if fmt == "csv":
+                writer.writerows(rows)
+            else:
+                f.writelines(json.dumps(dict(zip(db.EXPORT_COLUMNS, row)), ensure_ascii=False) + "\n"
+                             for row in rows)
+            f.flush()
+            state["last_id"] = rows[-1][0]
+            state["exported"] += len(rows)
+            if progress:
+                progress(dict(state))
+    return state
+
+
+def export_revenue(path: str, start_time: str, end_time: str, fmt: Optional[str] = None) -> Dict:
+    """
+    导出收入统计（按日汇总，数据量与天数成正比）
+
+    Args:
+        path: 导出文件路径，以 .gz 结尾时压缩
+        start_time: 开始时间
+        end_time: 结束时间
+        fmt: 'csv' 或 'jsonl'（可选，默认按扩展名判断）
+
+    Returns:
+        Dict: 导出结果（days、revenue）
+    """
+    fmt = _detect_format(path, fmt)
+    rows = db.get_revenue_statistics(start_time, end_time)
+
+    with _open(path, append=False) as f:
+        if fmt == "csv":
+            writer = csv.writer(f)
+            writer.writerow(("date", "revenue"))
+            writer.writerows(rows)
+        else:
+            f.writelines(json.dumps({"date": date, "revenue": revenue}, ensure_ascii=False) + "\n"
+                         for date, revenue in rows)
+    return {"days": len(rows), "revenue": sum(revenue or 0.0 for _, revenue in rows)}
+
+
+def main() -> None:
+    """
+    命令行入口
+    """
+    parser = argparse.ArgumentParser(description="导出停车记录或收入统计（CSV/JSONL，可gzip压缩）")
+    parser.add_argument("kind", choices=("records", "revenue"), help="导出内容")
+    parser.add_argument("--out", required=True, help="导出文件路径，以 .gz 结尾时压缩")
+    parser.add_argument("--format", choices=FORMATS, help="导出格式，默认按扩展名判断")
+    parser.add_argument("--start", help="进场开始时间，如 2025-01-01 00:00:00")
+    parser.add_argument("--end", help="进场结束时间，如 2025-01-31 23:59:59")
+    parser.add_argument("--plate", help="车牌号（仅停车记录）")
+    parser.add_argument("--type", choices=("resident", "visitor"), help="记录类型（仅停车记录）")
+    parser.add_argument("--after-id", type=int, default=0, help="只导出ID大于它的记录（续传时为上次导出的最后一条记录ID）")
+    parser.add_argument("--resume", action="store_true", help="续传到已有的导出文件（gzip文件写入新的分片文件）")
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE, help="每批记录数")
+    args = parser.parse_args()
+
+    if args.kind == "revenue":
+        if not args.start or not args.end:
+            parser.error("导出收入统计需要 --start 和 --end")
+        result = export_revenue(args.out, args.start, args.end, args.format)
+        print(f"导出完成：{result['days']} 天，总收入 {result['revenue']:.2f}")
+        return
+
+    def show_progress(state: Dict) -> None:
+        print(f"已导出 {state['exported']}/{state['total']} 条，当前ID {state['last_id']}")
+
+    result = export_records(args.out, args.format, args.after_id, args.plate, args.start, args.end,
+                            args.type, args.chunk_size, show_progress, args.resume)
+    print(f"导出完成：共 {result['exported']} 条，最后ID {result['last_id']}，文件 {result['path']}")
+
+
+if __name__ == "__main__":
+    main()
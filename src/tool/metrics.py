@@ -0,0 +1,290 @@
+"""
+性能统计模块
+记录数据库操作和计费函数的调用次数、耗时分布、返回行数和锁等待时间
+未启用时装饰器只多一次布尔判断，几乎没有额外开销
+"""
+import functools
+import inspect
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+from config.cfg import METRICS_ENABLED, METRICS_SAMPLE_SIZE
+
+# 是否启用统计
+_enabled = METRICS_ENABLED
+
+# 函数名 -> 统计数据
+_registry: Dict[str, "CallStats"] = {}
+_registry_lock = threading.Lock()
+
+# 每个线程当前正在执行的被统计函数栈，用于把锁等待时间归到对应调用上
+_local = threading.local()
+
+
+class CallStats:
+    """
+    单个函数的统计数据
+    """
+    __slots__ = ("name", "calls", "errors", "total_time", "max_time",
+                 "rows", "lock_wait", "_samples", "_lock")
+
+    def __init__(self, name: str):
+        """
+        初始化统计数据
+
+        Args:
+            name: 函数全名
+        """
+        self.name = name
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.rows = 0
+        self.lock_wait = 0.0
+        # 只保留最近的若干次耗时用于计算分位数，内存占用固定
+        self._samples = deque(maxlen=METRICS_SAMPLE_SIZE)
+        self._lock = threading.Lock()
+
+    def record(self, elapsed: float, rows: int, lock_wait: float, failed: bool) -> None:
+        """
+        记录一次调用
+        """
+        with self._lock:
+            self.calls += 1
+            if failed:
+                self.errors += 1
+            self.total_time += elapsed
+            if elapsed > self.max_time:
+                self.max_time = elapsed
+            self.rows += rows
+            self.lock_wait += lock_wait
+            self._samples.append(elapsed)
+
+    def percentile(self, p: float) -> float:
+        """
+        计算最近调用耗时的分位数
+
+        Args:
+            p: 百分位（0-100）
+
+        Returns:
+            float: 耗时（秒）
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return 0.0
+        index = min(int(round(p / 100 * (len(samples) - 1))), len(samples) - 1)
+        return samples[index]
+
+    def to_dict(self) -> Dict:
+        """
+        转换为字典，时间单位为毫秒
+        """
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "errors": self.errors,
+            "total_ms": self.total_time * 1000,
+            "avg_ms": self.total_time * 1000 / self.calls if self.calls else 0.0,
+            "p50_ms": self.percentile(50) * 1000,
+            "p95_ms": self.percentile(95) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "max_ms": self.max_time * 1000,
+            "rows": self.rows,
+            "lock_wait_ms": self.lock_wait * 1000,
+        }
+
+
+def enable() -> None:
+    """
+    启用统计
+    """
+    global _enabled
+    _enabled = True
+
+
+def disable() -> None:
+    """
+    停用统计（已有数据保留）
+    """
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    """
+    是否已启用统计
+    """
+    return _enabled
+
+
+def reset() -> None:
+    """
+    清空所有统计数据
+    """
+    with _registry_lock:
+        _registry.clear()
+
+
+def _get_stats(name: str) -> CallStats:
+    """
+    获取或创建函数的统计对象
+    """
+    stats = _registry.get(name)
+    if stats is None:
+        with _registry_lock:
+            stats = _registry.setdefault(name, CallStats(name))
+    return stats
+
+
+def _count_rows(result) -> int:
+    """
+    估算函数返回的行数
+    """
+    if result is None or isinstance(result, (bool, int, float, str)):
+        return 0
+    if isinstance(result, dict):
+        return 1
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    return 0
+
+
+def instrument(func: Callable) -> Callable:
+    """
+    统计装饰器
+    记录被装饰函数的调用次数、耗时、返回行数和锁等待时间
+    生成器函数按整个迭代过程统计一次调用：耗时只计生成器内部的执行时间，行数为各批行数之和
+
+    Args:
+        func: 被统计的函数
+
+    Returns:
+        Callable: 包装后的函数
+    """
+    name = f"{func.__module__}.{func.__qualname__}"
+    if inspect.isgeneratorfunction(func):
+        return _instrument_generator(func, name)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return func(*args, **kwargs)
+
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        # 栈中每项保存本次调用累计的锁等待时间
+        stack.append(0.0)
+        failed = False
+        result = None
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+            return result
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            lock_wait = stack.pop()
+            _get_stats(name).record(elapsed, _count_rows(result), lock_wait, failed)
+
+    return wrapper
+
+
+def _instrument_generator(func: Callable, name: str) -> Callable:
+    """
+    生成器函数的统计装饰器（消费方处理每批数据的时间不计入）
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            yield from func(*args, **kwargs)
+            return
+
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        gen = func(*args, **kwargs)
+        elapsed = lock_wait = 0.0
+        rows = 0
+        failed = False
+        try:
+            while True:
+                stack.append(0.0)
+                start = time.perf_counter()
+                try:
+                    item = next(gen)
+                except StopIteration:
+                    return
+                except BaseException:
+                    failed = True
+                    raise
+                finally:
+                    elapsed += time.perf_counter() - start
+                    lock_wait += stack.pop()
+                rows += _count_rows(item)
+                yield item
+        finally:
+            gen.close()
+            _get_stats(name).record(elapsed, rows, lock_wait, failed)
+
+    return wrapper
+
+
+def record_lock_wait(seconds: float) -> None:
+    """
+    把一段锁等待时间记到当前线程所有正在执行的被统计调用上
+
+    Args:
+        seconds: 等待时间（秒）
+    """
+    if not _enabled:
+        return
+    stack = getattr(_local, "stack", None)
+    if stack:
+        for i in range(len(stack)):
+            stack[i] += seconds
+
+
+def get_stats(name: Optional[str] = None) -> List[Dict]:
+    """
+    获取统计数据
+
+    Args:
+        name: 函数全名（可选），为空时返回全部
+
+    Returns:
+        List[Dict]: 统计数据列表，按累计耗时降序
+    """
+    with _registry_lock:
+        items = list(_registry.values())
+    if name is not None:
+        items = [stats for stats in items if stats.name == name]
+    result = [stats.to_dict() for stats in items]
+    result.sort(key=lambda item: item["total_ms"], reverse=True)
+    return result
+
+
+def format_report() -> str:
+    """
+    生成文本格式的统计报表
+
+    Returns:
+        str: 报表内容
+    """
+    header = (f"{'function':<48}{'calls':>8}{'errors':>8}{'total_ms':>12}{'avg_ms':>10}"
+              f"{'p50_ms':>10}{'p95_ms':>10}{'p99_ms':>10}{'max_ms':>10}{'rows':>10}{'lock_ms':>10}")
+    lines = [header, "-" * len(header)]
+    for item in get_stats():
+        lines.append(
+            f"{item['name']:<48}{item['calls']:>8}{item['errors']:>8}{item['total_ms']:>12.2f}"
+            f"{item['avg_ms']:>10.3f}{item['p50_ms']:>10.3f}{item['p95_ms']:>10.3f}"
+            f"{item['p99_ms']:>10.3f}{item['max_ms']:>10.3f}{item['rows']:>10}{item['lock_wait_ms']:>10.3f}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,332 @@
+"""
+消息通知模块
+向全部居民手机号群发短信（如"车库即将停满"提醒）
+手机号从数据库分批读取，去重、限速后通过可替换的发送通道并发发送；
+本地用文件发件箱或socket网关桩代替真实短信平台
+
+启动本地短信网关桩：
+    python -m src.tool.notifier --serve
+"""
+import abc
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from config import cfg
+from src.database import db
+
+
+class SmsTransport(abc.ABC):
+    """
+    短信发送通道基类
+    """
+    @abc.abstractmethod
+    async def send(self, phone: str, message: str) -> bool:
+        """
+        发送一条短信
+
+        Args:
+            phone: 手机号
+            message: 短信内容
+
+        Returns:
+            bool: 发送结果
+        """
+
+    async def close(self) -> None:
+        """
+        释放通道资源
+        """
+
+
+class FileSmsTransport(SmsTransport):
+    """
+    文件发件箱通道：每条短信以一行JSON追加到文件中
+    """
+    def __init__(self, path: str):
+        """
+        初始化文件通道
+
+        Args:
+            path: 发件箱文件路径
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    async def send(self, phone: str, message: str) -> bool:
+        # 单线程事件循环内的写操作不会交错，无需加锁
+        self._file.write(json.dumps({"phone": phone, "message": message, "time": time.time()},
+                                    ensure_ascii=False) + "\n")
+        return True
+
+    async def close(self) -> None:
+        self._file.close()
+
+
+class SocketSmsTransport(SmsTransport):
+    """
+    socket网关通道：按行发送JSON请求，网关逐行回复 OK
+    维护与并发数相同的长连接池，避免每条短信重新建连
+    """
+    def __init__(self, host: str, port: int, pool_size: int):
+        """
+        初始化socket通道
+
+        Args:
+            host: 网关地址
+            port: 网关端口
+            pool_size: 连接池大小
+        """
+        self._host = host
+        self._port = port
+        self._pool_size = pool_size
+        self._pool: Optional[asyncio.Queue] = None
+        self._connections = []
+
+    async def _acquire(self):
+        if self._pool is None:
+            self._pool = asyncio.Queue()
+            for _ in range(self._pool_size):
+                self._pool.put_nowait(None)
+        conn = await self._pool.get()
+        if conn is None:
+            try:
+                conn = await asyncio.open_connection(self._host, self._port)
+            except BaseException:
+                # 建连失败（或被取消）时归还空位，否则连接池会越来越小直至全部发送挂起
+                self._pool.put_nowait(None)
+                raise
+            self._connections.append(conn)
+        return conn
+
+    async def send(self, phone: str, message: str) -> bool:
+        try:
+            conn = await self._acquire()
+        except (ConnectionError, OSError):
+            return False
+        reader, writer = conn
+        try:
+            writer.write(json.dumps({"phone": phone, "message": message}, ensure_ascii=False).encode() + b"\n")
+            await writer.drain()
+            reply = await reader.readline()
+        except (ConnectionError, OSError):
+            reply = b""
+        if not reply:
+            # 连接已断开（网关关闭连接时读到空行），下次发送时重新建立
+            writer.close()
+            self._connections.remove(conn)
+            self._pool.put_nowait(None)
+            return False
+        self._pool.put_nowait(conn)
+        return reply.strip() == b"OK"
+
+    async def close(self) -> None:
+        for _, writer in self._connections:
+            writer.close()
+        self._connections.clear()
+
+
+class RateLimiter:
+    """
+    令牌桶限速器
+    """
+    def __init__(self, rate: float):
+        """
+        初始化限速器
+
+        Args:
+            rate: 每秒允许的次数
+        """
+        self._rate = rate
+        self._tokens = rate
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """
+        获取一个令牌，令牌不足时等待
+        """
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self._rate, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+
+
+def create_transport() -> SmsTransport:
+    """
+    按配置创建短信发送通道
+
+    Returns:
+        SmsTransport: 发送通道
+    """
+    if cfg.SMS_TRANSPORT == "socket":
+        return SocketSmsTransport(cfg.SMS_GATEWAY_HOST, cfg.SMS_GATEWAY_PORT, cfg.NOTIFY_CONCURRENCY)
+    return FileSmsTransport(cfg.SMS_OUTBOX_PATH)
+
+
+async def broadcast_to_residents(message: str,
+                                 transport: Optional[SmsTransport] = None,
+                                 concurrency: Optional[int] = None,
+                                 rate: Optional[float] = None,
+                                 chunk_size: Optional[int] = None) -> Dict[str, int]:
+    """
+    向全部居民群发短信
+
+    Args:
+        message: 短信内容
+        transport: 发送通道（可选，默认按配置创建，发送完毕后关闭）
+        concurrency: 并发发送数（可选）
+        rate: 每秒发送上限（可选）
+        chunk_size: 每批读取的手机号数（可选）
+
+    Returns:
+        Dict[str, int]: 发送统计（sent、failed、duplicate）
+    """
+    concurrency = concurrency or cfg.NOTIFY_CONCURRENCY
+    chunk_size = chunk_size or cfg.NOTIFY_CHUNK_SIZE
+    limiter = RateLimiter(rate or cfg.NOTIFY_RATE_PER_SECOND)
+    own_transport = transport is None
+    transport = transport or create_transport()
+
+    stats = {"sent": 0, "failed": 0, "duplicate": 0}
+    seen = set()
+    # 有界队列：读取速度超过发送速度时读取方等待，内存占用有上限
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 4)
+    loop = asyncio.get_running_loop()
+
+    async def worker():
+        while True:
+            phone = await queue.get()
+            if phone is None:
+                return
+            await limiter.acquire()
+            try:
+                ok = await transport.send(phone, message)
+            except Exception:
+                ok = False
+            stats["sent" if ok else "failed"] += 1
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        # 数据库读取放到线程池中执行，不阻塞事件循环
+        chunks = db.iter_resident_phones(chunk_size)
+        while True:
+            phones = await loop.run_in_executor(None, next, chunks, None)
+            if phones is None:
+                break
+            for phone in phones:
+                phone = phone.strip()
+                if phone in seen:
+                    stats["duplicate"] += 1
+                    continue
+                seen.add(phone)
+                await queue.put(phone)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
+        if own_transport:
+            await transport.close()
+    return stats
+
+
+# 上次发送车位提醒的时间，用于控制同类通知的频率
+_last_space_alert = 0.0
+_space_alert_lock = threading.Lock()
+
+
+def notify_lot_nearly_full(free_spaces: int) -> bool:
+    """
+    在后台线程中向全部居民发送车位提醒，不阻塞调用方（如入场登记）
+    冷却时间内重复调用会被忽略
+
+    Args:
+        free_spaces: 当前剩余车位数
+
+    Returns:
+        bool: 是否启动了发送
+    """
+    global _last_space_alert
+
+    with _space_alert_lock:
+        now = time.monotonic()
+        if _last_space_alert and now - _last_space_alert < cfg.NOTIFY_COOLDOWN_SECONDS:
+            return False
+        _last_space_alert = now
+
+    if free_spaces <= 0:
+        message = "【智慧停车场】车库已满，请合理安排出行。"
+    else:
+        message = f"【智慧停车场】车库即将停满，剩余车位{free_spaces}个。"
+
+    thread = threading.Thread(target=asyncio.run, args=(broadcast_to_residents(message),), daemon=True)
+    thread.start()
+    return True
+
+
+async def serve_stub_gateway(host: str, port: int, outbox_path: str) -> None:
+    """
+    本地短信网关桩：接收按行发送的JSON短信，写入发件箱文件并回复 OK
+
+    Args:
+        host: 监听地址
+        port: 监听端口
+        outbox_path: 发件箱文件路径
+    """
+    outbox = FileSmsTransport(outbox_path)
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                request = json.loads(line)
+                await outbox.send(request["phone"], request["message"])
+                writer.write(b"OK\n")
+            except (ValueError, KeyError):
+                writer.write(b"ERROR\n")
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await outbox.close()
+
+
+def main() -> None:
+    """
+    命令行入口
+    """
+    parser = argparse.ArgumentParser(description="居民短信群发")
+    parser.add_argument("--serve", action="store_true", help="启动本地短信网关桩")
+    parser.add_argument("--message", help="向全部居民群发的短信内容")
+    args = parser.parse_args()
+
+    if args.serve:
+        print(f"短信网关桩已启动：{cfg.SMS_GATEWAY_HOST}:{cfg.SMS_GATEWAY_PORT}")
+        asyncio.run(serve_stub_gateway(cfg.SMS_GATEWAY_HOST, cfg.SMS_GATEWAY_PORT, cfg.SMS_OUTBOX_PATH))
+    elif args.message:
+        start = time.perf_counter()
+        stats = asyncio.run(broadcast_to_residents(args.message))
+        print(f"发送完成：{stats}，耗时 {time.perf_counter() - start:.2f} 秒")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
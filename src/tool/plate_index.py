@@ -0,0 +1,113 @@
+"""
+车牌模糊匹配模块
+基于三元组（trigram）的内存倒排索引，容忍车牌识别中常见的易混字符（如 8/B、0/D）
+"""
+from array import array
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+from src.tool.utils import normalize_plate
+
+# 易混字符归一：同一组字符映射为同一个代表字符
+_CONFUSABLE_GROUPS = ("8B", "0DOQ", "1IL", "5S", "2Z", "6G")
+_CONFUSABLE_MAP = {ch: group[0] for group in _CONFUSABLE_GROUPS for ch in group}
+
+
+def fold_confusables(plate: str) -> str:
+    """
+    把车牌规范化（全角转半角、去除分隔符、大写，同 normalize_plate）后，易混字符归一为代表字符
+
+    Args:
+        plate: 车牌号
+
+    Returns:
+        str: 归一后的车牌号
+    """
+    plate = normalize_plate(plate)
+    return "".join(_CONFUSABLE_MAP.get(ch, ch) for ch in plate)
+
+
+def _trigrams(text: str) -> set:
+    """
+    生成字符串的三元组集合（首尾补位，短车牌也能产生三元组）
+    """
+    padded = f"^{text}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class PlateTrigramIndex:
+    """
+    车牌三元组倒排索引
+    三元组 -> 紧凑的ID数组，内存占用与车牌数量线性相关
+    """
+    def __init__(self):
+        """
+        初始化空索引
+        """
+        self._postings: Dict[str, array] = defaultdict(lambda: array("I"))
+        self._plates: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._plates)
+
+    def add(self, item_id: int, plate: str) -> None:
+        """
+        加入一个车牌
+
+        Args:
+            item_id: 车牌所属记录的ID（如居民ID）
+            plate: 车牌号
+        """
+        folded = fold_confusables(plate)
+        self._plates[item_id] = folded
+        for gram in _trigrams(folded):
+            self._postings[gram].append(item_id)
+
+    def update(self, items: Iterable[Tuple[int, str]]) -> None:
+        """
+        批量加入车牌
+
+        Args:
+            items: (ID, 车牌号) 序列
+        """
+        for item_id, plate in items:
+            self.add(item_id, plate)
+
+    def search(self, plate: str, limit: int = 10, min_score: float = 0.4) -> List[Tuple[int, float]]:
+        """
+        模糊查找相似车牌
+
+        Args:
+            plate: 待查车牌号（可能含识别错误）
+            limit: 最多返回条数
+            min_score: 最低相似度（三元组Jaccard系数）
+
+        Returns:
+            List[Tuple[int, float]]: (ID, 相似度) 列表，按相似度降序
+        """
+        query = _trigrams(fold_confusables(plate))
+        postings = [self._postings[gram] for gram in query if gram in self._postings]
+        if not postings:
+            return []
+
+        # 省份+字母前缀等高频三元组几乎命中所有车牌，只用较稀有的三元组召回候选
+        cutoff = max(len(self._plates) // 10, 64)
+        selective = [ids for ids in postings if len(ids) <= cutoff] or postings
+
+        # 至少共享两个召回三元组的才计算相似度（只有一个召回三元组时放宽为一个）
+        hits = Counter()
+        for ids in selective:
+            hits.update(ids)
+        min_hits = 2 if len(selective) > 1 else 1
+
+        scored = []
+        for item_id, count in hits.items():
+            if count < min_hits:
+                continue
+            grams = _trigrams(self._plates[item_id])
+            shared = len(query & grams)
+            score = shared / (len(query) + len(grams) - shared)
+            if score >= min_score:
+                scored.append((item_id, score))
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        return scored[:limit]
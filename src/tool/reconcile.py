@@ -0,0 +1,181 @@
+"""
+历史费用核对模块
+按当前（或指定）费率重新计算已结算停车记录的费用，与库中存储的费用比对并输出差异报告
+记录分批读取，由进程池并行计算，支持断点续跑
+
+用法：
+    python -m src.tool.reconcile --report fee_diff.csv --checkpoint fee_diff.json [--rate 6]
+"""
+import argparse
+import csv
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import cfg
+from config.cfg import RECONCILE_CHUNK_SIZE
+from src.database import db
+from src.tool import utils
+
+# 报告文件表头
+REPORT_HEADER = ["record_id", "plate", "entry_time", "exit_time", "stored_fee", "expected_fee", "difference"]
+
+# 费用差异容忍度（元）
+FEE_TOLERANCE = 0.005
+
+
+def price_chunk(rows: List[Tuple], rate: float) -> Tuple[int, List[List]]:
+    """
+    重新计算一批记录的费用（在子进程中执行）
+
+    Args:
+        rows: (id, plate, entry_time, exit_time, fee) 元组列表
+        rate: 每小时费率
+
+    Returns:
+        Tuple[int, List[List]]: 本批最后一条记录ID和差异行列表
+    """
+    discrepancies = []
+    for record_id, plate, entry_time, exit_time, stored_fee in rows:
+        stored_fee = stored_fee or 0.0
+        try:
+            expected_fee = utils.calc_fee(entry_time, exit_time, rate)
+        except (TypeError, ValueError):
+            # 时间格式损坏的记录同样写入报告
+            discrepancies.append([record_id, plate, entry_time, exit_time, stored_fee, "", "invalid_time"])
+            continue
+        if abs(expected_fee - stored_fee) > FEE_TOLERANCE:
+            discrepancies.append([record_id, plate, entry_time, exit_time, stored_fee,
+                                  expected_fee, round(expected_fee - stored_fee, 2)])
+    return rows[-1][0], discrepancies
+
+
+def _load_checkpoint(path: Optional[str]) -> Dict:
+    """
+    读取断点文件
+    """
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"last_id": 0, "checked": 0, "mismatched": 0}
+
+
+def _save_checkpoint(path: Optional[str], state: Dict) -> None:
+    """
+    写入断点文件（先写临时文件再替换，避免中断时留下半个文件）
+    """
+    if not path:
+        return
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def reconcile_fees(report_path: str,
+                   checkpoint_path: Optional[str] = None,
+                   rate: Optional[float] = None,
+                   start_time: Optional[str] = None,
+                   end_time: Optional[str] = None,
+                   chunk_size: int = RECONCILE_CHUNK_SIZE,
+                   workers: Optional[int] = None,
+                   progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """
+    核对历史停车记录的费用
+
+    Args:
+        report_path: 差异报告CSV文件路径
+        checkpoint_path: 断点文件路径（可选），存在时从上次位置继续
+        rate: 每小时费率（可选，默认使用当前配置的费率）
+        start_time: 进场开始时间（可选）
+        end_time: 进场结束时间（可选）
+        chunk_size: 每批记录数
+        workers: 进程数（可选，默认使用全部CPU核心）
+        progress: 进度回调（可选），每完成一批调用一次
+
+    Returns:
+        Dict: 核对结果汇总（last_id、checked、mismatched）
+
+    Raises:
+        ValueError: 断点是用不同的费率或时间范围生成的
+        FileNotFoundError: 断点已有进度但报告文件不存在（或比断点记录的长度短）
+    """
+    if rate is None:
+        rate = cfg.PARKING_RATE_PER_HOUR
+    workers = workers or os.cpu_count() or 1
+
+    # 断点记录任务参数，续跑时参数必须一致，否则两份报告会混在同一个文件里
+    job = {"rate": rate, "start_time": start_time, "end_time": end_time}
+    checkpoint = _load_checkpoint(checkpoint_path)
+    resuming = checkpoint["last_id"] > 0
+    if resuming:
+        if checkpoint.get("job") != job:
+            raise ValueError(f"断点文件的任务参数 {checkpoint.get('job')} 与本次参数 {job} 不一致")
+        if not os.path.exists(report_path):
+            raise FileNotFoundError(f"断点已核对到ID {checkpoint['last_id']}，但报告文件不存在：{report_path}")
+        # 写出报告与保存断点之间中断时，报告末尾是断点之后的批次，截掉后重新核对，避免重复行
+        report_bytes = checkpoint.get("report_bytes")
+        if report_bytes is not None:
+            if os.path.getsize(report_path) < report_bytes:
+                raise FileNotFoundError(f"报告文件不完整（短于断点记录的 {report_bytes} 字节）：{report_path}")
+            os.truncate(report_path, report_bytes)
+    state = {key: checkpoint[key] for key in ("last_id", "checked", "mismatched")}
+
+    with open(report_path, "a" if resuming else "w", newline="", encoding="utf-8") as report, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        writer = csv.writer(report)
+        if not resuming:
+            writer.writerow(REPORT_HEADER)
+
+        # 最多同时提交 2*workers 批，保证内存占用有上限；按提交顺序收取结果，断点才能单调前进
+        pending = deque()
+
+        def drain_one():
+            future, count = pending.popleft()
+            last_id, discrepancies = future.result()
+            writer.writerows(discrepancies)
+            report.flush()
+            state["last_id"] = last_id
+            state["checked"] += count
+            state["mismatched"] += len(discrepancies)
+            # 断点同时记录报告已写出的字节数，续跑时据此截掉断点之后写出的行
+            _save_checkpoint(checkpoint_path, dict(state, job=job, report_bytes=os.fstat(report.fileno()).st_size))
+            if progress:
+                progress(dict(state))
+
+        for rows in db.iter_closed_parking_records(state["last_id"], chunk_size, start_time, end_time):
+            pending.append((pool.submit(price_chunk, rows, rate), len(rows)))
+            if len(pending) >= workers * 2:
+                drain_one()
+        while pending:
+            drain_one()
+
+    return state
+
+
+def main() -> None:
+    """
+    命令行入口
+    """
+    parser = argparse.ArgumentParser(description="按费率重新核对历史停车记录的费用")
+    parser.add_argument("--report", required=True, help="差异报告CSV文件路径")
+    parser.add_argument("--checkpoint", help="断点文件路径，用于中断后继续")
+    parser.add_argument("--rate", type=float, help="每小时费率，默认使用配置值")
+    parser.add_argument("--start", help="进场开始时间，如 2025-01-01 00:00:00")
+    parser.add_argument("--end", help="进场结束时间，如 2025-03-31 23:59:59")
+    parser.add_argument("--chunk-size", type=int, default=RECONCILE_CHUNK_SIZE, help="每批记录数")
+    parser.add_argument("--workers", type=int, help="进程数，默认使用全部CPU核心")
+    args = parser.parse_args()
+
+    def show_progress(state: Dict) -> None:
+        print(f"已核对 {state['checked']} 条，差异 {state['mismatched']} 条，当前ID {state['last_id']}")
+
+    result = reconcile_fees(args.report, args.checkpoint, args.rate, args.start, args.end,
+                            args.chunk_size, args.workers, show_progress)
+    print(f"核对完成：共 {result['checked']} 条，差异 {result['mismatched']} 条")
+
+
+if __name__ == "__main__":
+    main()
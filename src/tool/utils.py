@@ -2,20 +2,27 @@
 工具函数模块
 提供停车场管理系统所需的辅助功能
 """
-from datetime import datetime
+from datetime import datetime, timedelta
 import math
-from typing import Optional
+import re
+import threading
+import unicodedata
+from typing import Dict, Optional, Tuple
 
-from config.cfg import TIME_FORMAT, PARKING_RATE_PER_HOUR
+from config import cfg
+from config.cfg import TIME_FORMAT
+from src.tool import metrics
 
 
-def calc_fee(entry_time: str, exit_time: str) -> float:
+@metrics.instrument
+def calc_fee(entry_time: str, exit_time: str, rate: Optional[float] = None) -> float:
     """
     计算停车费用
     
     Args:
         entry_time: 进场时间字符串
         exit_time: 出场时间字符串
+        rate: 每小时费率（可选，默认使用当前配置的费率）
         
     Returns:
         float: 停车费用（向上取整小时计算）
@@ -31,11 +38,118 @@ def calc_fee(entry_time: str, exit_time: str) -> float:
     duration_hours = math.ceil(duration_seconds / 3600)
     
     # 计算费用
-    fee = duration_hours * PARKING_RATE_PER_HOUR
+    if rate is None:
+        rate = cfg.PARKING_RATE_PER_HOUR
+    fee = duration_hours * rate
     
     return fee
 
 
+# 费用报价缓存：记录ID -> (进场时间, 费率, 费用, 生效时间, 下次变化时间)
+# 费用只在整小时边界变化，当前时间落在 [生效时间, 下次变化时间) 内时直接复用
+_fee_quotes: Dict[int, Tuple[str, float, float, str, str]] = {}
+_fee_quotes_lock = threading.Lock()
+
+
+@metrics.instrument
+def quote_fee(record_id: int, entry_time: str, now: Optional[str] = None) -> Tuple[float, str]:
+    """
+    查询在场车辆的当前费用（带缓存）
+    
+    Args:
+        record_id: 停车记录ID
+        entry_time: 进场时间字符串
+        now: 当前时间字符串（可选，默认为当前时间）
+        
+    Returns:
+        Tuple[float, str]: 当前费用和费用下次变化的时间
+    """
+    if now is None:
+        now = now_str()
+    rate = cfg.PARKING_RATE_PER_HOUR
+    
+    # 时间字符串格式固定，可直接按字符串比较先后
+    quote = _fee_quotes.get(record_id)
+    if quote and quote[0] == entry_time and quote[1] == rate and quote[3] <= now < quote[4]:
+        return quote[2], quote[4]
+    
+    fee = calc_fee(entry_time, now, rate)
+    # 计费小时数为 h 时，停车时长在 ((h-1)*3600, h*3600] 秒内费用不变
+    entry_dt = datetime.strptime(entry_time, TIME_FORMAT)
+    now_dt = datetime.strptime(now, TIME_FORMAT)
+    hours = math.ceil((now_dt - entry_dt).total_seconds() / 3600)
+    valid_from = (entry_dt + timedelta(hours=hours - 1, seconds=1)).strftime(TIME_FORMAT)
+    next_change = (entry_dt + timedelta(hours=hours, seconds=1)).strftime(TIME_FORMAT)
+    
+    with _fee_quotes_lock:
+        _fee_quotes.pop(record_id, None)
+        if len(_fee_quotes) >= cfg.FEE_QUOTE_CACHE_SIZE:
+            # 淘汰最早缓存的报价
+            _fee_quotes.pop(next(iter(_fee_quotes)))
+        _fee_quotes[record_id] = (entry_time, rate, fee, valid_from, next_change)
+    return fee, next_change
+
+
+def invalidate_fee_quote(record_id: int) -> None:
+    """
+    删除停车记录的费用报价（记录结算关闭时调用）
+    
+    Args:
+        record_id: 停车记录ID
+    """
+    with _fee_quotes_lock:
+        _fee_quotes.pop(record_id, None)
+
+
+def clear_fee_quotes() -> None:
+    """
+    清空全部费用报价
+    """
+    with _fee_quotes_lock:
+        _fee_quotes.clear()
+
+
+def set_parking_rate(rate: float) -> None:
+    """
+    修改停车费率，并清空按旧费率计算的费用报价
+    
+    Args:
+        rate: 每小时费率
+    """
+    cfg.PARKING_RATE_PER_HOUR = rate
+    clear_fee_quotes()
+
+
+# 车牌中常见的分隔符（空白、间隔点、横线等）
+_PLATE_SEPARATORS = re.compile(r"[\s·•・\-_.]+")
+
+# 繁体/异体省份简称 -> 标准简称
+_PROVINCE_VARIANTS = str.maketrans({
+    "滬": "沪", "遼": "辽", "黒": "黑", "蘇": "苏", "贛": "赣", "魯": "鲁",
+    "閩": "闽", "粵": "粤", "瓊": "琼", "貴": "贵", "雲": "云", "陝": "陕",
+    "寧": "宁", "甯": "宁", "晉": "晋", "靑": "青",
+})
+
+
+def normalize_plate(plate: str) -> str:
+    """
+    车牌号规范化，得到用于比较和索引的标准形式
+    1. 全角字符转半角（ＡＢ１２ -> AB12）
+    2. 去除空白和分隔符
+    3. 字母转大写
+    4. 繁体/异体省份简称转为标准简称
+    
+    Args:
+        plate: 用户输入或识别得到的车牌号
+        
+    Returns:
+        str: 规范化后的车牌号
+    """
+    plate = unicodedata.normalize("NFKC", plate or "")
+    plate = _PLATE_SEPARATORS.sub("", plate).upper()
+    return plate.translate(_PROVINCE_VARIANTS)
+
+
 def now_str() -> str:
     """
     获取当前时间的字符串表示
@@ -110,8 +224,19 @@ def calculate_duration(entry_time: str, exit_time: Optional[str] = None) -> str:
     else:
         end_dt = datetime.now()
     
-    duration_seconds = (end_dt - entry_dt).total_seconds()
+    return format_duration((end_dt - entry_dt).total_seconds())
+
+
+def format_duration(duration_seconds: float) -> str:
+    """
+    把停车时长格式化为"X小时Y分钟"
     
+    Args:
+        duration_seconds: 停车时长（秒）
+        
+    Returns:
+        str: 格式化的时长字符串
+    """
     # 计算小时和分钟
     hours = int(duration_seconds // 3600)
     minutes = int((duration_seconds % 3600) // 60)
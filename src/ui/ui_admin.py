@@ -3,11 +3,15 @@
 实现停车场管理系统的管理员端界面功能
 """
 import tkinter as tk
-from tkinter import messagebox, ttk, simpledialog
+from tkinter import filedialog, messagebox, ttk, simpledialog
+import threading
+import time
 from datetime import datetime, timedelta
 
-from src.database import db
-from src.tool import utils
+from config import cfg
+from src.database import analytics, db
+from src.tool import export, metrics, utils
+from src.tool.boundary_scheduler import BoundaryScheduler
 from src.models.resident_pydantic import ResidentPydantic
 from src.models.resident_model import Resident
 
@@ -41,6 +45,9 @@ class AdminWindow:
         self.style.configure("TEntry", font=("微软雅黑", 10))
         
         self._create_widgets()
+        
+        # 隐藏入口：Ctrl+Shift+P 打开性能统计界面
+        self.root.bind("<Control-P>", lambda event: self._show_performance_stats())
     
     def _center_window(self):
         """
@@ -90,6 +97,7 @@ class AdminWindow:
             ("在场车辆", self._show_current_vehicles),
             ("停车记录", self._show_parking_records),
             ("收入统计", self._show_revenue_statistics),
+            ("占用分析", self._show_occupancy_analytics),
             ("系统设置", self._show_system_settings),
             ("退出登录", self._logout)
         ]
@@ -187,10 +195,50 @@ class AdminWindow:
         search_var = tk.StringVar()
         ttk.Entry(search_frame, textvariable=search_var, width=30).pack(side=tk.LEFT, padx=10)
         
+        # 分页状态
+        page_size = 50
+        page = {'offset': 0, 'keyword': ""}
+        
+        def load_page():
+            # 多取一条用于判断是否还有下一页
+            residents = db.search_residents(page['keyword'], page['offset'], page_size + 1)
+            has_next = len(residents) > page_size
+            residents = residents[:page_size]
+            
+            # 精确搜索无结果且关键字像车牌时，按车牌模糊匹配（容忍 8/B、0/D 等识别错误）
+            fuzzy = False
+            if not residents and page['offset'] == 0 and len(page['keyword']) >= 4:
+                residents = db.fuzzy_search_residents_by_plate(page['keyword'])
+                fuzzy = bool(residents)
+            
+            for item in tree.get_children():
+                tree.delete(item)
+            for resident in residents:
+                tree.insert("", tk.END, values=(
+                    resident['id'],
+                    resident['name'],
+                    resident['phone'],
+                    resident['plate'],
+                    utils.format_balance(resident['balance']),
+                    resident['address']
+                ))
+            
+            page_label.config(text=("相似车牌匹配结果" if fuzzy else f"第 {page['offset'] // page_size + 1} 页"))
+            prev_btn.config(state=tk.NORMAL if page['offset'] > 0 else tk.DISABLED)
+            next_btn.config(state=tk.NORMAL if has_next else tk.DISABLED)
+        
         def search():
-            keyword = search_var.get().strip()
-            # 这里可以实现搜索逻辑
-            messagebox.showinfo("提示", f"搜索关键词：{keyword}")
+            page['keyword'] = search_var.get().strip()
+            page['offset'] = 0
+            load_page()
+        
+        def prev_page():
+            page['offset'] = max(page['offset'] - page_size, 0)
+            load_page()
+        
+        def next_page():
+            page['offset'] += page_size
+            load_page()
         
         ttk.Button(search_frame, text="搜索", command=search).pack(side=tk.LEFT)
         ttk.Button(search_frame, text="新增居民", command=self._add_resident).pack(side=tk.RIGHT)
@@ -213,20 +261,20 @@ class AdminWindow:
         tree.column("balance", width=100)
         tree.column("address", width=300)
         
-        # 获取所有居民
-        residents = db.get_all_residents()
+        tree.pack(fill=tk.BOTH, expand=True, pady=10)
         
-        for resident in residents:
-            tree.insert("", tk.END, values=(
-                resident['id'],
-                resident['name'],
-                resident['phone'],
-                resident['plate'],
-                utils.format_balance(resident['balance']),
-                resident['address']
-            ))
+        # 分页按钮
+        page_frame = ttk.Frame(self.content_frame)
+        page_frame.pack(pady=5)
+        prev_btn = ttk.Button(page_frame, text="上一页", command=prev_page)
+        prev_btn.pack(side=tk.LEFT, padx=10)
+        page_label = ttk.Label(page_frame, text="")
+        page_label.pack(side=tk.LEFT, padx=10)
+        next_btn = ttk.Button(page_frame, text="下一页", command=next_page)
+        next_btn.pack(side=tk.LEFT, padx=10)
         
-        tree.pack(fill=tk.BOTH, expand=True, pady=10)
+        # 加载第一页居民
+        load_page()
         
         # 按钮组
         btn_frame = ttk.Frame(self.content_frame)
@@ -266,7 +314,7 @@ class AdminWindow:
         ttk.Label(self.content_frame, text="在场车辆", font=("微软雅黑", 16, "bold")).pack(pady=10)
         
         # 车辆列表
-        columns = ("id", "plate", "entry_time", "type", "duration")
+        columns = ("id", "plate", "entry_time", "type", "duration", "fee")
         tree = ttk.Treeview(self.content_frame, columns=columns, show="headings")
         
         tree.heading("id", text="记录ID")
@@ -274,28 +322,60 @@ class AdminWindow:
         tree.heading("entry_time", text="进场时间")
         tree.heading("type", text="类型")
         tree.heading("duration", text="停车时长")
+        tree.heading("fee", text="当前费用")
         
         tree.column("id", width=80)
         tree.column("plate", width=120)
         tree.column("entry_time", width=200)
         tree.column("type", width=100)
         tree.column("duration", width=120)
+        tree.column("fee", width=100)
         
-        # 查询所有未离场的记录
-        records = db.get_parking_records()
-        active_records = [r for r in records if not r['exit_time']]
+        tree.pack(fill=tk.BOTH, expand=True, pady=10)
         
-        for record in active_records:
-            duration = utils.calculate_duration(record['entry_time'])
-            tree.insert("", tk.END, values=(
-                record['id'],
-                record['plate'],
-                utils.format_datetime_for_display(record['entry_time']),
-                "居民" if record['type'] == 'resident' else "访客",
-                duration
-            ))
+        # 在场记录按下一个时长/费用边界放入调度器，每次刷新只更新到达边界的行
+        scheduler = BoundaryScheduler()
+        open_records = {}
+        last_sync = [0]
+        
+        def sync(now):
+            records = db.get_open_parking_records()
+            open_records.update((record['id'], record) for record in records)
+            added, removed = scheduler.sync(records, now)
+            for record_id in removed:
+                if tree.exists(str(record_id)):
+                    tree.delete(str(record_id))
+            for record_id, duration, fee in added:
+                record = open_records[record_id]
+                tree.insert("", tk.END, iid=str(record_id), values=(
+                    record_id,
+                    record['plate'],
+                    utils.format_datetime_for_display(record['entry_time']),
+                    "居民" if record['type'] == 'resident' else "访客",
+                    duration,
+                    utils.format_balance(fee)
+                ))
+            for record_id in removed:
+                open_records.pop(record_id, None)
+            last_sync[0] = now
         
-        tree.pack(fill=tk.BOTH, expand=True, pady=10)
+        def tick():
+            if not tree.winfo_exists():
+                return
+            now = int(time.time())
+            # 定期与数据库同步进出场，其余时间只处理到达边界的行
+            if now - last_sync[0] >= cfg.LIVE_TABLE_SYNC_INTERVAL:
+                sync(now)
+            for record_id, duration, fee in scheduler.due(now):
+                tree.set(str(record_id), "duration", duration)
+                tree.set(str(record_id), "fee", utils.format_balance(fee))
+            
+            next_due = scheduler.next_due()
+            wait = cfg.LIVE_TABLE_SYNC_INTERVAL if next_due is None else max(next_due - now, 0)
+            wait = min(wait, max(last_sync[0] + cfg.LIVE_TABLE_SYNC_INTERVAL - now, 0))
+            tree.after(int(wait * 1000) + 50, tick)
+        
+        tick()
     
     def _show_parking_records(self):
         """
@@ -360,6 +440,46 @@ class AdminWindow:
         
         ttk.Button(filter_frame, text="查询", command=do_query).grid(row=0, column=4, rowspan=2, padx=20, pady=10)
         
+        # 按当前查询条件流式导出（后台线程分批写出，界面显示进度）
+        def do_export():
+            path = filedialog.asksaveasfilename(
+                defaultextension=".csv",
+                filetypes=[("CSV", "*.csv"), ("CSV (gzip)", "*.csv.gz"), ("JSONL", "*.jsonl"), ("JSONL (gzip)", "*.jsonl.gz")]
+            )
+            if not path:
+                return
+            record_type = None if type_var.get() == "all" else type_var.get()
+            start_time = start_date_var.get().strip() + " 00:00:00" if start_date_var.get().strip() else None
+            end_time = end_date_var.get().strip() + " 23:59:59" if end_date_var.get().strip() else None
+            state = {"exported": 0, "total": 0, "done": False, "error": None}
+            
+            def run():
+                try:
+                    export.export_records(path, plate=plate_var.get().strip() or None, start_time=start_time,
+                                          end_time=end_time, record_type=record_type, progress=state.update)
+                except Exception as e:
+                    state["error"] = str(e)
+                state["done"] = True
+            
+            def poll():
+                if not export_label.winfo_exists():
+                    return
+                if state["error"]:
+                    export_label.config(text="")
+                    messagebox.showerror("错误", f"导出失败：{state['error']}")
+                elif state["done"]:
+                    export_label.config(text=f"已导出 {state['exported']} 条：{path}")
+                else:
+                    export_label.config(text=f"导出中：{state['exported']}/{state['total']}")
+                    export_label.after(200, poll)
+            
+            threading.Thread(target=run, daemon=True).start()
+            poll()
+        
+        ttk.Button(filter_frame, text="导出", command=do_export).grid(row=0, column=5, rowspan=2, padx=10, pady=10)
+        export_label = ttk.Label(filter_frame, text="")
+        export_label.grid(row=2, column=0, columnspan=6, padx=10, sticky=tk.W)
+        
         # 记录表格
         columns = ("id", "plate", "phone", "entry_time", "exit_time", "type", "fee")
         tree = ttk.Treeview(self.content_frame, columns=columns, show="headings")
@@ -434,6 +554,7 @@ class AdminWindow:
             # 格式化日期
             start_str = start_date.strftime("%Y-%m-%d 00:00:00")
             end_str = end_date.strftime("%Y-%m-%d 23:59:59")
+            current_range[:] = [start_str, end_str]
             
             # 获取统计数据
             statistics = db.get_revenue_statistics(start_str, end_str)
@@ -453,6 +574,21 @@ class AdminWindow:
         
         ttk.Button(stats_frame, text="统计", command=do_statistics).pack(side=tk.LEFT, padx=20)
         
+        # 导出最近一次统计的日期范围
+        current_range = []
+        
+        def do_export():
+            if not current_range:
+                messagebox.showinfo("提示", "请先进行统计")
+                return
+            path = filedialog.asksaveasfilename(defaultextension=".csv",
+                                                filetypes=[("CSV", "*.csv"), ("JSONL", "*.jsonl")])
+            if path:
+                export.export_revenue(path, *current_range)
+                messagebox.showinfo("成功", f"已导出：{path}")
+        
+        ttk.Button(stats_frame, text="导出", command=do_export).pack(side=tk.LEFT)
+        
         # 统计结果表格
         columns = ("date", "revenue")
         tree = ttk.Treeview(self.content_frame, columns=columns, show="headings")
@@ -469,6 +605,100 @@ class AdminWindow:
         total_label = ttk.Label(self.content_frame, text="总收入：¥ 0.00", font=("微软雅黑", 14))
         total_label.pack(pady=10, anchor=tk.E)
     
+    def _show_occupancy_analytics(self):
+        """
+        显示占用分析界面（占用曲线、峰值、停车时长分布、按星期和小时的入场车次）
+        """
+        self._clear_content()
+        
+        # 标题
+        ttk.Label(self.content_frame, text="占用分析", font=("微软雅黑", 16, "bold")).pack(pady=10)
+        
+        # 分析条件
+        options_frame = ttk.Frame(self.content_frame)
+        options_frame.pack(fill=tk.X, pady=10)
+        
+        today = datetime.now()
+        ttk.Label(options_frame, text="从：").pack(side=tk.LEFT)
+        start_date_var = tk.StringVar(value=(today - timedelta(days=6)).strftime("%Y-%m-%d"))
+        ttk.Entry(options_frame, textvariable=start_date_var, width=12).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Label(options_frame, text="到：").pack(side=tk.LEFT)
+        end_date_var = tk.StringVar(value=today.strftime("%Y-%m-%d"))
+        ttk.Entry(options_frame, textvariable=end_date_var, width=12).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Label(options_frame, text="采样间隔：").pack(side=tk.LEFT, padx=(10, 0))
+        step_var = tk.StringVar(value="1小时")
+        steps = {"15分钟": 900, "1小时": 3600, "1天": 86400}
+        ttk.Combobox(options_frame, textvariable=step_var, values=list(steps), width=8,
+                     state="readonly").pack(side=tk.LEFT, padx=5)
+        
+        report = {}
+        
+        def do_analyze():
+            try:
+                start_date = datetime.strptime(start_date_var.get().strip(), "%Y-%m-%d")
+                end_date = datetime.strptime(end_date_var.get().strip(), "%Y-%m-%d")
+            except ValueError:
+                messagebox.showinfo("提示", "日期格式错误，请使用YYYY-MM-DD格式")
+                return
+            
+            report.clear()
+            report.update(analytics.build_report(start_date.strftime("%Y-%m-%d 00:00:00"),
+                                                 end_date.strftime("%Y-%m-%d 23:59:59"),
+                                                 steps[step_var.get()]))
+            
+            summary_label.config(text=f"入场车次：{report['records']}    "
+                                      f"峰值在场：{report['peak']} 辆（{report['peak_at'] or '-'}）")
+            for tree in (curve_tree, dwell_tree, turnover_tree):
+                tree.delete(*tree.get_children())
+            for time_str, count in report["curve"]:
+                curve_tree.insert("", tk.END, values=(utils.format_datetime_for_display(time_str), count))
+            for label, count in report["dwell"]:
+                dwell_tree.insert("", tk.END, values=(label, count))
+            for hour in range(24):
+                turnover_tree.insert("", tk.END, values=(f"{hour}时", *(row[hour] for row in report["turnover"])))
+        
+        def do_export():
+            if not report:
+                messagebox.showinfo("提示", "请先进行分析")
+                return
+            path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV", "*.csv")])
+            if path:
+                analytics.export_report_csv(report, path)
+                messagebox.showinfo("成功", f"已导出：{path}")
+        
+        ttk.Button(options_frame, text="分析", command=do_analyze).pack(side=tk.LEFT, padx=10)
+        ttk.Button(options_frame, text="导出CSV", command=do_export).pack(side=tk.LEFT)
+        
+        summary_label = ttk.Label(self.content_frame, text="", font=("微软雅黑", 12))
+        summary_label.pack(pady=5, anchor=tk.W)
+        
+        # 结果分页显示
+        notebook = ttk.Notebook(self.content_frame)
+        notebook.pack(fill=tk.BOTH, expand=True, pady=10)
+        
+        curve_tree = ttk.Treeview(notebook, columns=("time", "count"), show="headings")
+        curve_tree.heading("time", text="时间")
+        curve_tree.heading("count", text="在场数")
+        notebook.add(curve_tree, text="占用曲线")
+        
+        dwell_tree = ttk.Treeview(notebook, columns=("range", "count"), show="headings")
+        dwell_tree.heading("range", text="停车时长")
+        dwell_tree.heading("count", text="车次")
+        notebook.add(dwell_tree, text="停车时长分布")
+        
+        turnover_columns = ("hour",) + analytics.WEEKDAYS
+        turnover_tree = ttk.Treeview(notebook, columns=turnover_columns, show="headings")
+        turnover_tree.heading("hour", text="小时")
+        turnover_tree.column("hour", width=60)
+        for weekday in analytics.WEEKDAYS:
+            turnover_tree.heading(weekday, text=weekday)
+            turnover_tree.column(weekday, width=60)
+        notebook.add(turnover_tree, text="入场车次（星期×小时）")
+        
+        do_analyze()
+    
     def _show_system_settings(self):
         """
         显示系统设置界面
@@ -484,7 +714,7 @@ class AdminWindow:
         
         # 停车费率设置
         ttk.Label(settings_frame, text="停车费率（元/小时）：").grid(row=0, column=0, padx=50, pady=20, sticky=tk.W)
-        rate_var = tk.StringVar(value=str(config.PARKING_RATE_PER_HOUR))
+        rate_var = tk.StringVar(value=str(cfg.PARKING_RATE_PER_HOUR))
         ttk.Entry(settings_frame, textvariable=rate_var, width=10).grid(row=0, column=1, pady=20)
         
         def update_rate():
@@ -493,7 +723,8 @@ class AdminWindow:
                 if new_rate < 0:
                     messagebox.showerror("错误", "费率不能为负数")
                     return
-                config.PARKING_RATE_PER_HOUR = new_rate
+                # 同时清空按旧费率缓存的费用报价
+                utils.set_parking_rate(new_rate)
                 messagebox.showinfo("成功", "费率更新成功")
             except ValueError:
                 messagebox.showerror("错误", "请输入有效的费率")
@@ -521,6 +752,70 @@ class AdminWindow:
         ttk.Button(admin_frame, text="添加管理员", command=add_admin).pack(side=tk.LEFT, padx=30, pady=20)
         ttk.Button(admin_frame, text="修改密码", command=change_password).pack(side=tk.LEFT, padx=30, pady=20)
     
+    def _show_performance_stats(self):
+        """
+        显示性能统计界面（隐藏功能）
+        """
+        self._clear_content()
+        
+        # 标题
+        ttk.Label(self.content_frame, text="性能统计", font=("微软雅黑", 16, "bold")).pack(pady=10)
+        
+        # 操作按钮
+        btn_frame = ttk.Frame(self.content_frame)
+        btn_frame.pack(fill=tk.X, pady=10)
+        
+        status_var = tk.StringVar()
+        
+        def refresh():
+            cache = db.get_statement_cache_stats()
+            status_var.set("统计状态：" + ("已启用" if metrics.is_enabled() else "未启用")
+                           + f"    语句缓存命中率：{cache['hit_rate']:.1%}"
+                           + f"（{cache['hits']}/{cache['hits'] + cache['misses']}，查询形状 {cache['shapes']}）")
+            for item in tree.get_children():
+                tree.delete(item)
+            for stats in metrics.get_stats():
+                tree.insert("", tk.END, values=(
+                    stats['name'].rsplit(".", 1)[-1],
+                    stats['calls'],
+                    stats['errors'],
+                    f"{stats['total_ms']:.2f}",
+                    f"{stats['p50_ms']:.3f}",
+                    f"{stats['p95_ms']:.3f}",
+                    f"{stats['p99_ms']:.3f}",
+                    stats['rows'],
+                    f"{stats['lock_wait_ms']:.3f}"
+                ))
+        
+        def toggle():
+            if metrics.is_enabled():
+                metrics.disable()
+            else:
+                metrics.enable()
+            refresh()
+        
+        def reset():
+            metrics.reset()
+            refresh()
+        
+        ttk.Label(btn_frame, textvariable=status_var).pack(side=tk.LEFT, padx=10)
+        ttk.Button(btn_frame, text="刷新", command=refresh).pack(side=tk.LEFT, padx=10)
+        ttk.Button(btn_frame, text="启用/停用", command=toggle).pack(side=tk.LEFT, padx=10)
+        ttk.Button(btn_frame, text="清空", command=reset).pack(side=tk.LEFT, padx=10)
+        
+        # 统计表格
+        columns = ("name", "calls", "errors", "total_ms", "p50_ms", "p95_ms", "p99_ms", "rows", "lock_ms")
+        tree = ttk.Treeview(self.content_frame, columns=columns, show="headings")
+        
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=80)
+        tree.column("name", width=200)
+        
+        tree.pack(fill=tk.BOTH, expand=True, pady=10)
+        
+        refresh()
+    
     def _add_resident(self):
         """
         添加居民（管理员模式）
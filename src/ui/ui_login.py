@@ -177,7 +177,7 @@ class LoginWindow:
         # 查询居民信息
         resident = db.get_resident_by_phone(phone)
         
-        if resident and resident['plate'] == plate:
+        if resident and utils.normalize_plate(resident['plate']) == utils.normalize_plate(plate):
             # 登录成功，跳转到用户界面
             self.root.withdraw()  # 隐藏登录窗口
             user_window = tk.Toplevel(self.root)
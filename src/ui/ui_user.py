@@ -6,8 +6,9 @@ import tkinter as tk
 from tkinter import messagebox, ttk
 from datetime import datetime
 
+from config.cfg import LOW_SPACE_THRESHOLD
 from src.database import db
-from src.tool import utils
+from src.tool import notifier, utils
 
 
 class UserWindow:
@@ -163,27 +164,35 @@ class UserWindow:
                 return
             phone = None
         
-        # 检查是否已有未结算的记录
-        existing_record = db.get_active_parking_record(plate)
-        if existing_record:
-            messagebox.showinfo("提示", "该车辆已经在停车场内")
-            return
-        
-        # 创建停车记录
+        # 已在场检查、占用车位和创建记录在一个事务内完成
         entry_time = utils.now_str()
         record_type = 'resident' if self.is_resident else 'visitor'
         
-        record_id = db.create_parking_record(
+        record_id, status = db.enter_vehicle(
             plate=plate,
             phone=phone,
             entry_time=entry_time,
             record_type=record_type
         )
         
-        if record_id > 0:
+        if status == db.ENTRY_EXISTS:
+            messagebox.showinfo("提示", "该车辆已经在停车场内")
+            return
+        
+        if status == db.ENTRY_CREATED:
             self._append_info(f"进场成功！ 车牌：{plate}  进场时间：{utils.format_datetime_for_display(entry_time)}")
+            
+            # 剩余车位不足时提醒居民（未配置车位容量时不提醒）
+            free_spaces = db.get_free_spaces()
+            limits = [free_spaces[zone] for zone in ('total', record_type) if zone in free_spaces]
+            remaining = min(limits) if limits else None
+            if remaining is not None and remaining <= LOW_SPACE_THRESHOLD:
+                # 后台向全部居民群发车位提醒，不阻塞入场流程
+                notifier.notify_lot_nearly_full(free_spaces.get('total', 0))
+                if self.is_resident:
+                    messagebox.showwarning("车位提醒", f"停车场剩余车位：{remaining}")
         else:
-            messagebox.showerror("错误", "进场登记失败")
+            messagebox.showerror("错误", "车位已满，禁止入场")
     
     def _exit_settlement(self):
         """
@@ -208,22 +217,20 @@ class UserWindow:
         fee = utils.calc_fee(record['entry_time'], exit_time)
         
         if self.is_resident:
-            # 居民模式：从余额扣款
-            if self.resident_info['balance'] < fee:
-                if messagebox.askyesno("余额不足", f"当前余额：{utils.format_balance(self.resident_info['balance'])}\n需支付：{utils.format_balance(fee)}\n是否前往充值？"):
+            # 居民模式：余额检查、扣款和关闭记录在一个事务内完成
+            status, result = db.settle_vehicle(plate, exit_time, charge_balance=True)
+            if status == db.SETTLE_INSUFFICIENT:
+                if messagebox.askyesno("余额不足", f"当前余额：{utils.format_balance(result['balance'])}\n需支付：{utils.format_balance(result['fee'])}\n是否前往充值？"):
                     self._recharge()
                 return
             
-            # 扣款并更新余额
-            if db.update_resident_balance(self.resident_info['id'], -fee):
-                # 关闭停车记录
-                if db.close_parking_record(record['id'], exit_time, fee):
-                    # 更新本地居民信息
-                    self.resident_info = db.get_resident_by_phone(self.resident_info['phone'])
-                    self._refresh_resident_info()
-                    self._append_info(f"离场成功！ 费用：{utils.format_balance(fee)}  剩余余额：{utils.format_balance(self.resident_info['balance'])}")
-                else:
-                    messagebox.showerror("错误", "结算失败")
+            if status == db.SETTLE_OK:
+                # 更新本地居民信息
+                self.resident_info = db.get_resident_by_phone(self.resident_info['phone'])
+                self._refresh_resident_info()
+                self._append_info(f"离场成功！ 费用：{utils.format_balance(result['fee'])}  剩余余额：{utils.format_balance(self.resident_info['balance'])}")
+            else:
+                messagebox.showerror("错误", "结算失败")
         else:
             # 访客模式：模拟支付
             if messagebox.askyesno("费用确认", f"停车费用：{utils.format_balance(fee)}\n确认支付？"):
@@ -251,9 +258,8 @@ class UserWindow:
             messagebox.showinfo("提示", "未找到该车辆的停车记录")
             return
         
-        # 计算当前费用（使用当前时间）
-        current_time = utils.now_str()
-        fee = utils.calc_fee(record['entry_time'], current_time)
+        # 计算当前费用（使用当前时间，整小时边界前复用缓存的报价）
+        fee, next_change = utils.quote_fee(record['id'], record['entry_time'])
         duration = utils.calculate_duration(record['entry_time'])
         
         self._append_info(f"当前费用查询：")
@@ -261,6 +267,7 @@ class UserWindow:
         self._append_info(f"进场时间：{utils.format_datetime_for_display(record['entry_time'])}")
         self._append_info(f"停车时长：{duration}")
         self._append_info(f"预计费用：{utils.format_balance(fee)}")
+        self._append_info(f"费用将于 {utils.format_datetime_for_display(next_change)} 后变化")
     
     def _recharge(self):
         """
@@ -328,6 +335,15 @@ class UserWindow:
         y = (records_window.winfo_screenheight() // 2) - (height // 2)
         records_window.geometry(f"{width}x{height}+{x}+{y}")
         
+        # 停车汇总（读取结算时维护的汇总表，不扫描历史记录）
+        stats = db.get_resident_parking_stats(self.resident_info['phone'])
+        last_visit = utils.format_datetime_for_display(stats['last_visit']) if stats['last_visit'] else "-"
+        ttk.Label(
+            records_window,
+            text=f"累计停车：{stats['visits']} 次    累计费用：{utils.format_balance(stats['total_fee'])}    最近离场：{last_visit}",
+            font=("微软雅黑", 12)
+        ).pack(pady=(15, 0))
+        
         # 创建表格
         columns = ("id", "plate", "entry_time", "exit_time", "fee")
         tree = ttk.Treeview(records_window, columns=columns, show="headings")
@@ -346,29 +362,60 @@ class UserWindow:
         tree.column("exit_time", width=200)
         tree.column("fee", width=100)
         
-        # 查询记录
-        records = db.get_parking_records(phone=self.resident_info['phone'])
+        # 分页查询记录
+        page_size = 50
+        page = {'offset': 0}
         
-        # 填充数据
-        for record in records:
-            fee_text = utils.format_balance(record['fee']) if record['exit_time'] else "-"
-            exit_time_text = utils.format_datetime_for_display(record['exit_time']) if record['exit_time'] else "-"
+        def load_page():
+            # 多取一条用于判断是否还有下一页
+            records = db.get_parking_history(phone=self.resident_info['phone'],
+                                             offset=page['offset'], limit=page_size + 1)
+            has_next = len(records) > page_size
             
-            tree.insert("", tk.END, values=(
-                record['id'],
-                record['plate'],
-                utils.format_datetime_for_display(record['entry_time']),
-                exit_time_text,
-                fee_text
-            ))
+            tree.delete(*tree.get_children())
+            for record in records[:page_size]:
+                fee_text = utils.format_balance(record['fee']) if record['exit_time'] else "-"
+                exit_time_text = utils.format_datetime_for_display(record['exit_time']) if record['exit_time'] else "-"
+                
+                tree.insert("", tk.END, values=(
+                    record['id'],
+                    record['plate'],
+                    utils.format_datetime_for_display(record['entry_time']),
+                    exit_time_text,
+                    fee_text
+                ))
+            
+            page_label.config(text=f"第 {page['offset'] // page_size + 1} 页")
+            prev_btn.config(state=tk.NORMAL if page['offset'] > 0 else tk.DISABLED)
+            next_btn.config(state=tk.NORMAL if has_next else tk.DISABLED)
+        
+        def prev_page():
+            page['offset'] = max(page['offset'] - page_size, 0)
+            load_page()
         
-        tree.pack(fill=tk.BOTH, expand=True, pady=20)
+        def next_page():
+            page['offset'] += page_size
+            load_page()
+        
+        tree.pack(fill=tk.BOTH, expand=True, pady=(10, 5))
         
         # 添加滚动条
         scrollbar = ttk.Scrollbar(tree, orient=tk.VERTICAL, command=tree.yview)
         tree.configure(yscroll=scrollbar.set)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
+        # 分页按钮
+        page_frame = ttk.Frame(records_window)
+        page_frame.pack(pady=5)
+        prev_btn = ttk.Button(page_frame, text="上一页", command=prev_page)
+        prev_btn.pack(side=tk.LEFT)
+        page_label = ttk.Label(page_frame, text="")
+        page_label.pack(side=tk.LEFT, padx=10)
+        next_btn = ttk.Button(page_frame, text="下一页", command=next_page)
+        next_btn.pack(side=tk.LEFT)
+        
+        load_page()
+        
         # 关闭按钮
         ttk.Button(records_window, text="关闭", command=records_window.destroy).pack(pady=10)
     
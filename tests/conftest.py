@@ -11,15 +11,43 @@ def test_db_path():
     """提供测试数据库路径的fixture"""
     return "test_parking.db"
 
+# 示例居民数据
+SAMPLE_RESIDENT_DATA = {
+    "name": "测试居民",
+    "id_card": "110101199001011237",
+    "phone": "13800138000",
+    "plate": "京A12345",
+    "address": "测试地址",
+    "balance": 100.0,
+    "birth_date": "1990-01-01"
+}
+
 @pytest.fixture
 def sample_resident_data():
     """提供示例居民数据的fixture"""
-    return {
-        "name": "测试居民",
-        "id_card": "110101199001011237",
-        "phone": "13800138000",
-        "plate": "京A12345",
-        "address": "测试地址",
-        "balance": 100.0,
-        "birth_date": "1990-01-01"
-    }
\ No newline at end of file
+    return dict(SAMPLE_RESIDENT_DATA)
+
+@pytest.fixture(scope="session")
+def seeded_snapshot():
+    """在内存沙箱中预置数据并保存快照，整个测试会话只构建一次"""
+    from src.database import db
+    
+    db.use_memory_database("parking_seed")
+    db.init_db()
+    db.register_resident(**SAMPLE_RESIDENT_DATA)
+    snapshot = db.snapshot_database()
+    db.use_database()
+    
+    yield snapshot
+    snapshot.close()
+
+@pytest.fixture
+def sandbox_db(seeded_snapshot):
+    """为每个测试提供一个由快照恢复的内存沙箱数据库"""
+    from src.database import db
+    
+    db.use_memory_database()
+    db.restore_database(seeded_snapshot)
+    
+    yield seeded_snapshot
+    db.use_database()
@@ -1,6 +1,7 @@
 import pytest
 import os
 import datetime
+from src.database import db
 from src.database.db import init_db, register_resident, get_resident_by_plate, create_parking_record, get_resident_by_phone
 
 class TestParkingSystem:
@@ -8,13 +9,8 @@ class TestParkingSystem:
     
     def setup_method(self):
         """每个测试方法执行前的设置"""
-        # 使用测试数据库
-        self.test_db_path = "test_parking.db"
-        
-        # 设置测试数据库路径
-        import config.cfg as cfg
-        self.original_db_path = cfg.DB_PATH
-        cfg.DB_PATH = self.test_db_path
+        # 使用内存沙箱数据库，不读写 parking.db
+        db.use_memory_database()
         
         # 初始化测试数据库
         init_db()
@@ -33,13 +29,8 @@ class TestParkingSystem:
         
     def teardown_method(self):
         """每个测试方法执行后的清理"""
-        # 恢复原始数据库路径
-        import config.cfg as cfg
-        cfg.DB_PATH = self.original_db_path
-        
-        # 删除测试数据库文件
-        if os.path.exists(self.test_db_path):
-            os.remove(self.test_db_path)
+        # 恢复默认数据库，同时销毁内存沙箱
+        db.use_database()
     
     def test_create_parking_record(self):
         """测试创建停车记录"""
@@ -108,4 +99,1089 @@ class TestParkingSystem:
             birth_date="1990-04-04"
         )
         
-        assert result is False
\ No newline at end of file
+        assert result is False
+    
+    def test_resident_plate_filter(self):
+        """测试居民车牌过滤器"""
+        from src.database.db import is_possible_resident_plate
+        
+        # 已注册的车牌不能被过滤掉
+        assert is_possible_resident_plate(self.test_plate) is True
+        assert get_resident_by_plate(self.test_plate) is not None
+        
+        # 新注册的车牌立即生效
+        register_resident(
+            name="过滤器居民",
+            id_card="110101199005055678",
+            phone="13600136000",
+            plate="京F55555",
+            address="过滤器地址",
+            balance=0.0,
+            birth_date="1990-05-05"
+        )
+        assert is_possible_resident_plate("京F55555") is True
+        assert get_resident_by_plate("京F55555")["name"] == "过滤器居民"
+        
+        # 访客车牌查询返回None
+        assert get_resident_by_plate("沪B00000") is None
+
+
+def test_sandbox_snapshot_restore(sandbox_db):
+    """测试沙箱快照恢复"""
+    # 每个测试都从同一份预置快照开始
+    assert get_resident_by_plate("京A12345") is not None
+    assert get_resident_by_plate("京B67890") is None
+    
+    register_resident(
+        name="快照居民",
+        id_card="110101199006066789",
+        phone="13500135000",
+        plate="京B67890",
+        address="快照地址",
+        balance=0.0,
+        birth_date="1990-06-06"
+    )
+    assert get_resident_by_plate("京B67890") is not None
+    
+    # 恢复快照后新写入的数据消失
+    db.restore_database(sandbox_db)
+    assert get_resident_by_plate("京B67890") is None
+    assert get_resident_by_plate("京A12345") is not None
+
+
+def test_metrics_instrumentation(sandbox_db):
+    """测试数据库函数性能统计"""
+    from src.tool import metrics
+    
+    metrics.reset()
+    metrics.enable()
+    try:
+        get_resident_by_phone("13800138000")
+        get_resident_by_phone("13900000000")
+        record_id = create_parking_record("京A12345", "13800138000", "2025-01-01 08:00:00", "resident")
+        db.close_parking_record(record_id, "2025-01-01 09:00:00", 5.0)
+        list(db.iter_closed_parking_records(chunk_size=1))
+    finally:
+        metrics.disable()
+    
+    stats = metrics.get_stats("src.database.db.get_resident_by_phone")[0]
+    assert stats["calls"] == 2
+    assert stats["rows"] == 1
+    assert stats["p95_ms"] >= stats["p50_ms"] >= 0
+    # 生成器按整个迭代统计一次调用，行数为各批之和
+    stats = metrics.get_stats("src.database.db.iter_closed_parking_records")[0]
+    assert stats["calls"] == 1 and stats["rows"] == 1
+    
+    # 未启用时不再记录
+    get_resident_by_phone("13800138000")
+    assert metrics.get_stats("src.database.db.get_resident_by_phone")[0]["calls"] == 2
+    assert "create_parking_record" in metrics.format_report()
+    metrics.reset()
+
+
+def test_sql_profiler_slow_query_log(sandbox_db, tmp_path):
+    """测试SQL分析器慢查询日志"""
+    import json
+    from src.database import profiler
+    
+    log_path = tmp_path / "slow_query.log"
+    profiler.reset()
+    profiler.enable(threshold_ms=0, log_path=str(log_path))
+    try:
+        get_resident_by_phone("13800138000")
+        get_resident_by_phone("13900139000")
+    finally:
+        profiler.disable()
+    
+    summary = {item["sql"]: item for item in profiler.get_summary()}
+    assert summary["SELECT * FROM residents WHERE phone = ?"]["count"] == 2
+    
+    entries = [json.loads(line.split(" ", 2)[2]) for line in log_path.read_text(encoding="utf-8").splitlines()]
+    entry = next(e for e in entries if e["sql"].startswith("SELECT * FROM residents"))
+    assert entry["params"] == ["13800138000"]
+    assert entry["query_plan"]
+    profiler.reset()
+
+
+def test_reconcile_fees_resumable(sandbox_db, tmp_path):
+    """测试历史费用核对及断点续跑"""
+    import csv
+    from src.database.db import close_parking_record
+    from src.tool.reconcile import reconcile_fees
+    
+    # 两小时，存储费用正确（费率5）；一小时，存储费用错误
+    first = create_parking_record("京A12345", None, "2025-01-01 08:00:00", "visitor")
+    close_parking_record(first, "2025-01-01 09:30:00", 10.0)
+    second = create_parking_record("沪B54321", None, "2025-01-02 08:00:00", "visitor")
+    close_parking_record(second, "2025-01-02 08:20:00", 0.0)
+    
+    report = tmp_path / "report.csv"
+    checkpoint = tmp_path / "checkpoint.json"
+    result = reconcile_fees(str(report), str(checkpoint), rate=5.0, chunk_size=1, workers=1)
+    assert result == {"last_id": second, "checked": 2, "mismatched": 1}
+    
+    with open(report, encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["record_id"] for row in rows] == [str(second)]
+    assert float(rows[0]["expected_fee"]) == 5.0
+    
+    # 从断点继续时只处理新增记录
+    third = create_parking_record("粤C11111", None, "2025-01-03 08:00:00", "visitor")
+    close_parking_record(third, "2025-01-03 12:00:00", 20.0)
+    result = reconcile_fees(str(report), str(checkpoint), rate=5.0, chunk_size=1, workers=1)
+    assert result == {"last_id": third, "checked": 3, "mismatched": 1}
+    
+    # 写出报告后、保存断点前中断：续跑时截掉断点之后的行，不会重复
+    with open(report, "a", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerow([third, "粤C11111", "", "", 0, 0, 0])
+    reconcile_fees(str(report), str(checkpoint), rate=5.0, chunk_size=1, workers=1)
+    with open(report, encoding="utf-8") as f:
+        assert [row["record_id"] for row in csv.DictReader(f)] == [str(second)]
+    
+    # 参数不同或报告文件丢失时拒绝续跑
+    with pytest.raises(ValueError):
+        reconcile_fees(str(report), str(checkpoint), rate=6.0, chunk_size=1, workers=1)
+    report.unlink()
+    with pytest.raises(FileNotFoundError):
+        reconcile_fees(str(report), str(checkpoint), rate=5.0, chunk_size=1, workers=1)
+
+
+def test_lot_capacity_admission(sandbox_db, monkeypatch):
+    """测试车位容量控制"""
+    from src.database.db import close_parking_record, get_free_spaces
+    
+    monkeypatch.setattr(db, "LOT_CAPACITY", 3)
+    monkeypatch.setattr(db, "LOT_CAPACITY_BY_TYPE", {"visitor": 2})
+    init_db()
+    assert get_free_spaces() == {"total": 3, "visitor": 2}
+    
+    # 访客车位满后拒绝访客，但居民仍可入场
+    first = create_parking_record("沪A00001", None, "2025-01-01 08:00:00", "visitor")
+    create_parking_record("沪A00002", None, "2025-01-01 08:01:00", "visitor")
+    assert create_parking_record("沪A00003", None, "2025-01-01 08:02:00", "visitor") == 0
+    assert create_parking_record("京A12345", "13800138000", "2025-01-01 08:03:00", "resident") > 0
+    assert get_free_spaces() == {"total": 0, "visitor": 0}
+    
+    # 离场后释放车位
+    assert close_parking_record(first, "2025-01-01 09:00:00", 5.0)
+    assert get_free_spaces() == {"total": 1, "visitor": 1}
+    assert create_parking_record("沪A00003", None, "2025-01-01 09:01:00", "visitor") > 0
+    
+    # 重新初始化时按在场记录校准计数
+    init_db()
+    assert get_free_spaces() == {"total": 0, "visitor": 0}
+    
+    # 默认不限制车位
+    monkeypatch.undo()
+    init_db()
+    assert get_free_spaces() == {}
+    assert create_parking_record("沪A00004", None, "2025-01-01 09:02:00", "visitor") > 0
+
+
+def test_broadcast_to_residents(sandbox_db):
+    """测试居民短信群发"""
+    import asyncio
+    from src.tool.notifier import SmsTransport, broadcast_to_residents
+    
+    for i in range(5):
+        register_resident(
+            name=f"群发居民{i}",
+            id_card="110101199001011237",
+            phone=f"1370013700{i}",
+            plate=f"京N1000{i}",
+            address="群发地址",
+            balance=0.0,
+            birth_date="1990-01-01"
+        )
+    
+    class RecordingTransport(SmsTransport):
+        def __init__(self):
+            self.sent = []
+        
+        async def send(self, phone, message):
+            await asyncio.sleep(0)
+            self.sent.append(phone)
+            return phone != "13700137003"
+    
+    transport = RecordingTransport()
+    stats = asyncio.run(broadcast_to_residents("车库已满", transport, concurrency=3, rate=1000, chunk_size=2))
+    
+    assert sorted(transport.sent) == sorted(["13800138000"] + [f"1370013700{i}" for i in range(5)])
+    assert stats == {"sent": 5, "failed": 1, "duplicate": 0}
+    
+    # 网关关闭连接后，断开的连接不放回连接池，下次发送重新建连
+    from src.tool.notifier import SocketSmsTransport
+    
+    async def gateway_roundtrip():
+        served = []
+        
+        async def handle(reader, writer):
+            served.append(await reader.readline())
+            if len(served) > 1:
+                writer.write(b"OK\n")
+                await writer.drain()
+            writer.close()
+        
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        transport = SocketSmsTransport("127.0.0.1", port, pool_size=1)
+        results = [await transport.send("13800138000", "车库已满"),
+                   await transport.send("13800138000", "车库已满")]
+        await transport.close()
+        server.close()
+        await server.wait_closed()
+        return results
+    
+    assert asyncio.run(gateway_roundtrip()) == [False, True]
+    
+    # 网关不可达时建连失败返回False，连接池空位归还，后续发送不会挂起
+    async def gateway_unreachable():
+        server = await asyncio.start_server(lambda reader, writer: None, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        server.close()
+        await server.wait_closed()
+        transport = SocketSmsTransport("127.0.0.1", port, pool_size=2)
+        results = await asyncio.wait_for(
+            asyncio.gather(*(transport.send("13800138000", "车库已满") for _ in range(5))), timeout=5)
+        await transport.close()
+        return results
+    
+    assert asyncio.run(gateway_unreachable()) == [False] * 5
+
+
+def test_search_residents(sandbox_db):
+    """测试居民搜索与车牌模糊匹配"""
+    from src.database.db import search_residents, fuzzy_search_residents_by_plate
+    
+    register_resident(
+        name="王小明",
+        id_card="110101199007077890",
+        phone="13912345678",
+        plate="沪B80D21",
+        address="幸福小区3栋",
+        balance=0.0,
+        birth_date="1990-07-07"
+    )
+    
+    # 子串匹配（全文索引）与短关键字前缀匹配
+    assert [r["name"] for r in search_residents("幸福小区")] == ["王小明"]
+    assert [r["name"] for r in search_residents("345678")] == ["王小明"]
+    assert [r["name"] for r in search_residents("王小")] == ["王小明"]
+    assert len(search_residents("", offset=0, limit=1)) == 1
+    assert len(search_residents("", offset=1, limit=10)) == 1
+    
+    # 识别把 B 读成 8、D 读成 0 时仍能匹配
+    matches = fuzzy_search_residents_by_plate("沪8B0021")
+    assert matches[0]["plate"] == "沪B80D21"
+    # 全角、小写和分隔符按 normalize_plate 规范化后再匹配
+    matches = fuzzy_search_residents_by_plate("滬ｂ 8０-d21")
+    assert matches[0]["plate"] == "沪B80D21"
+    
+    # 模糊索引建立后新注册的居民同样可查
+    register_resident(
+        name="李四",
+        id_card="110101199008088901",
+        phone="13812345679",
+        plate="粤Z55S01",
+        address="阳光花园",
+        balance=0.0,
+        birth_date="1990-08-08"
+    )
+    assert fuzzy_search_residents_by_plate("粤2SS501")[0]["name"] == "李四"
+
+
+def test_plate_normalization_lookup(sandbox_db):
+    """测试车牌规范化查询"""
+    from src.database.db import get_active_parking_record, get_parking_records
+    from src.tool.utils import normalize_plate
+    
+    assert normalize_plate("京a 12345") == "京A12345"
+    assert normalize_plate("京Ａ１２３４５") == "京A12345"
+    assert normalize_plate("粵B·8888") == "粤B8888"
+    
+    # 不同写法指向同一居民和同一条在场记录
+    assert get_resident_by_plate("京a12345")["phone"] == "13800138000"
+    record_id = create_parking_record("京A 12345", None, "2025-01-01 08:00:00", "resident")
+    assert get_active_parking_record("京a12345")["id"] == record_id
+    assert [r["id"] for r in get_parking_records(plate="京Ａ12345")] == [record_id]
+    
+    # 仅写法不同的车牌不能重复注册
+    assert register_resident(
+        name="重复车牌",
+        id_card="110101199009099012",
+        phone="13300133000",
+        plate="京a-12345",
+        address="地址",
+        balance=0.0,
+        birth_date="1990-09-09"
+    ) is False
+
+
+def test_plate_key_migration(tmp_path):
+    """测试旧数据库回填规范化车牌列"""
+    import sqlite3
+    
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE parking_records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, plate TEXT NOT NULL, phone TEXT,
+            entry_time TEXT NOT NULL, exit_time TEXT, type TEXT NOT NULL, fee REAL DEFAULT 0.0
+        )
+    """)
+    conn.executemany(
+        "INSERT INTO parking_records (plate, entry_time, type) VALUES (?, ?, 'visitor')",
+        [(f"沪c {i:05d}", "2025-01-01 08:00:00") for i in range(2500)]
+    )
+    conn.commit()
+    conn.close()
+    
+    db.use_database(path)
+    try:
+        init_db()
+        from src.database.db import get_active_parking_record
+        assert get_active_parking_record("沪C01234") is not None
+        conn = sqlite3.connect(path)
+        assert conn.execute("SELECT COUNT(*) FROM parking_records WHERE plate_key IS NULL").fetchone()[0] == 0
+        # 事件日志的期初事件按批写入
+        assert conn.execute("SELECT COUNT(*) FROM events WHERE kind = 'entry'").fetchone()[0] == 2500
+        conn.close()
+        from src.database import migrations, projections
+        conn = db._connect()
+        history = {item["version"]: item for item in migrations.get_history(conn)}
+        conn.close()
+        assert history[5]["last_id"] == 2500 and history[5]["applied_at"]
+        projections.update_all_projections()
+        assert projections.verify_projections()["occupancy"] == []
+    finally:
+        db.use_database()
+
+
+def test_enter_vehicle_single_open_record(sandbox_db, monkeypatch):
+    """测试同一车牌只能有一条在场记录"""
+    import sqlite3
+    from src.database.db import enter_vehicle, close_parking_record, ENTRY_CREATED, ENTRY_EXISTS
+    
+    monkeypatch.setattr(db, "LOT_CAPACITY_BY_TYPE", {"resident": 150})
+    init_db()
+    record_id, status = enter_vehicle("京A12345", "13800138000", "2025-01-01 08:00:00", "resident")
+    assert status == ENTRY_CREATED and record_id > 0
+    # 重复入场（含不同写法）返回已有的在场记录
+    assert enter_vehicle("京a 12345", None, "2025-01-01 08:00:01", "resident") == (record_id, ENTRY_EXISTS)
+    assert create_parking_record("京A12345", None, "2025-01-01 08:00:02", "resident") == 0
+    assert db.get_free_spaces()["resident"] == 149
+    
+    # 数据库层面同样拒绝重复的在场记录
+    conn = db._connect()
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute(
+            "INSERT INTO parking_records (plate, entry_time, type, plate_key) "
+            "VALUES ('京A12345', '2025-01-01 08:00:03', 'resident', '京A12345')"
+        )
+    conn.close()
+    
+    # 离场后可以再次入场
+    assert close_parking_record(record_id, "2025-01-01 09:00:00", 5.0)
+    new_id, status = enter_vehicle("京A12345", None, "2025-01-01 10:00:00", "resident")
+    assert status == ENTRY_CREATED and new_id != record_id
+    
+    # 旧数据库已有重复在场记录：迁移时退化为普通索引，入场改为先查后插
+    conn = db._connect()
+    conn.execute("DROP INDEX idx_parking_records_open_plate_key_unique")
+    conn.execute(
+        "CREATE INDEX idx_parking_records_open_plate_key ON parking_records(plate_key) WHERE exit_time IS NULL"
+    )
+    conn.execute(
+        "INSERT INTO parking_records (plate, entry_time, type, plate_key) "
+        "VALUES ('京A12345', '2025-01-01 10:00:01', 'resident', '京A12345')"
+    )
+    conn.commit()
+    conn.close()
+    init_db()
+    
+    def open_plate_indexes():
+        conn = db._connect()
+        names = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE name LIKE 'idx_parking_records_open_plate_key%'"
+        )]
+        conn.close()
+        return names
+    
+    assert open_plate_indexes() == ["idx_parking_records_open_plate_key"]
+    assert enter_vehicle("沪C00001", None, "2025-01-01 10:00:02", "visitor")[1] == ENTRY_CREATED
+    assert enter_vehicle("沪C00001", None, "2025-01-01 10:00:03", "visitor")[1] == ENTRY_EXISTS
+    
+    # 重复记录处理后，再次初始化时重新建立唯一索引
+    assert close_parking_record(new_id, "2025-01-01 11:00:00", 5.0)
+    init_db()
+    assert open_plate_indexes() == ["idx_parking_records_open_plate_key_unique"]
+
+
+def test_resident_parking_history_and_stats(sandbox_db):
+    """测试居民停车历史分页与汇总"""
+    from src.database.db import (
+        close_parking_record, get_parking_history, get_parking_records, get_resident_parking_stats
+    )
+    
+    phone = "13800138000"
+    for day in range(1, 4):
+        record_id = create_parking_record("京A12345", phone, f"2025-01-0{day} 08:00:00", "resident")
+        assert close_parking_record(record_id, f"2025-01-0{day} 10:00:00", 10.0)
+    create_parking_record("沪B54321", None, "2025-01-02 09:00:00", "visitor")
+    
+    stats = get_resident_parking_stats(phone)
+    assert stats == {"visits": 3, "total_fee": 30.0, "last_visit": "2025-01-03 10:00:00"}
+    assert get_resident_parking_stats("13900000000")["visits"] == 0
+    
+    # 按进场时间倒序分页
+    first_page = get_parking_history(phone=phone, limit=2)
+    second_page = get_parking_history(phone=phone, offset=2, limit=2)
+    assert [r["entry_time"][:10] for r in first_page + second_page] == ["2025-01-03", "2025-01-02", "2025-01-01"]
+    assert len(get_parking_history(plate="京a12345")) == 3
+    assert len(get_parking_records(phone=phone)) == 3
+
+
+def test_multi_site_sharding(tmp_path, monkeypatch):
+    """测试多站点分库路由与跨站点汇总"""
+    from src.database.db import close_parking_record
+    
+    monkeypatch.setattr(db, "LOT_CAPACITY", 200)
+    db.use_site_directory(str(tmp_path))
+    try:
+        db.init_sites(["north", "south"])
+        with db.use_site("north"):
+            assert register_resident(name="北区居民", id_card="110101199001011234", phone="13800138001",
+                                     plate="京N11111", address="北区", balance=0.0, birth_date="1990-01-01")
+            assert get_resident_by_plate("京N11111")["name"] == "北区居民"
+            record_id = create_parking_record("京N11111", "13800138001", "2025-01-01 08:00:00", "resident")
+            assert close_parking_record(record_id, "2025-01-01 10:00:00", 10.0)
+        with db.use_site("south"):
+            # 居民数据、过滤器都按站点隔离
+            assert get_resident_by_plate("京N11111") is None
+            record_id = create_parking_record("沪S22222", None, "2025-01-01 09:00:00", "visitor")
+            assert close_parking_record(record_id, "2025-01-01 11:00:00", 7.5)
+            create_parking_record("沪S33333", None, "2025-01-02 09:00:00", "visitor")
+        assert (tmp_path / "north.db").exists() and (tmp_path / "south.db").exists()
+        
+        sites = ["north", "south"]
+        assert db.get_all_sites_revenue_statistics("2025-01-01", "2025-01-31", sites=sites) == [("2025-01-01", 17.5)]
+        occupancy = db.get_all_sites_occupancy(sites=sites)
+        assert occupancy["south"]["parked"] == 1
+        assert occupancy["all"] == {"parked": 1, "free": 399}
+        with pytest.raises(ValueError):
+            db.get_all_sites_occupancy(sites=["north", "all"])
+        
+        # 显式指定的沙箱优先于默认站点，不会写入站点数据库
+        db.set_default_site("east")
+        db.use_memory_database("site_sandbox")
+        init_db()
+        assert db.current_site() is None
+        assert db.enter_vehicle("沪E00001", None, "2025-01-03 08:00:00", "visitor")[0] > 0
+        assert not (tmp_path / "east.db").exists()
+        db.use_database()
+        assert db.current_site() == "east"
+    finally:
+        db.set_default_site(None)
+        db.use_database()
+        db.use_site_directory()
+
+
+def test_event_log_projections(sandbox_db):
+    """测试事件日志与投影重放"""
+    import sqlite3
+    from src.database import projections
+    from src.database.db import close_parking_record, update_resident_balance
+    
+    resident_id = get_resident_by_phone("13800138000")["id"]
+    record_id = create_parking_record("京A12345", "13800138000", "2025-01-01 08:00:00", "resident")
+    create_parking_record("沪B54321", None, "2025-01-01 09:00:00", "visitor")
+    assert close_parking_record(record_id, "2025-01-01 10:00:00", 10.0)
+    assert update_resident_balance(resident_id, -10.0)
+    assert update_resident_balance(resident_id, 50.0)
+    
+    assert projections.verify_projections() == {"occupancy": [], "balances": [], "revenue": []}
+    
+    # 未实现全部方法的投影在实例化时就报错
+    class IncompleteProjection(projections.Projection):
+        name = "incomplete"
+        
+        def create(self, cursor):
+            pass
+    
+    with pytest.raises(TypeError):
+        IncompleteProjection()
+    # 增量更新只重放新事件
+    assert projections.update_projection("occupancy") == 0
+    create_parking_record("粤C11111", None, "2025-01-02 08:00:00", "visitor")
+    assert projections.update_projection("occupancy") == 1
+    
+    # 事件只允许追加
+    conn = db._connect()
+    with pytest.raises(sqlite3.DatabaseError):
+        conn.execute("DELETE FROM events")
+    # 派生数据损坏后可重放重建
+    conn.execute("UPDATE proj_balances SET balance = 0")
+    conn.commit()
+    conn.close()
+    assert projections.verify_projections(["balances"])["balances"]
+    projections.rebuild_projection("balances")
+    assert projections.verify_projections() == {"occupancy": [], "balances": [], "revenue": []}
+
+
+def test_change_data_capture(sandbox_db):
+    """测试变更数据捕获与长轮询"""
+    import threading
+    from src.database import cdc
+    from src.database.db import close_parking_record, update_resident_balance
+    
+    start = cdc.get_changes(0)[-1]["seq"]
+    record_id = create_parking_record("沪B54321", None, "2025-01-01 08:00:00", "visitor")
+    assert close_parking_record(record_id, "2025-01-01 10:00:00", 10.0)
+    assert update_resident_balance(get_resident_by_phone("13800138000")["id"], 20.0)
+    
+    changes = cdc.get_changes(start)
+    assert [(c["table"], c["op"]) for c in changes] == [
+        ("parking_records", "insert"), ("parking_records", "update"), ("residents", "update")
+    ]
+    assert changes[1]["data"]["fee"] == 10.0 and changes[2]["data"]["balance"] == 120.0
+    
+    # 没有新变更时等待到超时，有新变更时立即返回
+    cursor = changes[-1]["seq"]
+    assert cdc.wait_for_changes(cursor, timeout=0.2) == []
+    timer = threading.Timer(0.1, create_parking_record, ("粤C11111", None, "2025-01-02 08:00:00", "visitor"))
+    timer.start()
+    assert cdc.wait_for_changes(cursor, timeout=5)[0]["data"]["plate"] == "粤C11111"
+    timer.join()
+    
+    # 命名消费者游标与清理
+    cdc.ack_changes("gate", cursor)
+    assert cdc.get_consumer_cursor("gate") == cursor
+    cdc.prune_changes()
+    assert cdc.get_changes(0)[0]["seq"] == cursor + 1
+
+
+def test_parking_records_statement_registry(sandbox_db):
+    """测试停车记录查询注册表与语句缓存命中率"""
+    from src.database import statements
+    from src.database.db import get_parking_records, get_statement_cache_stats
+    
+    for hour in range(8, 13):
+        create_parking_record(f"沪B5432{hour - 8}", None, f"2025-01-01 {hour:02d}:00:00", "visitor")
+    
+    statements.reset_stats()
+    shapes = get_statement_cache_stats()["shapes"]
+    for _ in range(10):
+        assert len(get_parking_records(start_time="2025-01-01 09:00:00", record_type="visitor")) == 4
+        page = get_parking_records(record_type="visitor", offset=1, limit=2)
+        assert [r["entry_time"][11:13] for r in page] == ["11", "10"]
+    
+    stats = get_statement_cache_stats()
+    # 两种过滤组合各生成一次SQL，只在第一次执行时解析
+    assert shapes <= stats["shapes"] <= shapes + 2
+    assert stats["misses"] == 2 and stats["hits"] == 18
+    assert stats["hit_rate"] == 0.9
+
+
+
+def test_reader_connections_closed_on_target_switch():
+    """测试切换数据库目标时立即关闭所有线程的常驻查询连接，新沙箱不会连到旧数据"""
+    import threading
+    from src.database.db import get_all_residents, get_parking_records
+    
+    db.use_memory_database()
+    try:
+        init_db()
+        register_resident(name="旧沙箱居民", id_card="110101199001011234", phone="13800138009",
+                          plate="京Z99999", address="旧沙箱", balance=0.0, birth_date="1990-01-01")
+        get_parking_records()
+        # 另一个仍在运行的线程也持有常驻查询连接
+        ready, done = threading.Event(), threading.Event()
+        
+        def hold_reader():
+            get_parking_records()
+            ready.set()
+            done.wait()
+        
+        thread = threading.Thread(target=hold_reader)
+        thread.start()
+        ready.wait()
+        
+        db.use_database()
+        db.use_memory_database()
+        init_db()
+        assert len(get_all_residents()) == 0
+        done.set()
+        thread.join()
+    finally:
+        db.use_database()
+
+
+def test_api_server(sandbox_db):
+    """测试HTTP接口服务（长连接、批量请求）"""
+    import asyncio
+    import json
+    from src.api.server import ApiServer
+    from src.api.loadtest import run_load
+    
+    async def request(reader, writer, method, path, body=None):
+        payload = json.dumps(body).encode() if body is not None else b""
+        writer.write(f"{method} {path} HTTP/1.1\r\nHost: test\r\nContent-Length: {len(payload)}\r\n\r\n".encode()
+                     + payload)
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode().partition(":")
+            headers[name.lower()] = value.strip()
+        return status, json.loads(await reader.readexactly(int(headers["content-length"])))
+    
+    async def scenario():
+        server = ApiServer("127.0.0.1", 0)
+        await server.start()
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+            # 同一连接上连续发送多个请求
+            status, data = await request(reader, writer, "POST", "/api/entry", {"plate": "京A12345"})
+            assert status == 201 and data["type"] == "resident"
+            status, data = await request(reader, writer, "POST", "/api/entry", {"plate": "京a12345"})
+            assert status == 409 and data["error"] == "already_parked"
+            status, data = await request(reader, writer, "GET", "/api/fee?plate=京A12345")
+            assert status == 200 and data["fee"] == 0.0
+            status, data = await request(reader, writer, "GET", "/api/residents?phone=13800138000")
+            assert status == 200 and "id_card" not in data
+            status, data = await request(reader, writer, "POST", "/api/batch", [
+                {"method": "POST", "path": "/api/exit", "body": {"plate": "京A12345", "charge_balance": True}},
+                {"method": "GET", "path": "/api/occupancy"},
+                {"method": "GET", "path": "/api/nowhere"},
+            ])
+            assert status == 200
+            assert [item["status"] for item in data] == [200, 200, 404]
+            assert data[0]["body"]["balance"] == 100.0
+            assert data[1]["body"]["parked"]["total"] == 0
+            
+            # 子请求出错只影响它自己，批次其余结果照常返回，连接保持
+            create_parking_record("沪F00001", None, "not a time", "visitor")
+            status, data = await request(reader, writer, "POST", "/api/batch", [
+                {"method": "GET", "path": "/api/health"},
+                {"method": "GET", "path": "/api/fee?plate=沪F00001"},
+                {"method": "GET", "path": "/api/occupancy"},
+            ])
+            assert status == 200
+            assert [item["status"] for item in data] == [200, 400, 200]
+            assert data[1]["body"]["error"] == "bad_request"
+            status, data = await request(reader, writer, "GET", "/api/health")
+            assert status == 200
+            writer.close()
+            
+            result = await run_load("127.0.0.1", server.port, "/api/health", concurrency=4, requests=200)
+            assert result["requests"] == 200 and result["errors"] == 0
+        finally:
+            await server.close()
+    
+    asyncio.run(scenario())
+
+
+def test_async_db_facade(sandbox_db, monkeypatch):
+    """测试异步数据库模块"""
+    import asyncio
+    from src.database import adb
+    
+    monkeypatch.setattr(db, "LOT_CAPACITY_BY_TYPE", {"visitor": 50})
+    init_db()
+    assert asyncio.iscoroutinefunction(adb.get_resident_by_phone)
+    assert not hasattr(adb, "use_site") and not hasattr(adb, "use_writer")
+    
+    async def scenario():
+        adb.reset_queue_stats()
+        # 大量并发入场：写操作在单个写线程中串行执行
+        results = await asyncio.gather(*(
+            adb.enter_vehicle(f"沪B{i:05d}", None, "2025-01-01 08:00:00", "visitor") for i in range(60)
+        ))
+        assert sum(status == "created" for _, status in results) == 50
+        assert sum(status == "full" for _, status in results) == 10
+        
+        resident, free = await asyncio.gather(adb.get_resident_by_phone("13800138000"), adb.get_free_spaces())
+        assert resident["plate"] == "京A12345" and free["visitor"] == 0
+        
+        phones = [phone async for chunk in adb.iter_resident_phones(1) for phone in chunk]
+        assert phones == ["13800138000"]
+        
+        stats = adb.get_queue_stats()
+        assert stats["writer"]["completed"] == 60 and stats["writer"]["pending"] == 0
+        assert stats["writer"]["max_pending"] > 1
+    
+    asyncio.run(scenario())
+
+
+def test_single_writer_process(sandbox_db, tmp_path, monkeypatch):
+    """测试单写进程：写操作经Unix套接字串行执行，读操作直接访问数据库"""
+    import asyncio
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from src.database import writer
+    from src.tool.utils import calc_fee
+    
+    monkeypatch.setattr(db, "LOT_CAPACITY_BY_TYPE", {"visitor": 50})
+    init_db()
+    socket_path = str(tmp_path / "writer.sock")
+    # 单写进程未启动时退回本进程写入
+    db.use_writer(socket_path)
+    try:
+        assert db.register_resident("李四", "13900139000", "沪C88888", "2号楼", 20.0, "", "")
+    finally:
+        db.use_writer(None)
+    
+    ready = threading.Event()
+    loop = asyncio.new_event_loop()
+    stop = asyncio.Event()
+    thread = threading.Thread(target=loop.run_until_complete,
+                              args=(writer.serve(socket_path, ready, stop),), daemon=True)
+    thread.start()
+    assert ready.wait(5)
+    
+    db.use_writer(socket_path)
+    try:
+        # 多个线程共用一条连接并发写入
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(
+                lambda i: db.enter_vehicle(f"沪B{i:05d}", None, "2025-01-01 08:00:00", "visitor"), range(60)))
+        assert sum(status == db.ENTRY_CREATED for _, status in results) == 50
+        assert sum(status == db.ENTRY_FULL for _, status in results) == 10
+        
+        assert db.register_resident("王五", "13700137000", "沪D66666", "3号楼", 50.0, "", "")
+        assert not db.register_resident("王五", "13700137000", "沪D66666", "3号楼", 50.0, "", "")
+        assert db.get_resident_by_plate("沪D66666")["balance"] == 50.0
+        assert db.is_possible_resident_plate("沪D66666")
+        
+        status, result = db.settle_vehicle("沪B00000", "2025-01-01 08:10:00")
+        assert status == db.SETTLE_OK
+        assert result["fee"] == calc_fee("2025-01-01 08:00:00", "2025-01-01 08:10:00")
+        assert db.get_active_parking_record("沪B00000") is None
+    finally:
+        db.use_writer(None)
+        loop.call_soon_threadsafe(stop.set)
+        thread.join(5)
+        loop.close()
+    
+    # 单写进程不响应时超时，等待表中不留下这次请求
+    import socket
+    silent = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    silent.bind(str(tmp_path / "silent.sock"))
+    silent.listen(1)
+    client = writer.WriterClient(str(tmp_path / "silent.sock"), timeout=0.1)
+    try:
+        with pytest.raises(TimeoutError):
+            client.call("register_resident", ("赵六", "13600136000", "沪E55555", "4号楼", 0.0, "", ""), {})
+        assert client._pending == {}
+    finally:
+        client.close()
+        silent.close()
+
+
+def test_fee_quote_cache(sandbox_db):
+    """测试费用报价缓存：整小时边界前复用报价，结算或修改费率后失效"""
+    from config import cfg
+    from src.tool import utils
+    
+    record_id, status = db.enter_vehicle("沪E12345", None, "2025-01-01 08:00:00", "visitor")
+    assert status == db.ENTRY_CREATED
+    
+    fee, next_change = utils.quote_fee(record_id, "2025-01-01 08:00:00", "2025-01-01 08:30:00")
+    assert fee == utils.calc_fee("2025-01-01 08:00:00", "2025-01-01 08:30:00")
+    assert next_change == "2025-01-01 09:00:01"
+    assert utils._fee_quotes[record_id][3] == "2025-01-01 08:00:01"
+    # 边界前复用，到达边界后重新计算
+    assert utils.quote_fee(record_id, "2025-01-01 08:00:00", "2025-01-01 09:00:00") == (fee, next_change)
+    assert utils.quote_fee(record_id, "2025-01-01 08:00:00", "2025-01-01 09:00:01") == \
+        (utils.calc_fee("2025-01-01 08:00:00", "2025-01-01 09:00:01"), "2025-01-01 10:00:01")
+    
+    old_rate = cfg.PARKING_RATE_PER_HOUR
+    try:
+        utils.set_parking_rate(old_rate * 2)
+        assert record_id not in utils._fee_quotes
+        assert utils.quote_fee(record_id, "2025-01-01 08:00:00", "2025-01-01 09:30:00")[0] == 4 * old_rate
+    finally:
+        utils.set_parking_rate(old_rate)
+    
+    assert db.close_parking_record(record_id, "2025-01-01 09:30:00", 2 * old_rate)
+    assert record_id not in utils._fee_quotes
+
+
+def test_boundary_scheduler(sandbox_db):
+    """测试在场表格的边界调度：只重算到达时长/费用边界的记录"""
+    from datetime import datetime
+    from src.tool import utils
+    from src.tool.boundary_scheduler import BoundaryScheduler
+    
+    def ts(text):
+        return int(datetime.strptime(text, "%Y-%m-%d %H:%M:%S").timestamp())
+    
+    db.enter_vehicle("沪F00001", None, "2025-01-01 08:00:00", "visitor")
+    db.enter_vehicle("沪F00002", None, "2025-01-01 08:00:30", "visitor")
+    records = db.get_open_parking_records()
+    assert [r['plate'] for r in records] == ["沪F00001", "沪F00002"]
+    first, second = records[0]['id'], records[1]['id']
+    
+    scheduler = BoundaryScheduler()
+    now = ts("2025-01-01 08:59:50")
+    added, removed = scheduler.sync(records, now)
+    assert removed == [] and len(added) == 2
+    assert added[0][1:] == (utils.calculate_duration("2025-01-01 08:00:00", "2025-01-01 08:59:50"),
+                            utils.calc_fee("2025-01-01 08:00:00", "2025-01-01 08:59:50"))
+    assert scheduler.next_due() == ts("2025-01-01 09:00:00")
+    
+    # 未到边界时没有需要更新的行
+    assert scheduler.due(ts("2025-01-01 08:59:59")) == []
+    # 第一辆车的分钟进位，第二辆车未到边界
+    assert [row[0] for row in scheduler.due(ts("2025-01-01 09:00:00"))] == [first]
+    # 整小时后1秒第一辆车进入第二个计费小时
+    changed = scheduler.due(ts("2025-01-01 09:00:01"))
+    assert changed == [(first, "1小时0分钟", utils.calc_fee("2025-01-01 08:00:00", "2025-01-01 09:00:01"))]
+    
+    db.close_parking_record(first, "2025-01-01 09:01:00", 10.0)
+    added, removed = scheduler.sync(db.get_open_parking_records(), ts("2025-01-01 09:01:00"))
+    assert added == [] and removed == [first]
+    assert [row[0] for row in scheduler.due(ts("2025-01-01 09:01:30"))] == [second]
+
+
+def test_columnar_snapshot(sandbox_db):
+    """测试停车记录列式快照：分批加载、筛选和分组汇总"""
+    import sys
+    from src.database import snapshot
+    
+    for i in range(12):
+        entry = f"2025-01-0{1 + i % 3} 0{8 + i % 2}:00:00"
+        record_id, _ = db.enter_vehicle(f"沪G{i:05d}", None, entry, "visitor")
+        if i % 4:
+            db.close_parking_record(record_id, entry.replace(":00:00", ":40:00"), 5.0 * (i % 3 + 1))
+    db.enter_vehicle("京A12345", "13800138000", "2025-01-02 10:00:00", "resident")
+    
+    snap = snapshot.load_snapshot(chunk_size=5)
+    assert len(snap) == 13 and len(snap.plates) == 13 and snap.types == ["visitor", "resident"]
+    assert snapshot.from_timestamp(snap.entry[0]) == "2025-01-01 08:00:00"
+    assert snap.exit[0] == snapshot.OPEN
+    
+    assert snap.revenue_by_day() == [tuple(row) for row in
+                                     db.get_revenue_statistics("2025-01-01 00:00:00", "2025-01-03 23:59:59")]
+    assert snap.group_by(snap.type_key()) == {"visitor": 12, "resident": 1}
+    assert len(snap.select(closed=False)) == 4
+    assert len(snap.select(snapshot.to_timestamp("2025-01-02 00:00:00"),
+                           snapshot.to_timestamp("2025-01-02 23:59:59"), record_type="resident")) == 1
+    durations = snap.group_by(snap.day_key(), value="duration")
+    assert set(durations.values()) == {2400 * 3}
+    
+    dict_rows = db.get_parking_records()
+    assert snap.nbytes() < sum(sys.getsizeof(row) for row in dict_rows)
+    assert len(snapshot.load_snapshot(start_time="2025-01-03 00:00:00")) == 4
+
+
+def test_occupancy_analytics(sandbox_db, tmp_path):
+    """测试占用分析：扫描线峰值、占用曲线、停车时长分布、按星期和小时的入场车次"""
+    from src.database import analytics
+    
+    visits = [
+        ("沪H00001", "2025-01-06 08:00:00", "2025-01-06 10:00:00"),
+        ("沪H00002", "2025-01-06 09:00:00", "2025-01-06 09:20:00"),
+        ("沪H00003", "2025-01-06 09:10:00", "2025-01-06 11:00:00"),
+        # 前一辆离场的同一时刻进场，不重复计数
+        ("沪H00004", "2025-01-06 10:00:00", None),
+    ]
+    for plate, entry, exit_time in visits:
+        record_id, _ = db.enter_vehicle(plate, None, entry, "visitor")
+        if exit_time:
+            db.close_parking_record(record_id, exit_time, 5.0)
+    
+    report = analytics.build_report("2025-01-06 00:00:00", "2025-01-06 23:59:59", now="2025-01-06 12:00:00")
+    assert report["records"] == 4
+    assert (report["peak"], report["peak_at"]) == (3, "2025-01-06 09:10:00")
+    curve = dict(report["curve"])
+    assert [curve[f"2025-01-06 {h:02d}:00:00"] for h in (7, 8, 9, 10, 11, 12, 13)] == [0, 1, 2, 2, 1, 1, 0]
+    assert dict(report["dwell"]) == {**{label: 0 for label, _ in report["dwell"]},
+                                     "15-30分钟": 1, "60-120分钟": 1, "120-240分钟": 1}
+    # 2025-01-06 是周一
+    assert report["turnover"][0][9] == 2 and sum(map(sum, report["turnover"])) == 4
+    
+    path = tmp_path / "occupancy.csv"
+    analytics.export_report_csv(report, str(path))
+    assert "峰值在场数,3" in path.read_text(encoding="utf-8-sig")
+
+
+def test_streaming_export(sandbox_db, tmp_path):
+    """测试流式导出：分批写出、服务端过滤、gzip压缩和断点续传"""
+    import csv
+    import gzip
+    import json
+    from src.tool import export
+    
+    for i in range(7):
+        record_id, _ = db.enter_vehicle(f"沪J{i:05d}", None, f"2025-02-0{1 + i % 2} 08:00:00", "visitor")
+        db.close_parking_record(record_id, f"2025-02-0{1 + i % 2} 09:00:00", 5.0)
+    
+    states = []
+    path = str(tmp_path / "records.csv.gz")
+    result = export.export_records(path, start_time="2025-02-01 00:00:00", end_time="2025-02-01 23:59:59",
+                                   chunk_size=2, progress=states.append)
+    assert result["exported"] == result["total"] == 4
+    assert [state["exported"] for state in states] == [2, 4]
+    
+    # 第一批写出后中断，再从中断处的ID之后续传：gzip文件写入新的分片，不重复写表头
+    def interrupt(state):
+        raise KeyboardInterrupt
+    
+    resumed = str(tmp_path / "resumed.csv.gz")
+    with pytest.raises(KeyboardInterrupt):
+        export.export_records(resumed, start_time="2025-02-01 00:00:00", end_time="2025-02-01 23:59:59",
+                              chunk_size=2, progress=interrupt)
+    part = export.export_records(resumed, after_id=states[0]["last_id"], chunk_size=2, resume=True,
+                                 start_time="2025-02-01 00:00:00", end_time="2025-02-01 23:59:59")
+    assert part["path"] == str(tmp_path / "resumed.part1.csv.gz")
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == list(db.EXPORT_COLUMNS) and len(rows) == 5
+    assert all(row[3].startswith("2025-02-01") for row in rows[1:])
+    resumed_rows = []
+    for name in (resumed, part["path"]):
+        with gzip.open(name, "rt", encoding="utf-8") as f:
+            resumed_rows += list(csv.reader(f))
+    assert resumed_rows == rows
+    
+    # 指定起始ID的新导出照常写表头；续传到不存在的文件报错
+    plain = str(tmp_path / "after.csv")
+    export.export_records(plain, after_id=states[0]["last_id"],
+                          start_time="2025-02-01 00:00:00", end_time="2025-02-01 23:59:59")
+    with open(plain, encoding="utf-8") as f:
+        assert list(csv.reader(f)) == [rows[0]] + rows[3:]
+    with pytest.raises(FileNotFoundError):
+        export.export_records(str(tmp_path / "missing.csv"), after_id=1, resume=True)
+    
+    jsonl = tmp_path / "visitor.jsonl"
+    assert export.export_records(str(jsonl), plate="沪j 00003")["exported"] == 1
+    assert json.loads(jsonl.read_text(encoding="utf-8"))["plate"] == "沪J00003"
+    
+    revenue = tmp_path / "revenue.csv"
+    assert export.export_revenue(str(revenue), "2025-02-01 00:00:00", "2025-02-02 23:59:59") == \
+        {"days": 2, "revenue": 35.0}
+
+
+def test_online_backup_and_restore(sandbox_db, tmp_path, monkeypatch, caplog):
+    """测试在线备份：分步复制、完整性校验、轮转保留和从快照恢复"""
+    from config import cfg
+    from src.database import backup
+    
+    monkeypatch.setattr(cfg, "BACKUP_DIR", str(tmp_path))
+    steps = []
+    path = backup.backup_database(pages=1, sleep=0, progress=steps.append)
+    assert path and backup.verify_backup(path)
+    assert len(steps) > 1 and steps[-1]["remaining"] == 0
+    assert backup.list_backups() == [path]
+    
+    # 备份之后的修改在恢复后消失
+    db.enter_vehicle("沪K00001", None, "2025-03-01 08:00:00", "visitor")
+    db.init_db(restore_from=path)
+    assert db.get_active_parking_record("沪K00001") is None
+    assert db.get_resident_by_plate("京A12345")["balance"] == 100.0
+    assert db.is_possible_resident_plate("京A12345")
+    
+    for day in range(1, 5):
+        backup.backup_database(str(tmp_path / f"parking-2025010{day}-020000.db"))
+    removed = backup.rotate_backups(keep=2)
+    assert len(removed) == 3 and backup.list_backups()[0].endswith("parking-20250104-020000.db")
+    
+    broken = tmp_path / "broken.db"
+    broken.write_bytes(b"not a database" * 100)
+    assert not backup.verify_backup(str(broken))
+    with pytest.raises(ValueError):
+        db.init_db(restore_from=str(broken))
+    
+    # 定时备份失败时写入日志
+    import threading
+    monkeypatch.setattr(backup, "run_backup", lambda keep: None)
+    stop = threading.Event()
+    with caplog.at_level("ERROR", logger="parking.backup"):
+        thread = backup.start_backup_scheduler(0.01, stop=stop)
+        while not caplog.records:
+            stop.wait(0.01)
+        stop.set()
+        thread.join(5)
+    assert "完整性校验未通过" in caplog.records[0].getMessage()
+
+
+def test_schema_migrations_and_legacy_merge(sandbox_db, tmp_path, monkeypatch):
+    """测试结构版本迁移（分批、可续传）和旧数据库合并"""
+    import sqlite3
+    from src.database import legacy, migrations
+    
+    monkeypatch.setattr(db, "LOT_CAPACITY_BY_TYPE", {"visitor": 50})
+    init_db()
+    assert migrations.get_version(db._connect()) == len(db.SCHEMA_MIGRATIONS)
+    
+    # 回填中断后再次执行，从已提交的批次继续，版本号只在完成后更新
+    conn = sqlite3.connect(str(tmp_path / "m.db"))
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, v INTEGER)")
+    conn.executemany("INSERT INTO t (id) VALUES (?)", [(i,) for i in range(1, 26)])
+    conn.commit()
+    batches = []
+    
+    def step(cursor, last_id, batch_size):
+        cursor.execute("UPDATE t SET v = id * 2 WHERE id > ? AND id <= ?", (last_id, last_id + batch_size))
+        if len(batches) == 2:
+            batches.append(None)
+            raise KeyboardInterrupt
+        batches.append(last_id)
+        return last_id + batch_size if cursor.rowcount else None
+    
+    plan = [migrations.Migration(1, "回填", step=step)]
+    with pytest.raises(KeyboardInterrupt):
+        migrations.migrate(conn, plan, batch_size=10)
+    # 出错的批次已回滚，写锁已释放
+    assert not conn.in_transaction
+    assert conn.execute("SELECT COUNT(*) FROM t WHERE v IS NULL").fetchone()[0] == 5
+    assert migrations.get_version(conn) == 0
+    assert migrations.get_history(conn)[0]["last_id"] == 20
+    assert migrations.migrate(conn, plan, batch_size=10) == 1
+    assert batches[3] == 20
+    assert conn.execute("SELECT COUNT(*) FROM t WHERE v IS NULL").fetchone()[0] == 0
+    assert migrations.migrate(conn, plan + [migrations.Migration(2, "加列", prepare=lambda c: c.execute(
+        "ALTER TABLE t ADD COLUMN w TEXT"))], target=1) == 1
+    conn.close()
+    
+    # 早期版本的数据库
+    path = str(tmp_path / "parking_system.db")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE resident_users (id INTEGER PRIMARY KEY, name TEXT, phone_number TEXT,
+            address TEXT, balance REAL, status TEXT, created_at TIMESTAMP);
+        CREATE TABLE resident_vehicles (id INTEGER PRIMARY KEY, resident_id INTEGER, license_plate TEXT);
+        CREATE TABLE visitor_records (id INTEGER PRIMARY KEY, phone_number TEXT, license_plate TEXT,
+            parking_lot_id INTEGER, entry_time TIMESTAMP, exit_time TIMESTAMP, total_cost REAL,
+            payment_status TEXT, payment_method TEXT);
+        CREATE TABLE parking_records (id INTEGER PRIMARY KEY, license_plate TEXT, user_type TEXT,
+            resident_id INTEGER, visitor_record_id INTEGER, entry_time TIMESTAMP, exit_time TIMESTAMP,
+            total_cost REAL, payment_status TEXT);
+        INSERT INTO resident_users VALUES (1, '张三', '13800138000', '1号楼', 50, 'active', NULL);
+        INSERT INTO resident_users VALUES (2, '李四', '13900139000', '2号楼', 20, 'active', NULL);
+        INSERT INTO resident_vehicles VALUES (1, 1, '京A12345'), (2, 2, '京b 54321');
+        INSERT INTO visitor_records VALUES (1, '13700137000', '沪L00001', 1,
+            '2024-05-01 08:00:00', '2024-05-01 10:00:00', 10, 'paid', 'cash');
+        INSERT INTO visitor_records VALUES (2, '13700137001', '沪L00002', 1,
+            '2024-05-02 08:00:00', NULL, 0, 'unpaid', NULL);
+        INSERT INTO parking_records VALUES (1, '京b 54321', 'resident', 2, NULL,
+            '2024-05-01 09:00:00', '2024-05-01 12:00:00', 0, 'paid');
+        INSERT INTO parking_records VALUES (2, '沪L00001', 'visitor', NULL, 1,
+            '2024-05-01 08:00:00', '2024-05-01 10:00:00', 10, 'paid');
+    """)
+    conn.commit()
+    conn.close()
+    
+    result = legacy.merge_legacy_database(path, batch_size=1)
+    assert result == {"residents": 1, "parking_records": 2, "visitor_records": 1}
+    # 已存在的居民不被旧库覆盖
+    assert db.get_resident_by_phone("13800138000")["balance"] == 100.0
+    assert db.get_resident_by_plate("京B54321")["phone"] == "13900139000"
+    assert db.get_active_parking_record("沪L00002") is not None
+    assert db.get_free_spaces()["visitor"] == 49
+    # 重复合并不会重复导入
+    assert legacy.merge_legacy_database(path) == {"residents": 0, "parking_records": 0, "visitor_records": 0}